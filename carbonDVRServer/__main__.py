@@ -1,20 +1,31 @@
 #!/usr/bin/env python3.4
 
 import sys, os, os.path
+import json
 import logging
-import psycopg2
 import pytz
 import time
 
 import fetchXTVD
+import dbPool
 import fileLocations
+import mediaServer
+import metrics
+import migrator
+import notifications
 import parseXTVD
 import recorder
+import retention
 import transcoder
 import bifGen
 import cleanup
 import webServer
 
+try:
+    import waitress
+except ImportError:
+    waitress = None
+
 class ConfigHolder:
     pass
 
@@ -33,6 +44,15 @@ def getMandatoryEnvVar(varName):
     return value
 
 
+def getOptionalEnvVar(varName, defaultValue):
+    logger = logging.getLogger(__name__)
+    value = os.environ.get(varName)
+    if value is None:
+        value = defaultValue
+    logger.info('%s=%s', varName, value)
+    return value
+
+
 if __name__ == '__main__':
     FORMAT = "%(asctime)-15s: %(name)s:  %(message)s"
     logging.basicConfig(level=logging.INFO, format=FORMAT, datefmt='%Y-%m-%d %H:%M:%S')
@@ -42,8 +62,28 @@ if __name__ == '__main__':
     carbonDVRConfig.dbConnectString = getMandatoryEnvVar('CARBONDVR_DB_CONNECT_STRING')
     carbonDVRConfig.schema = getMandatoryEnvVar('CARBONDVR_DB_SCHEMA')
     carbonDVRConfig.webserverPort = getMandatoryEnvVar('CARBONDVR_WEBSERVER_PORT')
+    carbonDVRConfig.role = getOptionalEnvVar('CARBONDVR_ROLE', 'all')
+    if carbonDVRConfig.role not in ('all', 'web', 'worker'):
+        logger.error('CARBONDVR_ROLE must be one of: all, web, worker')
+        sys.exit(1)
+    carbonDVRConfig.wsgiServer = getOptionalEnvVar('CARBONDVR_WSGI_SERVER', 'flask')
+    if carbonDVRConfig.wsgiServer not in ('flask', 'waitress'):
+        logger.error('CARBONDVR_WSGI_SERVER must be one of: flask, waitress')
+        sys.exit(1)
+    if carbonDVRConfig.wsgiServer == 'waitress' and waitress is None:
+        logger.error('CARBONDVR_WSGI_SERVER is waitress, but waitress is not installed')
+        sys.exit(1)
+    carbonDVRConfig.webserverThreads = int(getOptionalEnvVar('CARBONDVR_WEBSERVER_THREADS', 8))
+    carbonDVRConfig.dbPoolSize = int(getOptionalEnvVar('CARBONDVR_DB_POOL_SIZE', 8))
+    carbonDVRConfig.slowQueryThreshold = float(getOptionalEnvVar('CARBONDVR_SLOW_QUERY_SECONDS', 0.5))     # slower queries are logged, with their plans
+    carbonDVRConfig.mediaServerPort = getOptionalEnvVar('CARBONDVR_MEDIA_SERVER_PORT', None)       # if unset, video and BIF files are served elsewhere
+    carbonDVRConfig.metricsPort = getOptionalEnvVar('CARBONDVR_METRICS_PORT', None)       # if unset, metrics are only served by the web server, on /metrics
     carbonDVRConfig.listingsFetchTime = time.strptime(getMandatoryEnvVar('CARBONDVR_LISTINGS_FETCH_TIME'), '%H:%M:%S')
-    carbonDVRConfig.fileLocations = fileLocations.FileLocations(getMandatoryEnvVar('CARBONDVR_FILE_LOCATIONS'))
+    try:
+        carbonDVRConfig.fileLocations = fileLocations.FileLocations(getMandatoryEnvVar('CARBONDVR_FILE_LOCATIONS'))
+    except fileLocations.FileLocationsError as e:
+        logger.error('CARBONDVR_FILE_LOCATIONS is invalid: %s', e)
+        sys.exit(1)
     logger.info('Listing fetch time: %02d:%02d:00', carbonDVRConfig.listingsFetchTime.tm_hour, carbonDVRConfig.listingsFetchTime.tm_min)
 
     fetchXTVDConfig = ConfigHolder()
@@ -60,7 +100,27 @@ if __name__ == '__main__':
     transcoderConfig.lowCommand = getMandatoryEnvVar('TRANSCODER_COMMAND_LOW')
     transcoderConfig.mediumCommand = getMandatoryEnvVar('TRANSCODER_COMMAND_MEDIUM')
     transcoderConfig.highCommand = getMandatoryEnvVar('TRANSCODER_COMMAND_HIGH')
+    transcoderConfig.hlsCommand = getOptionalEnvVar('TRANSCODER_COMMAND_HLS', None)      # if unset, no HLS ladder is made
     transcoderConfig.outputFilespec = getMandatoryEnvVar('TRANSCODER_VIDEO_FILESPEC')
+    # {destFile} is only needed if the transcoder can choose somewhere other than TRANSCODER_VIDEO_FILESPEC
+    if transcoder.hasOtherDestinations(carbonDVRConfig.fileLocations, transcoderConfig.outputFilespec):
+        requiredFields, recommendedFields = ('destFile', ), ('sourceFile', )
+    else:
+        requiredFields, recommendedFields = (), ('sourceFile', 'destFile')
+    transcoderCommands = [('TRANSCODER_COMMAND_LOW', transcoderConfig.lowCommand, requiredFields, recommendedFields),
+                          ('TRANSCODER_COMMAND_MEDIUM', transcoderConfig.mediumCommand, requiredFields, recommendedFields),
+                          ('TRANSCODER_COMMAND_HIGH', transcoderConfig.highCommand, requiredFields, recommendedFields)]
+    if transcoderConfig.hlsCommand is not None:
+        transcoderCommands.append(('TRANSCODER_COMMAND_HLS', transcoderConfig.hlsCommand, ('sourceFile', 'destDir'), ()))
+    for varName, command, required, recommended in transcoderCommands:
+        try:
+            missingFields = transcoder.checkCommand(command, required, recommended)
+        except transcoder.TranscoderCommandError as e:
+            logger.error('%s is invalid: %s', varName, e)
+            sys.exit(1)
+        if missingFields:
+            logger.warning('%s does not contain %s; it must read and write the files that the recorder and TRANSCODER_VIDEO_FILESPEC name',
+                           varName, ', '.join('{{{}}}'.format(fieldName) for fieldName in missingFields))
     transcoderConfig.logFilespec = getMandatoryEnvVar('TRANSCODER_LOG_FILESPEC')
 
     bifGenConfig = ConfigHolder()
@@ -69,58 +129,150 @@ if __name__ == '__main__':
     bifGenConfig.bifFilespec = getMandatoryEnvVar('BIFGEN_BIF_FILESPEC')
     bifGenConfig.frameInterval = int(getMandatoryEnvVar('BIFGEN_FRAME_INTERVAL'))
 
+    retentionConfig = ConfigHolder()
+    retentionConfig.minimumFreeBytes = int(getOptionalEnvVar('RETENTION_MINIMUM_FREE_BYTES', 2000000000))
+    retentionConfig.recordingBitrate = int(getOptionalEnvVar('RETENTION_RECORDING_BITRATE', 20000000))
+    retentionConfig.extendedEviction = getOptionalEnvVar('RETENTION_EXTENDED_EVICTION', '0') == '1'      # also evict watched new episodes, and unwatched reruns
+    retentionConfig.defaultKeepCount = getOptionalEnvVar('RETENTION_DEFAULT_KEEP_COUNT', None)      # for shows without a keep count of their own
+    if retentionConfig.defaultKeepCount is not None:
+        retentionConfig.defaultKeepCount = int(retentionConfig.defaultKeepCount)
+
+    migratorConfig = ConfigHolder()
+    migratorConfig.archiveTier = getOptionalEnvVar('MIGRATOR_ARCHIVE_TIER', 'bulk')
+    migratorConfig.bytesPerSecond = int(getOptionalEnvVar('MIGRATOR_BYTES_PER_SECOND', 50000000))
+
     uiConfig = ConfigHolder()
     uiConfig.uiServerURL = getMandatoryEnvVar('UISERVER_UISERVER_URL')
 
     restConfig = ConfigHolder()
     restConfig.restServerURL = getMandatoryEnvVar('RESTSERVER_RESTSERVER_URL')
 
-    dbConnection = psycopg2.connect(carbonDVRConfig.dbConnectString)
-    if carbonDVRConfig.schema is not None:
-        with dbConnection:
-            with dbConnection.cursor() as cursor:
-                cursor.execute("SET SCHEMA %s", (carbonDVRConfig.schema, ))
-    with dbConnection:
-        with dbConnection.cursor() as cursor:
-            cursor.execute("SET TIMEZONE TO UTC;")
+    dbPool = dbPool.DBPool(carbonDVRConfig.dbConnectString, carbonDVRConfig.schema, maxConnections=carbonDVRConfig.dbPoolSize,
+        slowQueryThreshold=carbonDVRConfig.slowQueryThreshold)
 
-    scheduler = BackgroundScheduler(timezone=pytz.utc)
-    logging.getLogger('apscheduler').setLevel(logging.WARNING)            # turn down the logging from apscheduler
-    logging.getLogger('apscheduler.scheduler').setLevel(logging.ERROR)    # turn down the logging from apscheduler
+    metrics.REGISTRY.addCollectHandler(dbPool.collectMetrics)
+    metrics.REGISTRY.addCollectHandler(carbonDVRConfig.fileLocations.collectMetrics)
+    if carbonDVRConfig.metricsPort is not None:
+        metrics.MetricsServer(port=int(carbonDVRConfig.metricsPort)).start()
 
-    recorderDBInterface = recorder.CarbonDVRDatabase(dbConnection)
-    channels = recorderDBInterface.getChannels()
-    tuners = recorderDBInterface.getTuners()
-    hdhomerun = recorder.HDHomeRunInterface(channels, tuners, recorderConfig.hdhomerunBinary)
-    recorder = recorder.Recorder(scheduler, hdhomerun, recorderDBInterface, recorderConfig.videoFilespec, recorderConfig.logFilespec)
+    feedCache = webServer.FeedCache()
+    statusFeed = webServer.StatusFeed(maxStreams=max(1, carbonDVRConfig.webserverThreads // 2))      # leave threads for the Roku client
+    notifier = notifications.Notifier(dbPool)
 
-    transcoder = transcoder.Transcoder(dbConnection, transcoderConfig.lowCommand, transcoderConfig.mediumCommand, transcoderConfig.highCommand,
-        transcoderConfig.outputFilespec, transcoderConfig.logFilespec)
-    scheduler.add_job(transcoder.transcodeRecordings, trigger=IntervalTrigger(seconds=60))
+    def recordingsChangedCallback():
+        if carbonDVRConfig.role == 'worker':
+            notifier.notify(notifications.RECORDINGS_CHANGED)
+        else:
+            feedCache.invalidate()
 
-    bifGen = bifGen.BifGen(dbConnection, bifGenConfig.imageCommand, bifGenConfig.imageDir, bifGenConfig.bifFilespec, bifGenConfig.frameInterval)
-    scheduler.add_job(bifGen.bifRecordings, trigger=IntervalTrigger(seconds=60))
+    def statusCallback(eventType, **fields):
+        if carbonDVRConfig.role == 'worker':
+            notifier.notify(notifications.STATUS_CHANGED, json.dumps(dict(fields, type=eventType)))
+        else:
+            statusFeed.publish(eventType, **fields)
 
-    cleanup = cleanup.Cleanup(dbConnection)
-    scheduler.add_job(cleanup.cleanup, trigger=IntervalTrigger(minutes=60))
+    def publishStatusNotification(payload):
+        fields = json.loads(payload)
+        statusFeed.publish(fields.pop('type'), **fields)
 
-    def fetchListings():
-        fetchXTVD.fetchXTVDtoFile(fetchXTVDConfig.schedulesDirectUsername, fetchXTVDConfig.schedulesDirectPassword, fetchXTVDConfig.listingsFile)
-        dbInterface = parseXTVD.carbonDVRDatabase(dbConnection, carbonDVRConfig.schema)
-        parseXTVD.parseXTVD(fetchXTVDConfig.listingsFile, dbInterface)
-    fetchTrigger = CronTrigger(hour = carbonDVRConfig.listingsFetchTime.tm_hour, minute = carbonDVRConfig.listingsFetchTime.tm_min)
-    scheduler.add_job(fetchListings, trigger=fetchTrigger, misfire_grace_time=3600)
+    if carbonDVRConfig.role in ('all', 'worker'):
+        scheduler = BackgroundScheduler(timezone=pytz.utc)
+        logging.getLogger('apscheduler').setLevel(logging.WARNING)            # turn down the logging from apscheduler
+        logging.getLogger('apscheduler.scheduler').setLevel(logging.ERROR)    # turn down the logging from apscheduler
 
+        reconcilerFilespecs = carbonDVRConfig.fileLocations.getFilespecs() | set([recorderConfig.videoFilespec, transcoderConfig.outputFilespec, bifGenConfig.bifFilespec])
+        reconciler = cleanup.Reconciler(dbPool, reconcilerFilespecs)
+        scheduler.add_job(reconciler.reconcile, trigger=IntervalTrigger(minutes=60))
 
-    scheduler.start();
+        cleanup = cleanup.Cleanup(dbPool)
+        scheduler.add_job(cleanup.cleanup, trigger=IntervalTrigger(minutes=60))
+        scheduler.add_job(cleanup.cleanup)       # and once now, for recordings deleted while the worker wasn't listening (see notifications.py)
 
+        retention = retention.Retention(dbPool, carbonDVRConfig.fileLocations, cleanup, os.path.dirname(recorderConfig.videoFilespec),
+            retentionConfig.minimumFreeBytes, retentionConfig.recordingBitrate, recordingsChangedCallback, retentionConfig.extendedEviction,
+            retentionConfig.defaultKeepCount)
+        scheduler.add_job(retention.checkFreeSpace, trigger=IntervalTrigger(minutes=15))
 
-    def scheduleRecordingsCallback():
-        recorder.scheduleRecordings()
+        recorderDBInterface = recorder.CarbonDVRDatabase(dbPool)
+        channels = recorderDBInterface.getChannels()
+        tuners = recorderDBInterface.getTuners()
+        hdhomerun = recorder.HDHomeRunInterface(channels, tuners, recorderConfig.hdhomerunBinary)
+        recorder = recorder.Recorder(scheduler, hdhomerun, recorderDBInterface, recorderConfig.videoFilespec, recorderConfig.logFilespec,
+            retention.makeRoomForRecording, carbonDVRConfig.fileLocations, statusCallback=statusCallback)
 
-    logging.getLogger('werkzeug').setLevel(logging.WARNING)            # turn down the logging from werkzeug
-    webServer.webServerApp.restServer = webServer.RestServer(dbConnection, carbonDVRConfig.fileLocations, restConfig.restServerURL)
-    webServer.webServerApp.uiServer = webServer.UIServer(dbConnection, uiConfig.uiServerURL, scheduleRecordingsCallback)
-#    webServer.webServerApp.run(host='0.0.0.0',port=int(carbonDVRConfig.webserverPort), debug=True)
-    webServer.webServerApp.run(host='0.0.0.0',port=int(carbonDVRConfig.webserverPort))
+        transcoder = transcoder.Transcoder(dbPool, transcoderConfig.lowCommand, transcoderConfig.mediumCommand, transcoderConfig.highCommand,
+            transcoderConfig.outputFilespec, transcoderConfig.logFilespec, carbonDVRConfig.fileLocations, recordingsChangedCallback,
+            transcoderConfig.hlsCommand, statusCallback)
+        transcoder.abandonUnfinishedJobs()         # left by a transcoder that crashed, or was killed
+        scheduler.add_job(transcoder.transcodeRecordings, trigger=IntervalTrigger(seconds=60))
 
+        bifGen = bifGen.BifGen(dbPool, bifGenConfig.imageCommand, bifGenConfig.imageDir, bifGenConfig.bifFilespec, bifGenConfig.frameInterval,
+            carbonDVRConfig.fileLocations, recordingsChangedCallback, statusCallback)
+        scheduler.add_job(bifGen.bifRecordings, trigger=IntervalTrigger(seconds=60))
+
+        migrator = migrator.Migrator(dbPool, carbonDVRConfig.fileLocations, migratorConfig.archiveTier, migratorConfig.bytesPerSecond)
+        scheduler.add_job(migrator.migrateRecordings, trigger=IntervalTrigger(minutes=10))
+
+        def fetchListings():
+            phaseTimer = parseXTVD.PhaseTimer()
+            fetchXTVD.fetchXTVDtoFile(fetchXTVDConfig.schedulesDirectUsername, fetchXTVDConfig.schedulesDirectPassword, fetchXTVDConfig.listingsFile)
+            phaseTimer.endPhase('fetch')
+            # the import is one long transaction on a connection of its own, so it doesn't hold up the web server
+            with dbPool.connection('listings_import') as dbConnection:
+                dbInterface = parseXTVD.carbonDVRDatabase(dbConnection, carbonDVRConfig.schema)
+                parseXTVD.parseXTVD(fetchXTVDConfig.listingsFile, dbInterface)
+            recordingsChangedCallback()     # show names and episode descriptions may have changed
+        fetchTrigger = CronTrigger(hour = carbonDVRConfig.listingsFetchTime.tm_hour, minute = carbonDVRConfig.listingsFetchTime.tm_min)
+        scheduler.add_job(fetchListings, trigger=fetchTrigger, misfire_grace_time=3600)
+
+
+        scheduler.start();
+
+
+        def scheduleRecordingsCallback(showID=None):
+            recorder.requestReschedule(showID)
+
+        def recordingDeletedCallback(recordingID):
+            # purge the recording's files in the background, rather than waiting for the next hourly cleanup
+            scheduler.add_job(cleanup.purgeDeletedRecording, args=[recordingID])
+
+    if carbonDVRConfig.role == 'worker':
+        # the web server is in another process, and sends its callbacks as notifications
+        listener = notifications.Listener(carbonDVRConfig.dbConnectString)
+        listener.addHandler(notifications.SCHEDULE_RECORDINGS, lambda payload: scheduleRecordingsCallback(payload or None))
+        listener.addHandler(notifications.RECORDING_DELETED, lambda payload: recordingDeletedCallback(int(payload)))
+        listener.run()
+
+    if carbonDVRConfig.role == 'web':
+        # the recorder is in another process, so pass the callbacks along as notifications
+        def scheduleRecordingsCallback(showID=None):
+            notifier.notify(notifications.SCHEDULE_RECORDINGS, showID or '')
+
+        def recordingDeletedCallback(recordingID):
+            notifier.notify(notifications.RECORDING_DELETED, recordingID)
+
+        listener = notifications.Listener(carbonDVRConfig.dbConnectString)
+        listener.addHandler(notifications.RECORDINGS_CHANGED, lambda payload: feedCache.invalidate())
+        listener.addHandler(notifications.STATUS_CHANGED, publishStatusNotification)
+        listener.addConnectHandler(feedCache.invalidate)
+        listener.addConnectHandler(statusFeed.reset)       # status changes may have been missed
+        listener.start()
+
+    if carbonDVRConfig.mediaServerPort is not None:
+        # video and BIF files, on a port of their own, so that streaming doesn't hold up the web server's threads
+        mediaServer = mediaServer.MediaServer(carbonDVRConfig.fileLocations, port=int(carbonDVRConfig.mediaServerPort))
+        mediaServer.start()
+
+    playbackPositions = webServer.PlaybackPositions(dbPool)
+    playbackPositions.start()
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)            # turn down the logging from werkzeug
+    webServer.webServerApp.restServer = webServer.RestServer(dbPool, carbonDVRConfig.fileLocations, restConfig.restServerURL, recordingDeletedCallback, feedCache, playbackPositions)
+    webServer.webServerApp.uiServer = webServer.UIServer(dbPool, uiConfig.uiServerURL, scheduleRecordingsCallback, statusFeed)
+    if carbonDVRConfig.wsgiServer == 'waitress':
+        # multi-threaded, with HTTP/1.1 keep-alive; each request thread borrows its own connection from dbPool
+        logging.getLogger('waitress').setLevel(logging.WARNING)        # turn down the logging from waitress
+        waitress.serve(webServer.webServerApp, host='0.0.0.0', port=int(carbonDVRConfig.webserverPort), threads=carbonDVRConfig.webserverThreads)
+    else:
+#        webServer.webServerApp.run(host='0.0.0.0',port=int(carbonDVRConfig.webserverPort), debug=True)
+        webServer.webServerApp.run(host='0.0.0.0',port=int(carbonDVRConfig.webserverPort), threaded=True)
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3.4
+
+import argparse
+import logging
+
+from benchmark import listings, pipeline, rokuXml
+
+BENCHMARKS = {'listings': listings, 'pipeline': pipeline, 'rokuXml': rokuXml}
+
+if __name__ == '__main__':
+    FORMAT = "%(asctime)-15s: %(name)s:  %(message)s"
+    logging.basicConfig(level=logging.INFO, format=FORMAT)
+
+    parser = argparse.ArgumentParser(description='Run a carbonDVR benchmark.')
+    subparsers = parser.add_subparsers(dest='benchmark')
+    for name, module in sorted(BENCHMARKS.items()):
+        module.addArguments(subparsers.add_parser(name))
+    args = parser.parse_args()
+    if args.benchmark is None:
+        parser.error('choose a benchmark: {}'.format(', '.join(sorted(BENCHMARKS))))
+
+    BENCHMARKS[args.benchmark].run(args)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3.4
+
+import argparse
+import os
+import sys
+import time
+
+
+#
+# Notes on the fake ffmpeg
+#
+# Takes the same time as ffmpeg would, at a given speed (seconds of video per second), without doing any work:
+#
+#     fakeFfmpeg.py [options] -i <source> <destination>             "transcodes" the source
+#     fakeFfmpeg.py [options] -i <source> -r <fps> <dir>/%08d.jpg   writes thumbnails, for BIF files
+#
+# There's no video in the fake recordings, so the source's duration is worked out from its size and '--bitrate'.  A
+# transcode writes a file of the same duration at '--output-bitrate', reporting its progress as "-progress pipe:1"
+# does (see transcoder.py); thumbnails are small files that look (to makeBIF) like JPEGs.
+#
+
+PROGRESS_INTERVAL = 0.5
+FAKE_JPEG = b'\xff\xd8\xff\xe0' + b'\x00' * 2000 + b'\xff\xd9'
+
+
+def formatTime(seconds):
+    return '{:02d}:{:02d}:{:09.6f}'.format(int(seconds // 3600), int(seconds % 3600 // 60), seconds % 60)
+
+
+# sleeps for as long as 'duration' seconds of video would take at 'speed', calling 'progress' with the number of
+# seconds done every PROGRESS_INTERVAL
+def simulate(duration, speed, progress):
+    startTime = time.monotonic()
+    while True:
+        done = min(duration, (time.monotonic() - startTime) * speed)
+        progress(done)
+        if done >= duration:
+            return
+        time.sleep(min(PROGRESS_INTERVAL, (duration - done) / speed))
+
+
+def transcode(destination, duration, speed, outputBitrate):
+    def progress(done):
+        sys.stdout.write('out_time={}\nfps={:.1f}\nspeed={:.2f}x\nprogress={}\n'.format(formatTime(done), 30 * speed, speed,
+                                                                                      'end' if done >= duration else 'continue'))
+        sys.stdout.flush()
+    simulate(duration, speed, progress)
+    with open(destination, 'wb') as file:
+        file.truncate(int(duration * outputBitrate * 1000000 / 8))
+
+
+def thumbnails(destination, duration, speed, framesPerSecond):
+    simulate(duration, speed, lambda done: None)
+    for frame in range(1, int(duration * framesPerSecond) + 2):
+        with open(destination % frame, 'wb') as file:
+            file.write(FAKE_JPEG)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='A stand-in for ffmpeg, for benchmarks.')
+    parser.add_argument('--bitrate', type=float, default=20, help='bitrate of the source files, in Mb/s')
+    parser.add_argument('--output-bitrate', type=float, default=2, help='bitrate of transcoded files, in Mb/s')
+    parser.add_argument('--speed', type=float, default=20, help='seconds of video processed per second')
+    parser.add_argument('-i', dest='source', required=True)
+    parser.add_argument('-r', dest='framesPerSecond', type=float, help='write thumbnails, at this rate')
+    parser.add_argument('destination')
+    args, ignored = parser.parse_known_args(argv)
+    duration = os.path.getsize(args.source) * 8 / (args.bitrate * 1000000)
+    if args.framesPerSecond is not None:
+        thumbnails(args.destination, duration, args.speed, args.framesPerSecond)
+    else:
+        transcode(args.destination, duration, args.speed, args.output_bitrate)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
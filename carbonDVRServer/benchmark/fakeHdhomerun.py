@@ -0,0 +1,61 @@
+#!/usr/bin/env python3.4
+
+import argparse
+import signal
+import sys
+import time
+
+
+#
+# Notes on the fake hdhomerun_config
+#
+# Understands the commands that recorder/hdhomerun.py sends:
+#
+#     fakeHdhomerun.py [--bitrate MBPS] <device> set /tuner<n>/channel <channel>
+#     fakeHdhomerun.py [--bitrate MBPS] <device> set /tuner<n>/program <program>
+#     fakeHdhomerun.py [--bitrate MBPS] <device> get /tuner<n>/status
+#     fakeHdhomerun.py [--bitrate MBPS] <device> save /tuner<n> <file>
+#
+# 'save' writes MPEG transport stream null packets to the file, at 'bitrate' megabits per second, until it's sent
+# SIGTERM (as the recorder does when the recording's time is up).  The file has the size of a real recording, but no
+# video.
+#
+
+TS_PACKET = b'\x47\x1f\xff\x10' + b'\xff' * 184       # a null packet
+WRITE_INTERVAL = 0.1
+
+
+def save(filename, bitrate):
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signalNumber, frame: stopping.append(signalNumber))
+    packetsPerWrite = max(1, int(bitrate * 1000000 / 8 * WRITE_INTERVAL / len(TS_PACKET)))
+    chunk = TS_PACKET * packetsPerWrite
+    startTime = time.monotonic()
+    writes = 0
+    with open(filename, 'wb') as file:
+        while not stopping:
+            file.write(chunk)
+            writes += 1
+            # keep to the bitrate, however long the writes take
+            delay = startTime + writes * WRITE_INTERVAL - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='A stand-in for hdhomerun_config, for benchmarks.')
+    parser.add_argument('--bitrate', type=float, default=20, help='bitrate of saved streams, in Mb/s')
+    parser.add_argument('device')
+    parser.add_argument('command', choices=['get', 'set', 'save'])
+    parser.add_argument('item')
+    parser.add_argument('value', nargs='?')
+    args = parser.parse_args(argv)
+    if args.command == 'get':
+        print('ch=8vsb:{} lock=8vsb ss=100 snq=100 seq=100 bps={} pps=0'.format(args.item, int(args.bitrate * 1000000)))
+    elif args.command == 'save':
+        save(args.value, args.bitrate)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3.4
+
+import http.server
+import io
+import os
+import os.path
+import psycopg2
+import resource
+import shutil
+import socketserver
+import sqlite3
+import tempfile
+import threading
+import time
+from xml.etree import ElementTree
+
+import fetchXTVD
+import parseXTVD
+from benchmark import pipeline, xtvdGenerator
+from parseXTVD.parseXTVD import IMPORT_PHASE_SECONDS, IMPORT_ROWS, extractStations
+
+
+class Bunch:
+    def __init__(self, **kwds):
+        self.__dict__.update(kwds)
+
+
+#
+# Notes on the listings benchmark
+#
+# Imports a synthetic lineup (see xtvdGenerator.py), or an XTVD file that's given, with parseXTVD, as the server does,
+# into sqlite (the sqliteDatabase backend, in a file of its own) or PostgreSQL (a throwaway schema, as in the pipeline
+# benchmark, with its triggers).  The channel table is filled with the lineup's channels, so that every airing is
+# imported.
+#
+# The times come from parseXTVD's phases (as in /metrics): parsing is the XML parse, extraction is finding the
+# stations, schedules and programs in it, and loading is the rest (inserting shows, episodes and schedules).  Rows per
+# second are the rows inserted, over the load time.  Peak RSS is the process's; the XTVD file is written as it's
+# generated, so it's the import's.
+#
+# With --fetch, the file is first downloaded with fetchXTVD, from a local server, to time the download and writing of
+# the file without Schedules Direct.
+#
+
+IMPORT_PHASES = ('parse', 'extract', 'shows', 'episodes', 'clearSchedule', 'schedules')
+LOAD_PHASES = ('shows', 'episodes', 'clearSchedule', 'schedules')
+SQLITE_SCHEMA = str('CREATE TABLE show (show_id text PRIMARY KEY, show_type text, name text, imageurl text);'
+                    'CREATE TABLE episode (show_id text, episode_id text, title text, description text, part_code text, imageurl text, '
+                    'PRIMARY KEY (show_id, episode_id));'
+                    'CREATE TABLE channel (major integer, minor integer, actual integer, program integer, PRIMARY KEY (major, minor));'
+                    'CREATE TABLE schedule (schedule_id INTEGER PRIMARY KEY, channel_major integer, channel_minor integer, start_time text, '
+                    'duration text, show_id text, episode_id text, rerun_code text);')
+
+
+# serves 'filename' in response to the SOAP request that fetchXTVD sends
+class XTVDRequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_PUT(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Length', str(os.path.getsize(self.server.filename)))
+        self.end_headers()
+        with open(self.server.filename, 'rb') as file:
+            shutil.copyfileobj(file, self.wfile, 65536)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class XTVDServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, filename):
+        self.filename = filename
+        super().__init__(('127.0.0.1', 0), XTVDRequestHandler)
+
+
+# returns the time taken to fetch 'sourceFile' into 'destFile'
+def fetchListings(sourceFile, destFile):
+    server = XTVDServer(sourceFile)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        startTime = time.monotonic()
+        fetchXTVD.fetchXTVDtoFile('benchmark', 'benchmark', destFile, URL='http://127.0.0.1:{}/'.format(server.server_address[1]))
+        return time.monotonic() - startTime
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def importIntoSqlite(xtvdFile, channels, sqliteFile):
+    dbConnection = sqlite3.connect(sqliteFile)
+    try:
+        dbConnection.executescript(SQLITE_SCHEMA)
+        dbConnection.executemany('INSERT INTO channel(major, minor, actual, program) VALUES (?, ?, ?, ?)',
+                                 [(major, minor, major, minor) for major, minor in channels])
+        dbConnection.commit()
+        parseXTVD.parseXTVD(xtvdFile, parseXTVD.sqliteDatabase(dbConnection))
+    finally:
+        dbConnection.close()
+
+
+def importIntoPostgresql(xtvdFile, channels, dbConnectString, schema):
+    pipeline.createSchema(dbConnectString, schema)
+    try:
+        dbConnection = psycopg2.connect(dbConnectString, options='-c timezone=UTC -c search_path={}'.format(schema))
+        try:
+            with dbConnection.cursor() as cursor:
+                for major, minor in channels:
+                    cursor.execute('INSERT INTO channel(major, minor, actual, program) VALUES (%s, %s, %s, %s)', (major, minor, major, minor))
+            dbConnection.commit()
+            parseXTVD.parseXTVD(xtvdFile, parseXTVD.carbonDVRDatabase(dbConnection, schema))
+        finally:
+            dbConnection.close()
+    finally:
+        pipeline.dropSchema(dbConnectString, schema)
+
+
+# returns the channels in an XTVD file's lineup, as (major, minor)
+def readChannels(xtvdFile):
+    stations = extractStations(ElementTree.parse(xtvdFile))
+    return sorted(set((int(station.channelMajor), int(station.channelMinor)) for station in stations.values()))
+
+
+def runImport(args, xtvdFile, channels, workDir):
+    for phase in IMPORT_PHASES:
+        IMPORT_PHASE_SECONDS.labels(phase=phase).set(0)
+    for table in ('show', 'episode', 'schedule'):
+        IMPORT_ROWS.labels(table=table).set(0)
+    startTime = time.monotonic()
+    if args.db:
+        importIntoPostgresql(xtvdFile, channels, args.db, 'carbon_benchmark_{}'.format(os.getpid()))
+    else:
+        importIntoSqlite(xtvdFile, channels, os.path.join(workDir, 'listings.sqlite'))
+    elapsed = time.monotonic() - startTime
+    phases = dict((phase, IMPORT_PHASE_SECONDS.labels(phase=phase).value) for phase in IMPORT_PHASES)
+    rows = dict((table, int(IMPORT_ROWS.labels(table=table).value)) for table in ('show', 'episode', 'schedule'))
+    loadTime = sum(phases[phase] for phase in LOAD_PHASES)
+    return Bunch(elapsed=elapsed, phases=phases, rows=rows, loadTime=loadTime,
+                 rowsPerSecond=sum(rows.values()) / loadTime if loadTime else 0.0,
+                 peakRSS=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)        # ru_maxrss is in kB (on Linux)
+
+
+def formatReport(result):
+    lines = ['{:<20} {:>10}'.format('Phase', 'Time (s)')]
+    for phase in IMPORT_PHASES:
+        lines.append('{:<20} {:>10.2f}'.format(phase, result.phases[phase]))
+    lines.append('{:<20} {:>10.2f}'.format('load (total)', result.loadTime))
+    lines.append('{:<20} {:>10.2f}'.format('import (total)', result.elapsed))
+    lines.append('')
+    lines.append('Rows inserted: {} shows, {} episodes, {} schedules ({:.0f} rows/s)'.format(
+        result.rows['show'], result.rows['episode'], result.rows['schedule'], result.rowsPerSecond))
+    lines.append('Peak RSS: {:.1f}MB'.format(result.peakRSS / 1000000))
+    return '\n'.join(lines)
+
+
+def run(args):
+    workDir = tempfile.mkdtemp(prefix='carbonDVR-benchmark-')
+    try:
+        if args.file:
+            xtvdFile = args.file
+            channels = readChannels(xtvdFile)
+            print('{}: {:.1f}MB, {} channels'.format(xtvdFile, os.path.getsize(xtvdFile) / 1000000, len(channels)))
+        else:
+            xtvdFile = args.save or os.path.join(workDir, 'listings.xml')
+            startTime = time.monotonic()
+            with io.open(xtvdFile, 'w', encoding='utf-8') as file:
+                lineup = xtvdGenerator.generateXTVD(file, args.stations, args.days, args.programs, args.parts, args.seed)
+            channels = lineup.channels
+            print('Generated {:.1f}MB of listings in {:.1f}s: {} stations, {} days, {} programs, {} airings'.format(
+                os.path.getsize(xtvdFile) / 1000000, time.monotonic() - startTime, lineup.stations, args.days, lineup.programs, lineup.schedules))
+        if args.fetch:
+            fetchedFile = os.path.join(workDir, 'fetched.xml')
+            fetchTime = fetchListings(xtvdFile, fetchedFile)
+            print('Fetched in {:.2f}s ({:.1f}MB/s)'.format(fetchTime, os.path.getsize(fetchedFile) / 1000000 / fetchTime))
+            xtvdFile = fetchedFile
+        print('Importing into {}'.format('PostgreSQL' if args.db else 'sqlite'))
+        print(formatReport(runImport(args, xtvdFile, channels, workDir)))
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+
+def addArguments(parser):
+    xtvdGenerator.addArguments(parser)
+    parser.add_argument('-f', '--file', help='import this XTVD file, rather than generating one')
+    parser.add_argument('--save', help='keep the generated XTVD file, here')
+    parser.add_argument('--fetch', action='store_true', help='fetch the file with fetchXTVD (from a local server) before importing it')
+    parser.add_argument('--db', help='import into PostgreSQL, in a throwaway schema, rather than sqlite')
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3.4
+
+import datetime
+import logging
+import os
+import os.path
+import psycopg2
+import pytz
+import shlex
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from apscheduler.schedulers.background import BackgroundScheduler
+
+import cleanup
+import dbPool
+import recorder
+from bifGen import bifGen
+from loadTest.loadTest import percentile
+from transcoder import transcoder
+
+
+class Bunch:
+    def __init__(self, **kwds):
+        self.__dict__.update(kwds)
+
+
+#
+# Notes on the pipeline benchmark
+#
+# Runs recordings through the recorder, transcoder, BIF generator and cleanup, as the server does, but with fakes for
+# the hardware and the slow parts: a stand-in for hdhomerun_config (fakeHdhomerun.py), which "records" a stream of the
+# right size, and one for ffmpeg (fakeFfmpeg.py), which takes as long as ffmpeg would at a given speed.  The database
+# is real: a throwaway schema, made from postgresql/schema_v2_2.sql, and dropped afterwards.
+#
+# The recordings are episodes of a subscribed show, scheduled a few seconds from now, 'tuners' at a time, so they're
+# found and scheduled by the recorder itself.  The transcoder, BIF generator and cleanup are each run in a loop of
+# their own (rather than every minute, as in the server), so that the time a recording waits is the time it spends
+# queued behind others, not the polling interval.
+#
+# Each stage's time comes from the status events (see webServer/statusFeed.py); a raw video file's deletion is noticed
+# by polling.  The report gives, for each stage, the median and worst times, and:
+#
+#     time to playable   from the end of the recording to the end of its transcode
+#     time to complete   from the end of the recording to the last of: its BIF file, and its raw video's deletion
+#
+# along with the depths of the transcode and BIF queues (as in /metrics), and the most time-consuming queries.
+#
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'postgresql', 'schema_v2_2.sql')
+SCHEMA_NAME = 'carbon_v2'
+SHOW_ID = 'SHBENCHMARK'
+CHANNEL = Bunch(major=5, minor=1, actual=20, program=3)
+STAGES = (('record', 'recordingStarted', 'recordingFinished'),
+          ('transcode wait', 'recordingFinished', 'transcodeStarted'),
+          ('transcode', 'transcodeStarted', 'transcodeFinished'),
+          ('bif', 'transcodeFinished', 'bifFinished'),
+          ('cleanup', 'transcodeFinished', 'rawVideoDeleted'),
+          ('time to playable', 'recordingFinished', 'transcodeFinished'),
+          ('time to complete', 'recordingFinished', 'complete'))
+
+
+# writes an executable script that runs one of the fakes with the given arguments, and returns its path
+def makeWrapper(directory, name, script, arguments):
+    path = os.path.join(directory, name)
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), script)] + [str(argument) for argument in arguments]
+    with open(path, 'w') as file:
+        file.write('#!/bin/sh\nexec {} "$@"\n'.format(' '.join(shlex.quote(word) for word in command)))
+    os.chmod(path, 0o755)
+    return path
+
+
+def createSchema(dbConnectString, schema):
+    with open(SCHEMA_FILE) as file:
+        ddl = file.read().replace(SCHEMA_NAME, schema)
+    connection = psycopg2.connect(dbConnectString)
+    try:
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(ddl)
+    finally:
+        connection.close()
+
+
+def dropSchema(dbConnectString, schema):
+    connection = psycopg2.connect(dbConnectString)
+    try:
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute('DROP SCHEMA IF EXISTS {} CASCADE'.format(schema))
+    finally:
+        connection.close()
+
+
+# a subscribed show with 'numRecordings' episodes, scheduled 'tuners' at a time, starting 'leadTime' seconds from now
+def insertRecordings(pool, numRecordings, tuners, duration, leadTime):
+    with pool.connection('benchmark_setup') as dbConnection:
+        with dbConnection.cursor() as cursor:
+            cursor.execute('INSERT INTO channel(major, minor, actual, program) VALUES (%s, %s, %s, %s)',
+                           (CHANNEL.major, CHANNEL.minor, CHANNEL.actual, CHANNEL.program))
+            for tunerID in range(tuners):
+                cursor.execute('INSERT INTO tuner(device_id, ipaddress, tuner_id) VALUES (%s, %s, %s)', ('FAKE0000', '127.0.0.1', tunerID))
+            cursor.execute("INSERT INTO show(show_id, show_type, name) VALUES (%s, 'SE', 'Benchmark')", (SHOW_ID, ))
+            startTime = datetime.datetime.now(pytz.utc) + datetime.timedelta(seconds=leadTime)
+            for i in range(numRecordings):
+                episodeID = '{:04d}'.format(i + 1)
+                cursor.execute("INSERT INTO episode(show_id, episode_id, title, description) VALUES (%s, %s, %s, '')",
+                               (SHOW_ID, episodeID, 'Episode {}'.format(i + 1)))
+                # back to back, with a second between slots for the tuners to be released
+                slotStart = startTime + datetime.timedelta(seconds=(i // tuners) * (duration + 1))
+                cursor.execute('INSERT INTO schedule(channel_major, channel_minor, start_time, duration, show_id, episode_id, rerun_code) '
+                               "VALUES (%s, %s, %s, %s, %s, %s, 'N')",
+                               (CHANNEL.major, CHANNEL.minor, slotStart, datetime.timedelta(seconds=duration), SHOW_ID, episodeID))
+            cursor.execute('INSERT INTO subscription(show_id, priority) VALUES (%s, 1)', (SHOW_ID, ))
+
+
+# records when each recording reaches each stage, from the status events
+class Timeline:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = {}        # recordingID -> {event name -> time}
+        self.failures = []      # (recordingID, event name)
+
+    def statusCallback(self, eventType, **fields):
+        recordingID = fields.get('recordingID')
+        if recordingID is None or eventType == 'transcodeProgress' or fields.get('stage', 'mp4') != 'mp4':
+            return
+        self.mark(recordingID, eventType)
+        if fields.get('success') is False:
+            with self.lock:
+                self.failures.append((recordingID, eventType))
+
+    def mark(self, recordingID, name):
+        with self.lock:
+            self.events.setdefault(recordingID, {}).setdefault(name, time.monotonic())
+
+    def get(self, recordingID, name):
+        with self.lock:
+            return self.events.get(recordingID, {}).get(name)
+
+    def getRecordingIDs(self):
+        with self.lock:
+            return sorted(self.events)
+
+    def isFailed(self, recordingID):
+        with self.lock:
+            return recordingID in [failedRecordingID for failedRecordingID, name in self.failures]
+
+    # a recording is finished when it's complete, or has failed
+    def isFinished(self, recordingID):
+        return self.isFailed(recordingID) or self.get(recordingID, 'complete') is not None
+
+
+# calls 'function' every 'interval' seconds, until 'stopping' is set
+def runLoop(function, interval, stopping):
+    logger = logging.getLogger(__name__)
+    while not stopping.is_set():
+        try:
+            function()
+        except Exception:
+            logger.exception('Error in {}'.format(function.__name__))
+        stopping.wait(interval)
+
+
+def runPipeline(args, workDir, schema):
+    logger = logging.getLogger(__name__)
+    hdhomerunBinary = makeWrapper(workDir, 'hdhomerun_config', 'fakeHdhomerun.py', ['--bitrate', args.bitrate])
+    ffmpegTranscode = makeWrapper(workDir, 'ffmpeg_transcode', 'fakeFfmpeg.py',
+                                  ['--bitrate', args.bitrate, '--output-bitrate', args.output_bitrate, '--speed', args.transcode_speed])
+    ffmpegBif = makeWrapper(workDir, 'ffmpeg_bif', 'fakeFfmpeg.py', ['--bitrate', args.output_bitrate, '--speed', args.bif_speed])
+    for directory in ('raw', 'transcoded', 'bif', 'images', 'logs'):
+        os.makedirs(os.path.join(workDir, directory))
+    rawVideoFilespec = os.path.join(workDir, 'raw', '{recordingID}.ts')
+
+    pool = dbPool.DBPool(args.db, schema, maxConnections=4)
+    insertRecordings(pool, args.recordings, args.tuners, args.duration, args.lead_time)
+
+    timeline = Timeline()
+    scheduler = BackgroundScheduler(timezone=pytz.utc)
+    logging.getLogger('apscheduler').setLevel(logging.WARNING)
+    dbInterface = recorder.CarbonDVRDatabase(pool)
+    hdhomerun = recorder.HDHomeRunInterface(dbInterface.getChannels(), dbInterface.getTuners(), hdhomerunBinary)
+    recorder.Recorder(scheduler, hdhomerun, dbInterface, rawVideoFilespec, os.path.join(workDir, 'logs', 'record_{recordingID}.log'),
+                      statusCallback=timeline.statusCallback)
+    transcodeCommand = '{} -i {{sourceFile}} {{destFile}}'.format(ffmpegTranscode)
+    pipelineTranscoder = transcoder.Transcoder(pool, transcodeCommand, transcodeCommand, transcodeCommand,
+                                               os.path.join(workDir, 'transcoded', '{recordingID}.mp4'),
+                                               os.path.join(workDir, 'logs', 'transcode_{recordingID}.log'),
+                                               statusCallback=timeline.statusCallback, progressInterval=1)
+    pipelineBifGen = bifGen.BifGen(pool, '{} -i {{videoFile}} -r {{framesPerSecond}} {{imageDir}}/%08d.jpg'.format(ffmpegBif),
+                                   os.path.join(workDir, 'images'), os.path.join(workDir, 'bif', '{recordingID}.bif'), 10000,
+                                   statusCallback=timeline.statusCallback)
+    pipelineCleanup = cleanup.Cleanup(pool)
+
+    scheduler.start()
+    stopping = threading.Event()
+    workers = [threading.Thread(target=runLoop, args=(function, args.poll_interval, stopping), daemon=True)
+               for function in (pipelineTranscoder.transcodeRecordings, pipelineBifGen.bifRecordings, pipelineCleanup.cleanup)]
+    for worker in workers:
+        worker.start()
+
+    # watch for raw video deletions and finished recordings, and sample the queues
+    queueDepths = Bunch(transcode=[], bif=[])
+    deadline = time.monotonic() + args.lead_time + (args.recordings // args.tuners + 1) * (args.duration + 1) + args.timeout
+    try:
+        while time.monotonic() < deadline:
+            recordingIDs = timeline.getRecordingIDs()
+            for recordingID in recordingIDs:
+                if timeline.get(recordingID, 'transcodeFinished') is not None and not os.path.exists(rawVideoFilespec.format(recordingID=recordingID)):
+                    timeline.mark(recordingID, 'rawVideoDeleted')
+                if timeline.get(recordingID, 'bifFinished') is not None and timeline.get(recordingID, 'rawVideoDeleted') is not None:
+                    timeline.mark(recordingID, 'complete')
+            queueDepths.transcode.append(transcoder.TRANSCODE_QUEUE.unlabelled().value)
+            queueDepths.bif.append(bifGen.BIF_QUEUE.unlabelled().value)
+            if len(recordingIDs) == args.recordings and all(timeline.isFinished(recordingID) for recordingID in recordingIDs):
+                break
+            time.sleep(args.poll_interval)
+        else:
+            logger.error('Timed out, with {} of {} recordings finished'.format(
+                len([recordingID for recordingID in timeline.getRecordingIDs() if timeline.isFinished(recordingID)]), args.recordings))
+    finally:
+        stopping.set()
+        scheduler.shutdown(wait=False)
+        for worker in workers:
+            worker.join()
+    queries = pool.queryLog.getStats()
+    pool.close()
+    return summarize(timeline, queueDepths, queries)
+
+
+def summarize(timeline, queueDepths, queries):
+    recordingIDs = timeline.getRecordingIDs()
+    stages = []
+    for stage, startEvent, endEvent in STAGES:
+        times = []
+        for recordingID in recordingIDs:
+            startTime = timeline.get(recordingID, startEvent)
+            endTime = timeline.get(recordingID, endEvent)
+            if startTime is not None and endTime is not None:
+                times.append(endTime - startTime)
+        stages.append(Bunch(stage=stage, count=len(times), p50=percentile(times, 50), max=max(times) if times else 0.0))
+    starts = [timeline.get(recordingID, 'recordingStarted') for recordingID in recordingIDs]
+    ends = [timeline.get(recordingID, 'complete') for recordingID in recordingIDs]
+    elapsed = max(ends) - min(starts) if recordingIDs and None not in ends else None
+    return Bunch(recordings=len(recordingIDs), stages=stages, failures=list(timeline.failures), elapsed=elapsed,
+                 transcodeQueue=summarizeQueue(queueDepths.transcode), bifQueue=summarizeQueue(queueDepths.bif), queries=queries)
+
+
+def summarizeQueue(depths):
+    return Bunch(max=max(depths) if depths else 0, mean=sum(depths) / len(depths) if depths else 0.0)
+
+
+def formatReport(summary, numQueries=5):
+    lines = ['{:<20} {:>8} {:>10} {:>10}'.format('Stage', 'Count', 'p50 (s)', 'Max (s)')]
+    for row in summary.stages:
+        lines.append('{:<20} {:>8} {:>10.2f} {:>10.2f}'.format(row.stage, row.count, row.p50, row.max))
+    lines.append('')
+    lines.append('Queue depth (max / mean): transcode {:.0f} / {:.1f}, BIF {:.0f} / {:.1f}'.format(
+        summary.transcodeQueue.max, summary.transcodeQueue.mean, summary.bifQueue.max, summary.bifQueue.mean))
+    if summary.elapsed is not None:
+        lines.append('{} recordings through the pipeline in {:.1f}s'.format(summary.recordings, summary.elapsed))
+    for recordingID, eventType in summary.failures:
+        lines.append('Recording {} failed at {}'.format(recordingID, eventType))
+    if summary.queries and numQueries:
+        lines.append('')
+        lines.append('{:<32} {:>8} {:>10} {:>10}'.format('Query', 'Runs', 'Total (ms)', 'Max (ms)'))
+        for query in summary.queries[:numQueries]:
+            lines.append('{:<32} {:>8} {:>10.1f} {:>10.1f}'.format(query.name, query.count, query.totalTime * 1000, query.maxTime * 1000))
+    return '\n'.join(lines)
+
+
+def run(args):
+    if not args.db:
+        sys.exit('No database: use --db, or set CARBONDVR_DB_CONNECT_STRING')
+    if args.duration * args.bitrate < 80:
+        # recorder/hdhomerun.py rejects recordings under 10MB
+        sys.exit('Recordings must be at least 10MB: increase --duration or --bitrate')
+    workDir = tempfile.mkdtemp(prefix='carbonDVR-benchmark-')
+    schema = 'carbon_benchmark_{}'.format(os.getpid())
+    createSchema(args.db, schema)
+    try:
+        summary = runPipeline(args, workDir, schema)
+    finally:
+        if args.keep:
+            print('Kept schema {} and directory {}'.format(schema, workDir))
+        else:
+            dropSchema(args.db, schema)
+            shutil.rmtree(workDir, ignore_errors=True)
+    print('{} recordings of {}s at {}Mb/s on {} tuners; transcoding at {}x, thumbnails at {}x'.format(
+        args.recordings, args.duration, args.bitrate, args.tuners, args.transcode_speed, args.bif_speed))
+    print(formatReport(summary))
+
+
+def addArguments(parser):
+    parser.add_argument('--db', default=os.environ.get('CARBONDVR_DB_CONNECT_STRING'),
+                        help='database connect string (default: $CARBONDVR_DB_CONNECT_STRING); a schema is created and dropped')
+    parser.add_argument('-n', '--recordings', type=int, default=6, help='number of recordings')
+    parser.add_argument('-t', '--tuners', type=int, default=2, help='number of (fake) tuners')
+    parser.add_argument('-d', '--duration', type=int, default=5, help='length of each recording, in seconds')
+    parser.add_argument('-b', '--bitrate', type=float, default=20, help='recording bitrate, in Mb/s')
+    parser.add_argument('--output-bitrate', type=float, default=2, help='transcoded bitrate, in Mb/s')
+    parser.add_argument('--transcode-speed', type=float, default=5, help='fake ffmpeg transcode speed (seconds of video per second)')
+    parser.add_argument('--bif-speed', type=float, default=50, help='fake ffmpeg thumbnail speed (seconds of video per second)')
+    parser.add_argument('--lead-time', type=int, default=5, help='seconds until the first recording starts')
+    parser.add_argument('--poll-interval', type=float, default=0.5, help='seconds between runs of the transcoder, BIF generator and cleanup')
+    parser.add_argument('--timeout', type=int, default=300, help='seconds to wait, after the last recording, for the pipeline to finish')
+    parser.add_argument('--keep', action='store_true', help="don't drop the schema or delete the files afterwards")
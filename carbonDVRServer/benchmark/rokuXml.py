@@ -0,0 +1,67 @@
+#!/usr/bin/env python3.4
+
+import time
+from xml.sax import saxutils
+from webServer import restServer
+
+
+# the original serializer, built with repeated string concatenation, for comparison
+def concatenatingDictionaryToRokuXml(tag, d):
+    xml = '<' + saxutils.escape(tag) + ' '
+    for key, value in d.items():
+        if type(value) is not list and type(value) is not dict:
+            xml += saxutils.escape(key) + '=' + saxutils.quoteattr(str(value)) + ' '
+    xml += '>'
+    for key, value in d.items():
+        if type(value) is dict:
+            xml += concatenatingDictionaryToRokuXml(key, value)
+    xml += '</' + saxutils.escape(tag) + '>'
+    return xml
+
+
+def concatenatingListToRokuXml(listTag, itemTag, l):
+    xml = '<' + saxutils.escape(listTag) + '>\n'
+    for item in l:
+        if type(item) is dict:
+            xml += concatenatingDictionaryToRokuXml(itemTag, item)
+    xml += '</' + saxutils.escape(listTag) + '>\n'
+    return xml
+
+
+# episodes shaped like the output of RestServer.rokufyEpisodeData
+def makeEpisodes(numEpisodes):
+    episodes = []
+    for i in range(numEpisodes):
+        episodes.append({'short_description_1': '{}: Episode "{}" & friends'.format(i + 100, i),
+                         'description': 'In which <something> happens to someone, for the {}th time.  '.format(i) * 4,
+                         'hd_img': 'http://images.example.com/shows/12345/episodes/{}.jpg'.format(i),
+                         'springboard_url': 'http://dvr.example.com:8080/recordings/{}'.format(100000 + i)})
+    return episodes
+
+
+def timeFunction(function, repeat):
+    best = None
+    for i in range(repeat):
+        startTime = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - startTime
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def run(args):
+    episodes = makeEpisodes(args.episodes)
+    if restServer.listToRokuXml('shows', 'show', episodes) != concatenatingListToRokuXml('shows', 'show', episodes):
+        raise RuntimeError('Serializers produced different XML')
+    results = [('concatenating', timeFunction(lambda: concatenatingListToRokuXml('shows', 'show', episodes), args.repeat)),
+               ('listToRokuXml', timeFunction(lambda: restServer.listToRokuXml('shows', 'show', episodes), args.repeat)),
+               ('iterListToRokuXml', timeFunction(lambda: list(restServer.iterListToRokuXml('shows', 'show', episodes)), args.repeat))]
+    print('{} episodes, {} bytes, best of {}'.format(args.episodes, len(restServer.listToRokuXml('shows', 'show', episodes)), args.repeat))
+    for name, elapsed in results:
+        print('{:<20} {:>10.2f}ms'.format(name, elapsed * 1000))
+
+
+def addArguments(parser):
+    parser.add_argument('-e', '--episodes', type=int, default=2000, help='number of episodes in the synthetic show')
+    parser.add_argument('-r', '--repeat', type=int, default=20, help='number of runs (the best is reported)')
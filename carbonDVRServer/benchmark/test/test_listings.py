@@ -0,0 +1,72 @@
+import argparse
+import datetime
+import filecmp
+import io
+import os.path
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from benchmark import listings, xtvdGenerator
+from parseXTVD.parseXTVD import extractPartCodes, extractPrograms, extractSchedules, extractStations
+from xml.etree import ElementTree
+
+
+class TestListings(unittest.TestCase):
+
+    def setUp(self):
+        self.workDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workDir)
+        self.xtvdFile = os.path.join(self.workDir, 'listings.xml')
+
+    def generate(self, filename, **kwds):
+        with io.open(filename, 'w', encoding='utf-8') as file:
+            return xtvdGenerator.generateXTVD(file, **kwds)
+
+    def test_listings_generateXTVD(self):
+        startTime = datetime.datetime(2016, 3, 4, tzinfo=datetime.timezone.utc)
+        lineup = self.generate(self.xtvdFile, stations=6, days=2, programs=300, parts=0.2, startTime=startTime)
+        xmlElementTree = ElementTree.parse(self.xtvdFile)
+        stations = extractStations(xmlElementTree)
+        self.assertEqual(6, len(stations))
+        self.assertEqual([(2, 1), (2, 2), (2, 3), (2, 4), (3, 1), (3, 2)], lineup.channels)
+        schedules = extractSchedules(xmlElementTree, stations)
+        self.assertEqual(lineup.schedules, len(schedules))
+        self.assertGreaterEqual(len(schedules), 6 * 2 * 12)          # at most two hours per airing
+        self.assertTrue(any(schedule.rerunCode == 'N' for schedule in schedules))
+        self.assertTrue(extractPartCodes(xmlElementTree, stations))
+        programs = extractPrograms(xmlElementTree)
+        self.assertEqual(lineup.programs, len(programs))
+        self.assertEqual(set(['EP', 'MV', 'SH']), set(program.showType for program in programs))
+        self.assertTrue(any('&' in program.showName + program.episodeDescription for program in programs))
+        # the same arguments give the same listings
+        self.assertEqual('2016-03-04T00:00:00Z', schedules[0].startTime)
+        otherFile = os.path.join(self.workDir, 'other.xml')
+        self.generate(otherFile, stations=6, days=2, programs=300, parts=0.2, startTime=startTime)
+        self.assertTrue(filecmp.cmp(self.xtvdFile, otherFile, shallow=False))
+
+    def test_listings_importIntoSqlite(self):
+        lineup = self.generate(self.xtvdFile, stations=4, days=1, programs=200)
+        parser = argparse.ArgumentParser()
+        listings.addArguments(parser)
+        args = parser.parse_args([])
+        result = listings.runImport(args, self.xtvdFile, lineup.channels, self.workDir)
+        self.assertEqual(lineup.schedules, result.rows['schedule'])
+        self.assertEqual(lineup.programs, result.rows['episode'])
+        self.assertGreater(result.rowsPerSecond, 0)
+        self.assertGreater(result.peakRSS, 0)
+        dbConnection = sqlite3.connect(os.path.join(self.workDir, 'listings.sqlite'))
+        self.assertEqual(lineup.schedules, dbConnection.execute('SELECT count(*) FROM schedule').fetchone()[0])
+        dbConnection.close()
+        self.assertIn('rows/s', listings.formatReport(result))
+
+    def test_listings_fetchListings(self):
+        self.generate(self.xtvdFile, stations=2, days=1, programs=50)
+        fetchedFile = os.path.join(self.workDir, 'fetched.xml')
+        listings.fetchListings(self.xtvdFile, fetchedFile)
+        self.assertTrue(filecmp.cmp(self.xtvdFile, fetchedFile, shallow=False))
+        self.assertEqual([(2, 1), (2, 2)], listings.readChannels(fetchedFile))
+
+
+if __name__ == '__main__':
+    unittest.main()
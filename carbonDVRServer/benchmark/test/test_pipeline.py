@@ -0,0 +1,108 @@
+import argparse
+import io
+import os
+import os.path
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
+import unittest
+from benchmark import pipeline
+from bifGen.bifGen import makeBIF
+from transcoder.transcoder import runCommand
+
+
+def isDatabaseConfigPresent():
+    if os.environ.get('TEST_DB_CONNECT_STRING'):
+        return True
+    return False
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.workDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workDir)
+
+    def test_pipeline_fakeHdhomerun(self):
+        hdhomerunBinary = pipeline.makeWrapper(self.workDir, 'hdhomerun_config', 'fakeHdhomerun.py', ['--bitrate', 8])
+        status = subprocess.check_output([hdhomerunBinary, '127.0.0.1', 'get', '/tuner0/status'])
+        self.assertIn(b'lock=8vsb', status)
+        videoFile = os.path.join(self.workDir, 'raw.ts')
+        process = subprocess.Popen([hdhomerunBinary, '127.0.0.1', 'save', '/tuner0', videoFile])
+        time.sleep(1)
+        os.kill(process.pid, signal.SIGTERM)
+        self.assertEqual(0, process.wait())
+        # about a second, at 1MB/s, in whole transport stream packets
+        size = os.path.getsize(videoFile)
+        self.assertEqual(0, size % 188)
+        self.assertTrue(500000 < size < 1500000, size)
+
+    def test_pipeline_fakeFfmpeg(self):
+        sourceFile = os.path.join(self.workDir, 'raw.ts')
+        with open(sourceFile, 'wb') as file:
+            file.truncate(2500000)      # 2s at 10Mb/s
+        ffmpeg = pipeline.makeWrapper(self.workDir, 'ffmpeg', 'fakeFfmpeg.py', ['--bitrate', 10, '--output-bitrate', 2, '--speed', 4])
+        # a transcode reports its progress as ffmpeg does
+        destFile = os.path.join(self.workDir, 'video.mp4')
+        progress = []
+        startTime = time.monotonic()
+        self.assertEqual(0, runCommand([ffmpeg, '-i', sourceFile, destFile], io.BytesIO(), progress.append))
+        self.assertGreaterEqual(time.monotonic() - startTime, 0.5)
+        self.assertEqual(2.0, progress[-1].seconds)
+        self.assertEqual(4.0, progress[-1].speed)
+        self.assertEqual(500000, os.path.getsize(destFile))
+        # and thumbnails make a BIF file
+        imageDir = os.path.join(self.workDir, 'images')
+        os.makedirs(imageDir)
+        ffmpeg = pipeline.makeWrapper(self.workDir, 'ffmpeg_bif', 'fakeFfmpeg.py', ['--bitrate', 2, '--speed', 100])
+        subprocess.check_call([ffmpeg, '-i', destFile, '-r', '1', os.path.join(imageDir, '%08d.jpg')])
+        self.assertEqual(3, len(os.listdir(imageDir)))
+        bifFile = os.path.join(self.workDir, 'video.bif')
+        makeBIF(bifFile, imageDir, 1000)
+        with open(bifFile, 'rb') as file:
+            self.assertEqual(b'\x89BIF', file.read(4))
+
+    def test_pipeline_summarize(self):
+        timeline = pipeline.Timeline()
+        for recordingID, offset in ((1, 0), (2, 10)):
+            for eventType, eventTime in (('recordingStarted', 0), ('recordingFinished', 5), ('transcodeStarted', 6), ('transcodeFinished', 8),
+                                         ('bifFinished', 9), ('rawVideoDeleted', 10), ('complete', 10)):
+                timeline.events.setdefault(recordingID, {})[eventType] = offset + eventTime
+        timeline.statusCallback('transcodeProgress', recordingID=3, stage='mp4', percent=10)
+        timeline.statusCallback('recordingFinished', recordingID=3, success=False)
+        summary = pipeline.summarize(timeline, pipeline.Bunch(transcode=[0, 1, 2, 1], bif=[]), [])
+        stages = dict((row.stage, row) for row in summary.stages)
+        self.assertEqual(2, stages['transcode'].count)
+        self.assertEqual(2.0, stages['transcode'].p50)
+        self.assertEqual(3.0, stages['time to playable'].max)
+        self.assertEqual(5.0, stages['time to complete'].max)
+        self.assertIsNone(summary.elapsed)         # recording 3 failed, so never completed
+        self.assertEqual([(3, 'recordingFinished')], summary.failures)
+        self.assertEqual(2, summary.transcodeQueue.max)
+        self.assertEqual(1.0, summary.transcodeQueue.mean)
+        report = pipeline.formatReport(summary)
+        self.assertIn('time to playable', report)
+        self.assertIn('Recording 3 failed at recordingFinished', report)
+
+    @unittest.skipUnless(isDatabaseConfigPresent(), 'No test database configured')
+    def test_pipeline_run(self):
+        parser = argparse.ArgumentParser()
+        pipeline.addArguments(parser)
+        args = parser.parse_args(['--db', os.environ['TEST_DB_CONNECT_STRING'], '-n', '2', '-t', '2', '-d', '4', '-b', '24',
+                                  '--transcode-speed', '20', '--lead-time', '3', '--timeout', '60'])
+        schema = 'carbon_benchmark_test'
+        pipeline.dropSchema(args.db, schema)
+        pipeline.createSchema(args.db, schema)
+        try:
+            summary = pipeline.runPipeline(args, self.workDir, schema)
+        finally:
+            pipeline.dropSchema(args.db, schema)
+        self.assertEqual(2, summary.recordings)
+        self.assertEqual([], summary.failures)
+        self.assertIsNotNone(summary.elapsed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3.4
+
+import datetime
+import random
+from xml.sax.saxutils import escape, quoteattr
+
+
+class Bunch:
+    def __init__(self, **kwds):
+        self.__dict__.update(kwds)
+
+
+#
+# Notes on the XTVD generator
+#
+# Writes listings in the XTVD format that Schedules Direct serves (and parseXTVD reads), for benchmarks: a lineup of
+# 'stations' stations, each with a full schedule for 'days' days, drawn from a pool of 'programs' programs.
+#
+# As in real listings, most programs are episodes of series (EP), with some movies (MV) and series-level programs
+# (SH); most airings are half an hour or an hour, movies are two hours; some airings are new; a fraction ('parts') of
+# them are parts of multi-part programs; and each program has a description, genres and crew, with characters that
+# need escaping.  The output is the same for the same arguments (and seed), and is written as it's generated, so
+# large lineups don't need much memory.
+#
+
+NAMESPACE = 'urn:TMSWebServices'
+WORDS = ('the', 'a', 'of', 'and', 'in', 'detective', 'family', 'island', 'murder', 'kitchen', 'journey', 'secret', 'night',
+         'café', 'doctor', 'river', 'war', 'love', 'city', 'science', 'house', 'Smith & Jones', '"special"', 'old', 'new', 'game')
+GENRES = ('Drama', 'Comedy', 'News', 'Documentary', 'Sports', 'Reality', 'Crime', 'Science fiction', 'Children', 'Cooking')
+EPISODES_PER_SERIES = 20
+MOVIE_FRACTION = 0.1
+SERIES_FRACTION = 0.05
+NEW_FRACTION = 0.2
+
+
+def makeText(rng, numWords):
+    return ' '.join(rng.choice(WORDS) for i in range(numWords))
+
+
+# returns (major, minor), e.g. stations 0 to 3 are on 2.1 to 2.4
+def stationChannel(stationIndex):
+    return 2 + stationIndex // 4, 1 + stationIndex % 4
+
+
+def stationID(stationIndex):
+    return str(10000 + stationIndex)
+
+
+# returns a list of Bunch(programID, kind, seriesNumber, episodeNumber)
+def makeProgramPool(rng, numPrograms):
+    programs = []
+    numSeries = max(1, numPrograms // EPISODES_PER_SERIES)
+    for i in range(numPrograms):
+        draw = rng.random()
+        if draw < MOVIE_FRACTION:
+            kind, seriesNumber, episodeNumber = 'MV', 1000000 + i, 0
+        elif draw < MOVIE_FRACTION + SERIES_FRACTION:
+            kind, seriesNumber, episodeNumber = 'SH', 1 + rng.randrange(numSeries), 0
+        else:
+            kind, seriesNumber, episodeNumber = 'EP', 1 + rng.randrange(numSeries), 1 + i
+        programs.append(Bunch(programID='{}{:08d}{:04d}'.format(kind, seriesNumber, episodeNumber % 10000), kind=kind,
+                              seriesNumber=seriesNumber, episodeNumber=episodeNumber))
+    # series-level programs can be drawn more than once, as can episode numbers past 9999
+    unique = dict((program.programID, program) for program in programs)
+    return [unique[programID] for programID in sorted(unique)]
+
+
+def writeStations(file, numStations):
+    file.write('<stations>\n')
+    for i in range(numStations):
+        file.write('<station id="{}"><callSign>K{:03d}DT{}</callSign><name>Station {}</name><affiliate>Affiliate &amp; Co</affiliate></station>\n'.format(
+            stationID(i), i // 4, i % 4 + 1, i))
+    file.write('</stations>\n')
+
+
+def writeLineup(file, numStations):
+    file.write('<lineups>\n<lineup id="BENCHMARK:-" name="Benchmark" location="Anytown" type="LocalBroadcast" postalCode="00000">\n')
+    for i in range(numStations):
+        major, minor = stationChannel(i)
+        file.write('<map station="{}" channel="{:03d}" channelMinor="{}"/>\n'.format(stationID(i), major, minor))
+    file.write('</lineup>\n</lineups>\n')
+
+
+# returns the number of airings
+def writeSchedules(file, rng, numStations, days, programs, partFraction, startTime):
+    numSchedules = 0
+    endTime = startTime + datetime.timedelta(days=days)
+    file.write('<schedules>\n')
+    for i in range(numStations):
+        time = startTime
+        while time < endTime:
+            program = rng.choice(programs)
+            minutes = 120 if program.kind == 'MV' else rng.choice((30, 30, 30, 60))
+            attributes = 'program="{}" station="{}" time="{}" duration="PT{:02d}H{:02d}M"'.format(
+                program.programID, stationID(i), time.strftime('%Y-%m-%dT%H:%M:%SZ'), minutes // 60, minutes % 60)
+            if rng.random() < NEW_FRACTION:
+                attributes += ' new="true"'
+            if rng.random() < partFraction:
+                total = rng.randrange(2, 5)
+                file.write('<schedule {} tvRating="TV-PG" stereo="true"><part number="{}" total="{}"/></schedule>\n'.format(
+                    attributes, rng.randrange(1, total + 1), total))
+            else:
+                file.write('<schedule {} tvRating="TV-PG" stereo="true"/>\n'.format(attributes))
+            numSchedules += 1
+            time += datetime.timedelta(minutes=minutes)
+    file.write('</schedules>\n')
+    return numSchedules
+
+
+def writePrograms(file, rng, programs):
+    file.write('<programs>\n')
+    for program in programs:
+        file.write('<program id="{}">'.format(program.programID))
+        if program.kind != 'MV':
+            file.write('<series>SH{:08d}</series>'.format(program.seriesNumber))
+        file.write('<title>{}</title>'.format(escape(makeText(rng, 3).title())))
+        if program.kind == 'EP':
+            file.write('<subtitle>{}</subtitle>'.format(escape(makeText(rng, 4))))
+            file.write('<syndicatedEpisodeNumber>{}</syndicatedEpisodeNumber>'.format(program.episodeNumber))
+        file.write('<description>{}</description>'.format(escape(makeText(rng, rng.randrange(15, 40)))))
+        file.write('<originalAirDate>2015-{:02d}-{:02d}</originalAirDate></program>\n'.format(rng.randrange(1, 13), rng.randrange(1, 29)))
+    file.write('</programs>\n')
+
+
+def writeCrewAndGenres(file, rng, programs):
+    file.write('<productionCrew>\n')
+    for program in programs:
+        file.write('<crew program="{}">'.format(program.programID))
+        for role in ('Actor', 'Actor', 'Director'):
+            file.write('<member><role>{}</role><givenname>{}</givenname><surname>{}</surname></member>'.format(
+                role, escape(rng.choice(WORDS).title()), escape(rng.choice(WORDS).title())))
+        file.write('</crew>\n')
+    file.write('</productionCrew>\n<genres>\n')
+    for program in programs:
+        file.write('<programGenre program="{}">'.format(program.programID))
+        for relevance, genre in enumerate(rng.sample(GENRES, 2)):
+            file.write('<genre><class>{}</class><relevance>{}</relevance></genre>'.format(escape(genre), relevance))
+        file.write('</programGenre>\n')
+    file.write('</genres>\n')
+
+
+# writes the listings to 'file' (opened for writing text, as UTF-8), and returns a Bunch of what was written
+def generateXTVD(file, stations=100, days=14, programs=20000, parts=0.02, seed=1, startTime=None):
+    rng = random.Random(seed)
+    if startTime is None:
+        startTime = datetime.datetime.now(datetime.timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    programPool = makeProgramPool(rng, programs)
+    file.write("<?xml version='1.0' encoding='utf-8'?>\n")
+    file.write('<xtvd from={} to={} schemaVersion="1.3" xmlns={}>\n'.format(
+        quoteattr(startTime.strftime('%Y-%m-%dT%H:%M:%SZ')), quoteattr((startTime + datetime.timedelta(days=days)).strftime('%Y-%m-%dT%H:%M:%SZ')),
+        quoteattr(NAMESPACE)))
+    writeStations(file, stations)
+    writeLineup(file, stations)
+    numSchedules = writeSchedules(file, rng, stations, days, programPool, parts, startTime)
+    writePrograms(file, rng, programPool)
+    writeCrewAndGenres(file, rng, programPool)
+    file.write('</xtvd>\n')
+    return Bunch(stations=stations, channels=[stationChannel(i) for i in range(stations)], schedules=numSchedules, programs=len(programPool))
+
+
+def addArguments(parser):
+    parser.add_argument('-s', '--stations', type=int, default=100, help='number of stations')
+    parser.add_argument('--days', type=int, default=14, help='days of listings')
+    parser.add_argument('-p', '--programs', type=int, default=20000, help='number of distinct programs')
+    parser.add_argument('--parts', type=float, default=0.02, help='fraction of airings that are parts of multi-part programs')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
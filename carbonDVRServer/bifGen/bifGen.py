@@ -6,6 +6,13 @@ import os
 import subprocess
 import tempfile
 import threading
+import time
+
+import metrics
+
+
+BIF_SECONDS = metrics.Histogram('carbondvr_bif_seconds', 'Time taken to generate BIF files', buckets=metrics.LONG_BUCKETS)
+BIF_QUEUE = metrics.Gauge('carbondvr_bif_queue', 'Recordings waiting for BIF files')
 
 
 def getFiles(path):
@@ -83,14 +90,18 @@ def makeBIF( filename, directory, interval ):
 
 class BifGen:
 
-    def __init__(self, dbConnection, imageCommand, imageDir, bifFilespec, frameInterval):
+    def __init__(self, dbPool, imageCommand, imageDir, bifFilespec, frameInterval, fileLocations=None, recordingsChangedCallback=None,
+                 statusCallback=None):
         self.logger = logging.getLogger(__name__)
         self.workingLock = threading.Lock()
-        self.dbConnection = dbConnection
+        self.dbPool = dbPool
         self.ffmpegCommand = imageCommand
         self.imageDir = imageDir
         self.bifFilespec = bifFilespec
         self.frameInterval = frameInterval
+        self.fileLocations = fileLocations
+        self.recordingsChangedCallback = recordingsChangedCallback
+        self.statusCallback = statusCallback
         self.logger.debug("Template ffmepg command: {}".format(self.ffmpegCommand))
         self.logger.debug("Image directory: {}".format(self.imageDir))
         self.logger.debug("BIF filespec: {}".format(self.bifFilespec))
@@ -98,17 +109,17 @@ class BifGen:
 
     def dbGetRecordingsToBif(self):
         recordings = []
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute("SELECT recording_id, filename FROM file_transcoded_video WHERE state = %s AND recording_id NOT IN (SELECT recording_id FROM file_bif);", (0, ))
-            for row in cursor:
-                recordings.append({'recordingID':row[0], 'filename':row[1]})
-        self.dbConnection.commit()
+        with self.dbPool.connection('recordings_to_bif') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute("SELECT recording_id, filename FROM file_transcoded_video WHERE state = %s AND recording_id NOT IN (SELECT recording_id FROM file_bif);", (0, ))
+                for row in cursor:
+                    recordings.append({'recordingID':row[0], 'filename':row[1]})
         return recordings
 
     def dbInsertBifFileLocation(self, recordingID, locationID, filename):
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute("INSERT INTO file_bif(recording_id, location_id, filename) VALUES (%s, %s, %s)", (recordingID, locationID, filename))
-        self.dbConnection.commit()
+        with self.dbPool.connection('insert_bif_file_location') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute("INSERT INTO file_bif(recording_id, location_id, filename) VALUES (%s, %s, %s)", (recordingID, locationID, filename))
 
     def clearImageDirectory(self):
         self.logger.debug("Clearing image directory {}".format(self.imageDir))
@@ -117,6 +128,14 @@ class BifGen:
 
     def imageFile(self, fileNumber):
         return os.path.join(self.imageDir, '{:0>8}.jpg'.format(fileNumber))
+
+    # placement: use the location chosen by fileLocations, if any BIF locations are configured
+    def chooseDestination(self, recordingID):
+        if self.fileLocations is not None:
+            locationID = self.fileLocations.chooseLocation('bif')
+            if locationID is not None:
+                return locationID, self.fileLocations.getBifFilespec(locationID, recordingID)
+        return 1, self.bifFilespec.format(recordingID=recordingID)
 #
 # Notes on BIF process
 #
@@ -133,6 +152,7 @@ class BifGen:
     def bifRecording(self, recording):
         recordingID = recording['recordingID']
         self.logger.info("Biffing recording {}".format(recordingID))
+        startTime = time.monotonic()
         # generate thumbnails
         self.clearImageDirectory()
         framesPerSecond = 1000 / self.frameInterval
@@ -147,12 +167,16 @@ class BifGen:
             os.rename(self.imageFile(i+1), self.imageFile(i))
             i = i + 1
         # generate BIF file
-        locationID = 1
-        bifFile = self.bifFilespec.format(recordingID=recordingID)
+        locationID, bifFile = self.chooseDestination(recordingID)
         self.logger.info("Generating BIF file {}".format(bifFile))
         makeBIF(bifFile, self.imageDir, self.frameInterval)
         # mark recording as "biffed"
         self.dbInsertBifFileLocation(recordingID, locationID, bifFile)
+        BIF_SECONDS.observe(time.monotonic() - startTime)
+        if self.recordingsChangedCallback is not None:
+            self.recordingsChangedCallback()
+        if self.statusCallback is not None:
+            self.statusCallback('bifFinished', recordingID=recordingID)
         # cleanup
         self.clearImageDirectory()
         self.logger.info("BIF generation complete")
@@ -160,6 +184,7 @@ class BifGen:
     def bifRecordings(self):
         with self.workingLock:
             recordings = self.dbGetRecordingsToBif()
+            BIF_QUEUE.set(len(recordings))
             for recording in recordings[:1]:
                 self.bifRecording(recording)
 
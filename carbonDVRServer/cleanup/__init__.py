@@ -1 +1,2 @@
 from cleanup.cleanup import Cleanup
+from cleanup.reconciler import Reconciler
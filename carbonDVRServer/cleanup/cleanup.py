@@ -5,110 +5,156 @@ import logging
 import io
 import psycopg2
 import datetime
+import shutil
 import subprocess
 import threading
 
+import metrics
+
+
+FILES_PURGED = metrics.Counter('carbondvr_cleanup_files_purged_total', 'Files deleted by the cleanup, by kind', ['kind'])
+
 
 class Bunch:
     def __init__(self, **kwds):
         self.__dict__.update(kwds)
 
 class Cleanup:
-    def __init__(self, dbConnection):
+    def __init__(self, dbPool):
         self.cleaningLock = threading.Lock()
-        self.dbConnection = dbConnection
+        self.dbPool = dbPool
 
-    def dbGetUnreferencedRawVideoRecords(self):
+    def dbGetUnreferencedRawVideoRecords(self, recordingID=None):
         records = []
         query = str('SELECT recording_id, filename '
                     'FROM file_raw_video '
                     'WHERE recording_id NOT IN (SELECT recording_id FROM recording) '
+                    'AND (%(recordingID)s IS NULL OR recording_id = %(recordingID)s) '
                     'ORDER BY recording_id;')
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute(query)
-            for row in cursor:
-                records.append(Bunch(recordingID=row[0], filename=row[1]))
-        self.dbConnection.commit()
+        with self.dbPool.connection('unreferenced_raw_video') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query, {'recordingID': recordingID})
+                for row in cursor:
+                    records.append(Bunch(recordingID=row[0], filename=row[1]))
         return records
 
 
     def dbDeleteRawVideoRecord(self, recordingID):
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute('DELETE FROM file_raw_video WHERE recording_id = %s', (recordingID, ))
-        self.dbConnection.commit()
+        with self.dbPool.connection('delete_raw_video') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute('DELETE FROM file_raw_video WHERE recording_id = %s', (recordingID, ))
 
 
-    def purgeUnreferencedRawVideoRecords(self):
+    def purgeUnreferencedRawVideoRecords(self, recordingID=None):
         logger = logging.getLogger(__name__)
-        for record in self.dbGetUnreferencedRawVideoRecords():
+        for record in self.dbGetUnreferencedRawVideoRecords(recordingID):
            logger.info('Deleting file: {}'.format(record.filename))
            try:
                os.unlink(record.filename)
            except FileNotFoundError:
                logger.info('File not found: {}'.format(record.filename))
            self.dbDeleteRawVideoRecord(record.recordingID)
+           FILES_PURGED.labels(kind='rawVideo').inc()
 
 
-    def dbGetUnreferencedTranscodedVideoRecords(self):
+    def dbGetUnreferencedTranscodedVideoRecords(self, recordingID=None):
         records = []
         query = str('SELECT recording_id, filename '
                     'FROM file_transcoded_video '
                     'WHERE recording_id NOT IN (SELECT recording_id FROM recording) '
+                    'AND (%(recordingID)s IS NULL OR recording_id = %(recordingID)s) '
                     'ORDER BY recording_id;')
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute(query)
-            for row in cursor:
-                records.append(Bunch(recordingID=row[0], filename=row[1]))
-        self.dbConnection.commit()
+        with self.dbPool.connection('unreferenced_transcoded_video') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query, {'recordingID': recordingID})
+                for row in cursor:
+                    records.append(Bunch(recordingID=row[0], filename=row[1]))
         return records
 
 
     def dbDeleteTranscodedVideoRecord(self, recordingID):
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute('DELETE FROM file_transcoded_video WHERE recording_id = %s', (recordingID, ))
-        self.dbConnection.commit()
+        with self.dbPool.connection('delete_transcoded_video') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute('DELETE FROM file_transcoded_video WHERE recording_id = %s', (recordingID, ))
 
 
-    def purgeUnreferencedTranscodedVideoRecords(self):
+    def purgeUnreferencedTranscodedVideoRecords(self, recordingID=None):
         logger = logging.getLogger(__name__)
-        for record in self.dbGetUnreferencedTranscodedVideoRecords():
+        for record in self.dbGetUnreferencedTranscodedVideoRecords(recordingID):
            logger.info('Deleting file: {}'.format(record.filename))
            try:
                os.unlink(record.filename)
            except FileNotFoundError:
                logger.info('File not found: {}'.format(record.filename))
            self.dbDeleteTranscodedVideoRecord(record.recordingID)
+           FILES_PURGED.labels(kind='transcodedVideo').inc()
 
 
-    def dbGetUnreferencedBifRecords(self):
+    def dbGetUnreferencedBifRecords(self, recordingID=None):
         records = []
         query = str('SELECT recording_id, filename '
                     'FROM file_bif '
                     'WHERE recording_id NOT IN (SELECT recording_id FROM recording) '
+                    'AND (%(recordingID)s IS NULL OR recording_id = %(recordingID)s) '
                     'ORDER BY recording_id;')
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute(query)
-            for row in cursor:
-                records.append(Bunch(recordingID=row[0], filename=row[1]))
-        self.dbConnection.commit()
+        with self.dbPool.connection('unreferenced_bif') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query, {'recordingID': recordingID})
+                for row in cursor:
+                    records.append(Bunch(recordingID=row[0], filename=row[1]))
         return records
 
 
     def dbDeleteBifRecord(self, recordingID):
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute('DELETE FROM file_bif WHERE recording_id = %s', (recordingID, ))
-        self.dbConnection.commit()
+        with self.dbPool.connection('delete_bif') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute('DELETE FROM file_bif WHERE recording_id = %s', (recordingID, ))
 
 
-    def purgeUnreferencedBifRecords(self):
+    def purgeUnreferencedBifRecords(self, recordingID=None):
         logger = logging.getLogger(__name__)
-        for record in self.dbGetUnreferencedBifRecords():
+        for record in self.dbGetUnreferencedBifRecords(recordingID):
            logger.info('Deleting file: {}'.format(record.filename))
            try:
                os.unlink(record.filename)
            except FileNotFoundError:
                logger.info('File not found: {}'.format(record.filename))
            self.dbDeleteBifRecord(record.recordingID)
+           FILES_PURGED.labels(kind='bif').inc()
+
+
+    def dbGetUnreferencedHlsRecords(self, recordingID=None):
+        records = []
+        query = str('SELECT recording_id, filename '
+                    'FROM file_hls '
+                    'WHERE recording_id NOT IN (SELECT recording_id FROM recording) '
+                    'AND (%(recordingID)s IS NULL OR recording_id = %(recordingID)s) '
+                    'ORDER BY recording_id;')
+        with self.dbPool.connection('unreferenced_hls') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query, {'recordingID': recordingID})
+                for row in cursor:
+                    records.append(Bunch(recordingID=row[0], filename=row[1]))
+        return records
+
+
+    def dbDeleteHlsRecord(self, recordingID):
+        with self.dbPool.connection('delete_hls') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute('DELETE FROM file_hls WHERE recording_id = %s', (recordingID, ))
+
+
+    # an HLS 'file' is a directory of playlists and segments
+    def purgeUnreferencedHlsRecords(self, recordingID=None):
+        logger = logging.getLogger(__name__)
+        for record in self.dbGetUnreferencedHlsRecords(recordingID):
+           logger.info('Deleting directory: {}'.format(record.filename))
+           try:
+               shutil.rmtree(record.filename)
+           except FileNotFoundError:
+               logger.info('Directory not found: {}'.format(record.filename))
+           self.dbDeleteHlsRecord(record.recordingID)
+           FILES_PURGED.labels(kind='hls').inc()
 
 
     def dbGetUnneededRawVideoRecords(self):
@@ -118,11 +164,11 @@ class Cleanup:
                     'INNER JOIN file_transcoded_video USING (recording_id) '
                     'WHERE file_transcoded_video.state = 0 '
                     'ORDER BY file_raw_video.recording_id;')
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute(query)
-            for row in cursor:
-                records.append(Bunch(recordingID=row[0], filename=row[1]))
-        self.dbConnection.commit()
+        with self.dbPool.connection('unneeded_raw_video') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query)
+                for row in cursor:
+                    records.append(Bunch(recordingID=row[0], filename=row[1]))
         return records
 
 
@@ -135,6 +181,7 @@ class Cleanup:
            except FileNotFoundError:
                logger.info('File not found: {}'.format(record.filename))
            self.dbDeleteRawVideoRecord(record.recordingID)
+           FILES_PURGED.labels(kind='rawVideo').inc()
 
     def cleanup(self):
         logger = logging.getLogger(__name__)
@@ -146,6 +193,19 @@ class Cleanup:
             self.purgeUnreferencedTranscodedVideoRecords()
             logger.debug('Purging unreferenced BIF records')
             self.purgeUnreferencedBifRecords()
+            logger.debug('Purging unreferenced HLS records')
+            self.purgeUnreferencedHlsRecords()
             logger.debug('Purging raw video files that have been transcoded')
             self.purgeUnneededRawVideoRecords()
 
+    # Called (via the scheduler) as soon as a recording is deleted, so that its disk space is reclaimed
+    # immediately, instead of waiting for the next periodic sweep.  The periodic sweep in cleanup() is
+    # still needed, to catch anything this misses (e.g. recordings deleted directly from the database).
+    def purgeDeletedRecording(self, recordingID):
+        logger = logging.getLogger(__name__)
+        with self.cleaningLock:
+            logger.info('Purging files for deleted recording {}'.format(recordingID))
+            self.purgeUnreferencedRawVideoRecords(recordingID)
+            self.purgeUnreferencedTranscodedVideoRecords(recordingID)
+            self.purgeUnreferencedBifRecords(recordingID)
+            self.purgeUnreferencedHlsRecords(recordingID)
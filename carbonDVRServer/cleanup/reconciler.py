@@ -0,0 +1,158 @@
+#!/usr/bin/env python3.4
+
+import os, os.path
+import logging
+import psycopg2
+import re
+import string
+from stat import S_ISREG
+import threading
+import time
+
+
+class Bunch:
+    def __init__(self, **kwds):
+        self.__dict__.update(kwds)
+
+
+# converts a filespec such as '/var/carbonDVR/video/{recordingID}.mp4' into a regular expression which matches the
+# filenames (not the full paths) that the filespec can produce
+def filespecToPattern(filespec):
+    pattern = ''
+    for literalText, fieldName, formatSpec, conversion in string.Formatter().parse(os.path.basename(filespec)):
+        pattern += re.escape(literalText)
+        if fieldName is not None:
+            pattern += '[0-9]+'
+    return re.compile(pattern + '$')
+
+
+#
+# Notes on reconciliation
+#
+# The reconciler compares the files in each directory that carbonDVR writes to against the file_raw_video,
+# file_transcoded_video and file_bif tables, and records two kinds of problems in the reconciliation_issue table:
+#     'U': a file on disk which no table references (it's using space, but nothing will ever delete it)
+#     'M': a table row whose file doesn't exist
+# Only files whose names match one of the configured filespecs are considered, so log files etc. are ignored.
+#
+# Scans are incremental.  For each directory, reconciliation_checkpoint holds the directory's mtime and the newest
+# file ctime examined so far.  If the directory's mtime hasn't changed, no files have been added or removed, and the
+# directory is skipped entirely.  Otherwise, only files newer than the checkpoint (plus files already known to be
+# unreferenced) are checked for references.  ctime is used, rather than mtime, because it can't be set backwards
+# (e.g. by a copy that preserves timestamps).
+#
+# Files modified within the last 'gracePeriod' seconds are left for a later scan, since they may still be being written
+# (e.g. a recording in progress, which doesn't get a file_raw_video row until it's finished).
+#
+
+class Reconciler:
+    def __init__(self, dbPool, filespecs, gracePeriod=3600):
+        self.logger = logging.getLogger(__name__)
+        self.reconcilingLock = threading.Lock()
+        self.dbPool = dbPool
+        self.gracePeriod = gracePeriod
+        self.patternsByDirectory = {}
+        for filespec in filespecs:
+            self.patternsByDirectory.setdefault(os.path.dirname(filespec), []).append(filespecToPattern(filespec))
+        for directory in sorted(self.patternsByDirectory):
+            self.logger.debug("Reconciling directory: {}".format(directory))
+
+    def dbGetCheckpoint(self, directory):
+        checkpoint = None
+        with self.dbPool.connection('reconciliation_checkpoint') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute('SELECT directory_mtime, entry_ctime FROM reconciliation_checkpoint WHERE directory = %s;', (directory, ))
+                row = cursor.fetchone()
+                if row:
+                    checkpoint = Bunch(directoryMtime=row[0], entryCtime=row[1])
+        return checkpoint
+
+    def dbGetUnreferencedFiles(self, directory):
+        filenames = []
+        with self.dbPool.connection('reconciliation_unreferenced_files') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute("SELECT filename FROM reconciliation_issue WHERE directory = %s AND issue = 'U';", (directory, ))
+                for row in cursor:
+                    filenames.append(row[0])
+        return filenames
+
+    # a single, set-based comparison of the directory contents against all three file tables
+    def dbFindIssues(self, directory, filesOnDisk, filesToCheck):
+        issues = []
+        query = str("WITH referenced (recording_id, filename, must_exist) AS ( "
+                    "  SELECT recording_id, filename, true FROM file_raw_video "
+                    "  UNION ALL SELECT recording_id, filename, state = 0 FROM file_transcoded_video "
+                    "  UNION ALL SELECT recording_id, filename, true FROM file_bif) "
+                    "SELECT 'U', candidate.filename, NULL "
+                    "FROM unnest(%(filesToCheck)s::text[]) AS candidate (filename) "
+                    "WHERE candidate.filename NOT IN (SELECT filename FROM referenced WHERE filename IS NOT NULL) "
+                    "UNION ALL "
+                    "SELECT 'M', referenced.filename, referenced.recording_id "
+                    "FROM referenced "
+                    "WHERE referenced.must_exist "
+                    "AND regexp_replace(referenced.filename, '/[^/]*$', '') = %(directory)s "
+                    "AND referenced.filename NOT IN (SELECT unnest(%(filesOnDisk)s::text[]));")
+        with self.dbPool.connection('reconciliation_issues') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query, {'directory': directory, 'filesOnDisk': filesOnDisk, 'filesToCheck': filesToCheck})
+                for row in cursor:
+                    issues.append(Bunch(issue=row[0], filename=row[1], recordingID=row[2]))
+        return issues
+
+    def dbSaveResults(self, directory, issues, sizes, directoryMtime, entryCtime):
+        with self.dbPool.connection('save_reconciliation') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute('DELETE FROM reconciliation_issue WHERE directory = %s;', (directory, ))
+                for issue in issues:
+                    cursor.execute('INSERT INTO reconciliation_issue (filename, directory, issue, recording_id, size, detected) VALUES (%s, %s, %s, %s, %s, now());',
+                                   (issue.filename, directory, issue.issue, issue.recordingID, sizes.get(issue.filename)))
+                query = str('INSERT INTO reconciliation_checkpoint (directory, directory_mtime, entry_ctime) VALUES (%s, %s, %s) '
+                            'ON CONFLICT (directory) DO UPDATE SET directory_mtime = EXCLUDED.directory_mtime, entry_ctime = EXCLUDED.entry_ctime;')
+                cursor.execute(query, (directory, directoryMtime, entryCtime))
+
+    def reconcileDirectory(self, directory, patterns):
+        if not os.path.isdir(directory):
+            self.logger.warning('Directory not found: {}'.format(directory))
+            return
+        directoryMtime = os.stat(directory).st_mtime
+        checkpoint = self.dbGetCheckpoint(directory)
+        if checkpoint is not None and checkpoint.directoryMtime == directoryMtime:
+            self.logger.debug('Directory unchanged since last scan: {}'.format(directory))
+            return
+        watermark = checkpoint.entryCtime if checkpoint is not None and checkpoint.entryCtime is not None else 0
+        cutoff = time.time() - self.gracePeriod
+        newWatermark = watermark
+        filesOnDisk = []
+        newFiles = []
+        sizes = {}
+        deferred = False
+        for name in os.listdir(directory):
+            if not any(pattern.match(name) for pattern in patterns):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:       # deleted since the listing
+                continue
+            if not S_ISREG(stat.st_mode):
+                continue
+            filesOnDisk.append(path)
+            sizes[path] = stat.st_size
+            if stat.st_ctime > cutoff:
+                deferred = True
+            elif stat.st_ctime > watermark:
+                newFiles.append(path)
+                newWatermark = max(newWatermark, stat.st_ctime)
+        onDisk = set(filesOnDisk)
+        filesToCheck = newFiles + [f for f in self.dbGetUnreferencedFiles(directory) if f in onDisk and f not in newFiles]
+        self.logger.info('Reconciling {}: {} files, {} to check'.format(directory, len(filesOnDisk), len(filesToCheck)))
+        issues = self.dbFindIssues(directory, filesOnDisk, filesToCheck)
+        for issue in issues:
+            self.logger.info('{}: {}'.format('Unreferenced file' if issue.issue == 'U' else 'Missing file', issue.filename))
+        # if any files were too new to check, don't record the directory's mtime, so the next scan doesn't skip it
+        self.dbSaveResults(directory, issues, sizes, None if deferred else directoryMtime, newWatermark)
+
+    def reconcile(self):
+        with self.reconcilingLock:
+            for directory in sorted(self.patternsByDirectory):
+                self.reconcileDirectory(directory, self.patternsByDirectory[directory])
@@ -0,0 +1,50 @@
+import unittest
+from cleanup.cleanup import Cleanup
+from unittest.mock import Mock, patch, call
+
+
+class Bunch:
+    def __init__(self, **kwds):
+        self.__dict__.update(kwds)
+
+
+class TestCleanup(unittest.TestCase):
+
+    def test_cleanup_purgeDeletedRecording(self):
+        cleanup = Cleanup(Mock())
+        cleanup.dbGetUnreferencedRawVideoRecords = Mock(return_value=[Bunch(recordingID=7, filename='raw_7.ts')])
+        cleanup.dbGetUnreferencedTranscodedVideoRecords = Mock(return_value=[Bunch(recordingID=7, filename='transcoded_7.mp4')])
+        cleanup.dbGetUnreferencedBifRecords = Mock(return_value=[])
+        cleanup.dbGetUnreferencedHlsRecords = Mock(return_value=[Bunch(recordingID=7, filename='hls/7')])
+        cleanup.dbDeleteRawVideoRecord = Mock()
+        cleanup.dbDeleteTranscodedVideoRecord = Mock()
+        cleanup.dbDeleteBifRecord = Mock()
+        cleanup.dbDeleteHlsRecord = Mock()
+        with patch('cleanup.cleanup.os') as mockOS, patch('cleanup.cleanup.shutil') as mockShutil:
+            cleanup.purgeDeletedRecording(7)
+        # only the deleted recording's records are fetched, and its files and records are removed
+        cleanup.dbGetUnreferencedRawVideoRecords.assert_called_once_with(7)
+        cleanup.dbGetUnreferencedTranscodedVideoRecords.assert_called_once_with(7)
+        cleanup.dbGetUnreferencedBifRecords.assert_called_once_with(7)
+        self.assertEqual(mockOS.unlink.call_args_list, [call('raw_7.ts'), call('transcoded_7.mp4')])
+        cleanup.dbDeleteRawVideoRecord.assert_called_once_with(7)
+        cleanup.dbDeleteTranscodedVideoRecord.assert_called_once_with(7)
+        self.assertFalse(cleanup.dbDeleteBifRecord.called)
+        mockShutil.rmtree.assert_called_once_with('hls/7')
+        cleanup.dbDeleteHlsRecord.assert_called_once_with(7)
+
+    def test_cleanup_purgeDeletedRecording_fileNotFound(self):
+        cleanup = Cleanup(Mock())
+        cleanup.dbGetUnreferencedRawVideoRecords = Mock(return_value=[Bunch(recordingID=3, filename='raw_3.ts')])
+        cleanup.dbGetUnreferencedTranscodedVideoRecords = Mock(return_value=[])
+        cleanup.dbGetUnreferencedBifRecords = Mock(return_value=[])
+        cleanup.dbGetUnreferencedHlsRecords = Mock(return_value=[])
+        cleanup.dbDeleteRawVideoRecord = Mock()
+        with patch('cleanup.cleanup.os.unlink', side_effect=FileNotFoundError()):
+            cleanup.purgeDeletedRecording(3)
+        # a missing file doesn't stop the record from being removed
+        cleanup.dbDeleteRawVideoRecord.assert_called_once_with(3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+from cleanup.reconciler import Reconciler, filespecToPattern
+from unittest.mock import Mock
+
+
+class Bunch:
+    def __init__(self, **kwds):
+        self.__dict__.update(kwds)
+
+
+class TestReconciler(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.directory = self.tempDir.name
+        for filename in ['1.mp4', '2.mp4', 'transcode_1.log']:
+            with open(os.path.join(self.directory, filename), 'w') as f:
+                f.write('x')
+        self.reconciler = Reconciler(Mock(), [os.path.join(self.directory, '{recordingID}.mp4')], gracePeriod=0)
+        self.reconciler.logger = Mock()
+        self.reconciler.dbGetUnreferencedFiles = Mock(return_value=[])
+        self.reconciler.dbFindIssues = Mock(return_value=[])
+        self.reconciler.dbSaveResults = Mock()
+
+    def tearDown(self):
+        self.tempDir.cleanup()
+
+    def test_reconciler_filespecToPattern(self):
+        pattern = filespecToPattern('/var/carbonDVR/bif/recording_{recordingID}.bif')
+        self.assertTrue(pattern.match('recording_123.bif'))
+        self.assertFalse(pattern.match('recording_123.bif.tmp'))
+        self.assertFalse(pattern.match('recording_abc.bif'))
+        self.assertFalse(pattern.match('recording_123xbif'))
+
+    def test_reconciler_firstScan(self):
+        self.reconciler.dbGetCheckpoint = Mock(return_value=None)
+        self.reconciler.reconcile()
+        # only files matching the filespec are considered, and all of them are new
+        args = self.reconciler.dbFindIssues.call_args[0]
+        self.assertEqual(self.directory, args[0])
+        self.assertEqual(sorted(args[1]), [os.path.join(self.directory, '1.mp4'), os.path.join(self.directory, '2.mp4')])
+        self.assertEqual(sorted(args[2]), [os.path.join(self.directory, '1.mp4'), os.path.join(self.directory, '2.mp4')])
+        self.assertEqual(os.stat(self.directory).st_mtime, self.reconciler.dbSaveResults.call_args[0][3])
+
+    def test_reconciler_directoryUnchanged(self):
+        self.reconciler.dbGetCheckpoint = Mock(return_value=Bunch(directoryMtime=os.stat(self.directory).st_mtime, entryCtime=0))
+        self.reconciler.reconcile()
+        self.assertFalse(self.reconciler.dbFindIssues.called)
+        self.assertFalse(self.reconciler.dbSaveResults.called)
+
+    def test_reconciler_incrementalScan(self):
+        # given: a checkpoint newer than every file, and one file previously found to be unreferenced
+        self.reconciler.dbGetCheckpoint = Mock(return_value=Bunch(directoryMtime=0, entryCtime=os.stat(self.directory).st_ctime + 1))
+        self.reconciler.dbGetUnreferencedFiles.return_value = [os.path.join(self.directory, '2.mp4'), os.path.join(self.directory, '3.mp4')]
+        self.reconciler.reconcile()
+        # then: only the previously unreferenced file that still exists is checked again
+        args = self.reconciler.dbFindIssues.call_args[0]
+        self.assertEqual(2, len(args[1]))
+        self.assertEqual(args[2], [os.path.join(self.directory, '2.mp4')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,2 @@
+from dbPool.dbPool import DBPool
+from dbPool.queryLog import QueryLog
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3.4
+
+import contextlib
+import logging
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+import re
+import threading
+import time
+
+import metrics
+from dbPool.queryLog import QueryLog
+
+
+class Bunch:
+    def __init__(self, **kwds):
+        self.__dict__.update(kwds)
+
+
+#
+# Notes on the connection pool
+#
+# psycopg2 connections can be shared between threads, but transactions can't: a commit() from one thread commits
+# whatever every other thread has done on the same connection, and a long transaction (e.g. the listings import)
+# holds up everyone else.  So, every thread borrows a connection of its own for the duration of a unit of work:
+#
+#     with self.dbPool.connection('upcoming_recordings') as dbConnection:
+#         with dbConnection.cursor() as cursor:
+#             cursor.execute(...)
+#
+# On a clean exit from the block, the transaction is committed; if the block raises, it's rolled back.  Either way,
+# the connection goes back to the pool.  Don't nest connection() blocks (borrowing a second connection while holding
+# one), or a busy pool can deadlock.
+#
+# psycopg2's ThreadedConnectionPool raises PoolError when all of its connections are in use; here, a semaphore makes
+# callers wait (up to 'checkoutTimeout' seconds) for a connection to be returned instead.
+#
+# Each connection's search_path and timezone are set at connect time, so they survive reconnects.
+#
+# ThreadedConnectionPool closes a returned connection, rather than keeping it, if it already has 'minconn' idle
+# connections; so minconn is set to maxConnections, or most checkouts would open a new connection.
+#
+# Frequently-run queries can be registered with prepare(), and run with executePrepared().  Each statement is
+# PREPAREd (parsed and planned) on a connection the first time it's run there, and EXECUTEd from then on.
+#
+# Query times go to the carbondvr_db_query_seconds metric: prepared statements' under their names, and, for
+# connection() blocks that are given a name, the time the connection was held (which, for a block that runs a single
+# query, is that query's time).
+#
+# Pool connections' cursors are TimedCursors, which time each query, and record it in the pool's query log (see
+# queryLog.py) under the name of the connection() block; slow queries are logged with their EXPLAIN plans.  So, name
+# every connection() block.
+#
+
+QUERY_SECONDS = metrics.Histogram('carbondvr_db_query_seconds', 'Database query time, by query name', ['query'])
+POOL_CONNECTIONS = metrics.Gauge('carbondvr_db_pool_connections', 'Database connections, by state', ['state'])
+POOL_CHECKOUTS = metrics.Counter('carbondvr_db_pool_checkouts_total', 'Database connection checkouts, by outcome', ['outcome'])
+
+EXPLAINABLE_PATTERN = re.compile(r'\s*(SELECT|INSERT|UPDATE|DELETE|WITH|EXECUTE)\b', re.IGNORECASE)
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        queryLog = getattr(self.connection, 'queryLog', None)
+        if queryLog is None:
+            return super().execute(query, vars)
+        startTime = time.monotonic()
+        result = super().execute(query, vars)
+        queryLog.record(self.connection.queryName, query, time.monotonic() - startTime, lambda: self.explain(query, vars))
+        return result
+
+    # returns the query's plan, or None; a separate cursor is used, so as not to disturb this one's results
+    def explain(self, query, vars):
+        if isinstance(query, bytes):
+            query = query.decode(psycopg2.extensions.encodings[self.connection.encoding])
+        if not isinstance(query, str) or not EXPLAINABLE_PATTERN.match(query):
+            return None
+        with self.connection.cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+            # a failed EXPLAIN mustn't abort the caller's transaction
+            savepoint = not self.connection.autocommit
+            try:
+                if savepoint:
+                    cursor.execute('SAVEPOINT explain_query')
+                cursor.execute('EXPLAIN ' + query, vars)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+                if savepoint:
+                    cursor.execute('RELEASE SAVEPOINT explain_query')
+                return plan
+            except psycopg2.Error as e:
+                if savepoint:
+                    cursor.execute('ROLLBACK TO SAVEPOINT explain_query')
+                return 'EXPLAIN failed: {}'.format(e)
+
+
+# the pool's connections; connection() sets queryName and queryLog on checkout
+class TimedConnection(psycopg2.extensions.connection):
+    def __init__(self, *args, **kwds):
+        super().__init__(*args, **kwds)
+        self.cursor_factory = TimedCursor
+        self.queryName = None
+        self.queryLog = None
+
+
+class DBPool:
+    def __init__(self, dbConnectString, schema=None, maxConnections=8, checkoutTimeout=30, slowQueryThreshold=0.5):
+        self.logger = logging.getLogger(__name__)
+        self.maxConnections = maxConnections
+        self.checkoutTimeout = checkoutTimeout
+        options = '-c timezone=UTC'
+        if schema is not None:
+            options += ' -c search_path={}'.format(schema)
+        self.pool = psycopg2.pool.ThreadedConnectionPool(maxConnections, maxConnections, dbConnectString, options=options,
+                                                         connection_factory=TimedConnection)
+        self.queryLog = QueryLog(slowQueryThreshold)
+        self.semaphore = threading.BoundedSemaphore(maxConnections)
+        self.statsLock = threading.Lock()
+        self.statements = {}                # name -> (query, number of parameters)
+        self.preparedStatements = {}        # id(connection) -> set of names prepared on that connection
+        self.inUse = 0
+        self.peakInUse = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.totalWaitTime = 0.0
+        self.maxWaitTime = 0.0
+        self.totalHoldTime = 0.0
+        self.maxHoldTime = 0.0
+        self.logger.debug("Pool size: {} connections".format(maxConnections))
+
+    # 'name' is used to record the time the connection is held, in carbondvr_db_query_seconds, and its queries' times,
+    # in the query log
+    @contextlib.contextmanager
+    def connection(self, name=None):
+        startTime = time.monotonic()
+        if not self.semaphore.acquire(blocking=False):
+            with self.statsLock:
+                self.waits += 1
+            POOL_CHECKOUTS.labels(outcome='waited').inc()
+            if not self.semaphore.acquire(timeout=self.checkoutTimeout):
+                with self.statsLock:
+                    self.timeouts += 1
+                POOL_CHECKOUTS.labels(outcome='timedOut').inc()
+                raise psycopg2.pool.PoolError('Timed out waiting for a database connection')
+        try:
+            dbConnection = self.pool.getconn()
+        except:
+            self.semaphore.release()
+            raise
+        dbConnection.queryName = name
+        dbConnection.queryLog = self.queryLog
+        checkoutTime = time.monotonic()
+        with self.statsLock:
+            self.checkouts += 1
+            self.inUse += 1
+            self.peakInUse = max(self.peakInUse, self.inUse)
+            self.totalWaitTime += checkoutTime - startTime
+            self.maxWaitTime = max(self.maxWaitTime, checkoutTime - startTime)
+        POOL_CHECKOUTS.labels(outcome='total').inc()
+        try:
+            yield dbConnection
+            dbConnection.commit()
+        except:
+            if not dbConnection.closed:
+                dbConnection.rollback()
+            raise
+        finally:
+            holdTime = time.monotonic() - checkoutTime
+            if name is not None:
+                QUERY_SECONDS.labels(query=name).observe(holdTime)
+            with self.statsLock:
+                self.inUse -= 1
+                self.totalHoldTime += holdTime
+                self.maxHoldTime = max(self.maxHoldTime, holdTime)
+            self.pool.putconn(dbConnection, close=bool(dbConnection.closed))
+            if dbConnection.closed:
+                with self.statsLock:
+                    self.preparedStatements.pop(id(dbConnection), None)
+            self.semaphore.release()
+
+    # registers a query to be run with executePrepared(); parameters are written as $1, $2, ...
+    def prepare(self, name, query, numParameters):
+        self.statements[name] = (query, numParameters)
+
+    def executePrepared(self, dbConnection, cursor, name, parameters):
+        query, numParameters = self.statements[name]
+        with self.statsLock:
+            prepared = self.preparedStatements.setdefault(id(dbConnection), set())
+        if name not in prepared:
+            cursor.execute('PREPARE {} AS {}'.format(name, query))
+            prepared.add(name)
+        with QUERY_SECONDS.labels(query=name).time():
+            cursor.execute('EXECUTE {} ({})'.format(name, ', '.join(['%s'] * numParameters)), parameters)
+
+    def getStats(self):
+        with self.statsLock:
+            checkouts = self.checkouts
+            return Bunch(maxConnections=self.maxConnections,
+                         inUse=self.inUse,
+                         idle=len(self.pool._pool),
+                         peakInUse=self.peakInUse,
+                         utilization=self.inUse / self.maxConnections,
+                         checkouts=checkouts,
+                         waits=self.waits,
+                         timeouts=self.timeouts,
+                         averageWaitTime=self.totalWaitTime / checkouts if checkouts else 0.0,
+                         maxWaitTime=self.maxWaitTime,
+                         averageHoldTime=self.totalHoldTime / checkouts if checkouts else 0.0,
+                         maxHoldTime=self.maxHoldTime)
+
+    # a collect handler (see metrics.Registry.addCollectHandler)
+    def collectMetrics(self):
+        stats = self.getStats()
+        POOL_CONNECTIONS.labels(state='inUse').set(stats.inUse)
+        POOL_CONNECTIONS.labels(state='idle').set(stats.idle)
+        POOL_CONNECTIONS.labels(state='max').set(stats.maxConnections)
+
+    def close(self):
+        self.pool.closeall()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3.4
+
+import collections
+import datetime
+import logging
+import pytz
+import re
+import threading
+
+
+class Bunch:
+    def __init__(self, **kwds):
+        self.__dict__.update(kwds)
+
+
+#
+# Notes on the query log
+#
+# Every query run on a pool connection is timed (see TimedCursor, in dbPool.py), and recorded here, under the name
+# of the connection() block it was run in, and its SQL.  The SQL is normalized (whitespace collapsed, and literals
+# replaced with '?'), so that e.g. each page of a multi-row INSERT built by execute_values() isn't a query of its own.
+#
+# For each query, the number of runs, their total and maximum time, and the number that were slow are kept, for the
+# Query Stats page.  A query that takes longer than 'slowQueryThreshold' seconds is logged, together with its EXPLAIN
+# plan, and the most recent 'maxSlowQueries' of them are kept for the page.  EXPLAIN (without ANALYZE) doesn't run
+# the query, so it's cheap, but the plan is only that of the query as it would run now, which may not be what made it
+# slow (e.g. if it was waiting for a lock).
+#
+# Each process keeps its own log: when the recorder runs in a process of its own (CARBONDVR_ROLE=worker), its queries
+# are logged (to its log file), but they aren't on the web server's page.
+#
+
+LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+VALUES_LIST_PATTERN = re.compile(r'(\([?, ]*\))(?:\s*,\s*\([?, ]*\))+')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+def normalizeQuery(query):
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    query = WHITESPACE_PATTERN.sub(' ', str(query)).strip()
+    query = LITERAL_PATTERN.sub('?', query)
+    return VALUES_LIST_PATTERN.sub(r'\1, ...', query)
+
+
+class QueryLog:
+    def __init__(self, slowQueryThreshold=0.5, maxSlowQueries=50):
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.slowQueryThreshold = slowQueryThreshold
+        self.queries = {}       # (name, normalized query) -> Bunch of stats
+        self.slowQueries = collections.deque(maxlen=maxSlowQueries)
+
+    # 'explain' is called (with no arguments) if the query was slow, and returns its plan, or None
+    def record(self, name, query, elapsed, explain=None):
+        name = name or '(unnamed)'
+        query = normalizeQuery(query)
+        slow = elapsed >= self.slowQueryThreshold
+        with self.lock:
+            stats = self.queries.get((name, query))
+            if stats is None:
+                stats = self.queries[(name, query)] = Bunch(name=name, query=query, count=0, totalTime=0.0, maxTime=0.0, slowCount=0)
+            stats.count += 1
+            stats.totalTime += elapsed
+            stats.maxTime = max(stats.maxTime, elapsed)
+            if slow:
+                stats.slowCount += 1
+        if not slow:
+            return
+        plan = explain() if explain is not None else None
+        self.logger.warning('Slow query {} ({:.0f}ms): {}{}'.format(name, elapsed * 1000, query, '\n' + plan if plan else ''))
+        with self.lock:
+            self.slowQueries.appendleft(Bunch(time=datetime.datetime.now(pytz.utc), name=name, query=query, elapsed=elapsed, plan=plan))
+
+    # returns the queries' stats, the most time-consuming first
+    def getStats(self):
+        with self.lock:
+            queries = [Bunch(name=stats.name, query=stats.query, count=stats.count, totalTime=stats.totalTime,
+                             averageTime=stats.totalTime / stats.count, maxTime=stats.maxTime, slowCount=stats.slowCount)
+                       for stats in self.queries.values()]
+        return sorted(queries, key=lambda stats: stats.totalTime, reverse=True)
+
+    # returns the recent slow queries, newest first
+    def getSlowQueries(self):
+        with self.lock:
+            return list(self.slowQueries)
+
+    def reset(self):
+        with self.lock:
+            self.queries.clear()
+            self.slowQueries.clear()
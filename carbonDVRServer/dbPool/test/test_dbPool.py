@@ -0,0 +1,102 @@
+import psycopg2.pool
+import threading
+import unittest
+from dbPool import DBPool
+from dbPool.dbPool import TimedConnection
+from unittest.mock import Mock, call, patch
+
+
+class TestDBPool(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch('psycopg2.pool.ThreadedConnectionPool')
+        self.poolClass = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.connection = Mock(closed=0)
+        self.poolClass.return_value.getconn.return_value = self.connection
+        self.poolClass.return_value._pool = []
+        self.dbPool = DBPool('dbname=test', 'carbon', maxConnections=2, checkoutTimeout=0.1)
+
+    def test_dbPool_connectOptions(self):
+        self.poolClass.assert_called_once_with(2, 2, 'dbname=test', options='-c timezone=UTC -c search_path=carbon',
+                                               connection_factory=TimedConnection)
+
+    def test_dbPool_queryName(self):
+        with self.dbPool.connection('recent_recordings') as dbConnection:
+            self.assertEqual('recent_recordings', dbConnection.queryName)
+            self.assertIs(self.dbPool.queryLog, dbConnection.queryLog)
+        with self.dbPool.connection() as dbConnection:
+            self.assertIsNone(dbConnection.queryName)
+
+    def test_dbPool_commit(self):
+        with self.dbPool.connection() as dbConnection:
+            self.assertIs(self.connection, dbConnection)
+            self.assertEqual(1, self.dbPool.getStats().inUse)
+        self.connection.commit.assert_called_once_with()
+        self.assertFalse(self.connection.rollback.called)
+        self.poolClass.return_value.putconn.assert_called_once_with(self.connection, close=False)
+        stats = self.dbPool.getStats()
+        self.assertEqual(0, stats.inUse)
+        self.assertEqual(1, stats.peakInUse)
+        self.assertEqual(1, stats.checkouts)
+
+    def test_dbPool_rollback(self):
+        with self.assertRaises(ValueError):
+            with self.dbPool.connection():
+                raise ValueError()
+        self.assertFalse(self.connection.commit.called)
+        self.connection.rollback.assert_called_once_with()
+        self.poolClass.return_value.putconn.assert_called_once_with(self.connection, close=False)
+        self.assertEqual(0, self.dbPool.getStats().inUse)
+
+    def test_dbPool_closedConnectionIsDiscarded(self):
+        with self.assertRaises(psycopg2.OperationalError):
+            with self.dbPool.connection():
+                self.connection.closed = 2
+                raise psycopg2.OperationalError()
+        self.assertFalse(self.connection.rollback.called)
+        self.poolClass.return_value.putconn.assert_called_once_with(self.connection, close=True)
+
+    def test_dbPool_executePrepared(self):
+        self.dbPool.prepare('get_recording', 'SELECT * FROM recording WHERE recording_id = $1', 1)
+        cursor = Mock()
+        self.dbPool.executePrepared(self.connection, cursor, 'get_recording', (5, ))
+        self.dbPool.executePrepared(self.connection, cursor, 'get_recording', (6, ))
+        self.assertEqual([call('PREPARE get_recording AS SELECT * FROM recording WHERE recording_id = $1'),
+                          call('EXECUTE get_recording (%s)', (5, )),
+                          call('EXECUTE get_recording (%s)', (6, ))], cursor.execute.call_args_list)
+        # a new connection has to prepare it again
+        cursor = Mock()
+        self.dbPool.executePrepared(Mock(), cursor, 'get_recording', (7, ))
+        self.assertEqual(2, cursor.execute.call_count)
+
+    def test_dbPool_waitsWhenExhausted(self):
+        acquired = threading.Barrier(3)
+        released = threading.Event()
+        def holdConnection():
+            with self.dbPool.connection():
+                acquired.wait()
+                released.wait()
+        holders = [threading.Thread(target=holdConnection) for i in range(2)]
+        for holder in holders:
+            holder.start()
+        acquired.wait()
+        try:
+            with self.assertRaises(psycopg2.pool.PoolError):
+                with self.dbPool.connection():
+                    pass
+        finally:
+            released.set()
+            for holder in holders:
+                holder.join()
+        stats = self.dbPool.getStats()
+        self.assertEqual(1, stats.waits)
+        self.assertEqual(1, stats.timeouts)
+        self.assertEqual(2, stats.checkouts)
+        with self.dbPool.connection():
+            pass
+        self.assertEqual(3, self.dbPool.getStats().checkouts)
+
+
+if __name__ == '__main__':
+    unittest.main()
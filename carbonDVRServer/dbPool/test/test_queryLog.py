@@ -0,0 +1,49 @@
+import unittest
+from dbPool import QueryLog
+from dbPool.queryLog import normalizeQuery
+from unittest.mock import Mock
+
+
+class TestQueryLog(unittest.TestCase):
+
+    def test_queryLog_normalizeQuery(self):
+        self.assertEqual('SELECT name FROM show WHERE show_id = %s', normalizeQuery('SELECT name\n    FROM show\n    WHERE show_id = %s'))
+        self.assertEqual("UPDATE recording SET category_code = ? WHERE recording_id = ?", normalizeQuery("UPDATE recording SET category_code = 'A''s' WHERE recording_id = 12"))
+        self.assertEqual('INSERT INTO playback_position (recording_id, position) VALUES (?,?), ... ON CONFLICT DO NOTHING',
+                         normalizeQuery(b'INSERT INTO playback_position (recording_id, position) VALUES (1,20),(2,30), (3,40) ON CONFLICT DO NOTHING'))
+        self.assertEqual('SELECT * FROM file_raw_video', normalizeQuery('SELECT * FROM file_raw_video'))
+
+    def test_queryLog_stats(self):
+        queryLog = QueryLog(slowQueryThreshold=1.0)
+        queryLog.record('recent_recordings', 'SELECT * FROM recording WHERE recording_id = 1', 0.2)
+        queryLog.record('recent_recordings', 'SELECT * FROM recording WHERE recording_id = 2', 0.4)
+        queryLog.record(None, 'SELECT 1', 0.1)
+        stats = queryLog.getStats()
+        self.assertEqual(['recent_recordings', '(unnamed)'], [query.name for query in stats])
+        self.assertEqual('SELECT * FROM recording WHERE recording_id = ?', stats[0].query)
+        self.assertEqual(2, stats[0].count)
+        self.assertAlmostEqual(0.3, stats[0].averageTime)
+        self.assertAlmostEqual(0.4, stats[0].maxTime)
+        self.assertEqual(0, stats[0].slowCount)
+        self.assertEqual([], queryLog.getSlowQueries())
+        queryLog.reset()
+        self.assertEqual([], queryLog.getStats())
+
+    def test_queryLog_slowQuery(self):
+        queryLog = QueryLog(slowQueryThreshold=1.0, maxSlowQueries=2)
+        explain = Mock(return_value='Seq Scan on schedule')
+        queryLog.record('upcoming_recordings', 'SELECT * FROM schedule', 0.5, explain)
+        self.assertFalse(explain.called)
+        with self.assertLogs('dbPool.queryLog', 'WARNING') as logs:
+            for i in range(3):
+                queryLog.record('upcoming_recordings', 'SELECT * FROM schedule', 1.5, explain)
+        self.assertIn('Seq Scan on schedule', logs.output[0])
+        self.assertEqual(3, explain.call_count)
+        slowQueries = queryLog.getSlowQueries()
+        self.assertEqual(2, len(slowQueries))
+        self.assertEqual('Seq Scan on schedule', slowQueries[0].plan)
+        self.assertEqual(3, queryLog.getStats()[0].slowCount)
+
+
+if __name__ == '__main__':
+    unittest.main()
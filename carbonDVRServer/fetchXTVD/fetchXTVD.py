@@ -111,11 +111,14 @@ def buildXTVDSoapRequest(startDatetime, endDatetime):
     return strSoap
 
 
+XTVD_SERVICE_URL = 'http://dd.schedulesdirect.org/schedulesdirect/tvlistings/xtvdService'
+
+
 def fetchXTVD(username,
              password,
              startDatetime,
              endDatetime,
-             URL='http://dd.schedulesdirect.org/schedulesdirect/tvlistings/xtvdService'):
+             URL=XTVD_SERVICE_URL):
     soapRequest = buildXTVDSoapRequest(startDatetime, endDatetime)
     # do we need to pass in an accept-encoding header for gzip? # headers = { 'Accept-encoding' : 'gzip'}
     response = requests.put(URL, data=soapRequest, auth=HTTPBasicAuth(username,password), stream=True)
@@ -127,14 +130,15 @@ def fetchXTVDtoFile(username,
              password,
              filename,
              predays=0,
-             postdays=14):
+             postdays=14,
+             URL=XTVD_SERVICE_URL):
     logger = logging.getLogger(__name__)
     currentTime = datetime.now(timezone.utc)
     startDatetime = currentTime + timedelta(days=predays)
     endDatetime = currentTime + timedelta(days=postdays)
     logger.info('Retrieving DataDirect TV schedules')
     with open(filename,'wb') as outfile:
-        for chunk in fetchXTVD(username, password, startDatetime, endDatetime):
+        for chunk in fetchXTVD(username, password, startDatetime, endDatetime, URL):
             outfile.write(chunk)
     logger.info('Retrieval complete')
 
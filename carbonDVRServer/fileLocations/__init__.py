@@ -1 +1,3 @@
 from fileLocations.fileLocations import FileLocations
+from fileLocations.fileLocations import FileLocationsError
+from fileLocations.fileLocations import HLS_MASTER_PLAYLIST
@@ -1,56 +1,208 @@
 #!/usr/bin/env python3.4
 
 import json
+import logging
+import os.path
+import shutil
+import string
+
+import metrics
+
+
+#
+# Notes on the file locations config
+#
+# CARBONDVR_FILE_LOCATIONS is a JSON document of the form:
+#     {"fileLocations": {
+#         "rawVideo":        [ {"id": 1, "filespec": "/var/carbonDVR/raw/{recordingID}.ts"} ],
+#         "transcodedVideo": [ {"id": 1, "tier": "fast", "minFreeBytes": 10000000000,
+#                               "filespec": "/ssd/video/{recordingID}.mp4", "url": "http://dvr/video/{recordingID}.mp4"},
+#                              {"id": 2, "tier": "bulk",
+#                               "filespec": "/hdd/video/{recordingID}.mp4", "url": "http://dvr/bulk/video/{recordingID}.mp4"} ],
+#         "bif":             [ ... same as transcodedVideo ... ],
+#         "hls":             [ {"id": 1, "filespec": "/ssd/hls/{recordingID}", "url": "http://dvr/hls/1/{recordingID}"} ] }}
+#
+# 'id' and 'filespec' are required, and 'url' is required for transcodedVideo, bif and hls.  hls locations are
+# optional; an hls filespec and url name a directory per recording, which holds the master playlist (master.m3u8),
+# and the rendition playlists and segments.  The only field allowed in a
+# filespec or url is {recordingID}.  'tier' and 'minFreeBytes' are optional.
+#
+# The urls can point at any web server that serves the files, or at carbonDVR's own media server (see
+# mediaServer.py), e.g. "http://dvr:8090/transcodedVideo/1/{recordingID}.mp4" for transcodedVideo location 1.
+#
+# Placement: when something new is written, chooseLocation() picks the first location (in config order, optionally
+# restricted to one tier) whose volume has at least 'minFreeBytes' free.  So, list the fast storage first.
+#
+
+LOCATION_KINDS = ('rawVideo', 'transcodedVideo', 'bif', 'hls')
+KINDS_WITH_URLS = ('transcodedVideo', 'bif', 'hls')
+HLS_MASTER_PLAYLIST = 'master.m3u8'
+
+
+LOCATION_FREE_BYTES = metrics.Gauge('carbondvr_location_free_bytes', 'Free space on each file location\'s volume', ['kind', 'location'])
+LOCATION_TOTAL_BYTES = metrics.Gauge('carbondvr_location_total_bytes', 'Size of each file location\'s volume', ['kind', 'location'])
+
+
+class FileLocationsError(Exception):
+    pass
+
+
+# a filespec or URL, parsed once, so that expanding it is just a join
+class Template:
+    def __init__(self, template):
+        self.template = template
+        self.literals = []    # the text between each {recordingID}
+        self.isSimple = True
+        literal = ''
+        for literalText, fieldName, formatSpec, conversion in string.Formatter().parse(template):
+            literal += literalText
+            if fieldName is None:
+                continue
+            if fieldName != 'recordingID':
+                raise FileLocationsError('Unsupported field "{{{}}}" in "{}"'.format(fieldName, template))
+            if formatSpec or conversion:
+                self.isSimple = False
+            self.literals.append(literal)
+            literal = ''
+        self.literals.append(literal)
+
+    def expand(self, recordingID):
+        if not self.isSimple:
+            return self.template.format(recordingID=recordingID)
+        return str(recordingID).join(self.literals)
+
+
+class Location:
+    def __init__(self, kind, entry):
+        if not isinstance(entry, dict):
+            raise FileLocationsError('{} location must be an object: {}'.format(kind, entry))
+        if not isinstance(entry.get('id'), int):
+            raise FileLocationsError('{} location has a missing or non-integer id: {}'.format(kind, entry))
+        if not isinstance(entry.get('filespec'), str):
+            raise FileLocationsError('{} location {} has no filespec'.format(kind, entry['id']))
+        if kind in KINDS_WITH_URLS and not isinstance(entry.get('url'), str):
+            raise FileLocationsError('{} location {} has no url'.format(kind, entry['id']))
+        self.kind = kind
+        self.id = entry['id']
+        self.tier = entry.get('tier')
+        self.minFreeBytes = int(entry.get('minFreeBytes', 0))
+        self.filespec = Template(entry['filespec'])
+        self.url = Template(entry['url']) if 'url' in entry else None
+        self.directory = os.path.dirname(entry['filespec'])
+
+    def hasSpace(self):
+        if self.minFreeBytes <= 0:
+            return True
+        try:
+            return shutil.disk_usage(self.directory).free >= self.minFreeBytes
+        except OSError:
+            return False
+
 
 class FileLocations:
     def __init__(self, locationString):
-        fileLocationsJson = json.loads(locationString)
-        if 'fileLocations' in fileLocationsJson:
-            self.fileLocations = fileLocationsJson['fileLocations']
+        self.logger = logging.getLogger(__name__)
+        try:
+            fileLocationsJson = json.loads(locationString)
+        except ValueError as e:
+            raise FileLocationsError('File locations are not valid JSON: {}'.format(e))
+        if not isinstance(fileLocationsJson, dict) or not isinstance(fileLocationsJson.get('fileLocations'), dict):
+            raise FileLocationsError('File locations must contain a "fileLocations" object')
+        self.locationsByID = {}        # kind -> {id -> Location}, for lookups
+        self.locationsInOrder = {}     # kind -> [Location], in config order, for placement
+        for kind in LOCATION_KINDS:
+            self.locationsByID[kind] = {}
+            self.locationsInOrder[kind] = []
+        for kind, entries in fileLocationsJson['fileLocations'].items():
+            if kind not in LOCATION_KINDS:
+                raise FileLocationsError('Unknown file location kind "{}"'.format(kind))
+            if not isinstance(entries, list):
+                raise FileLocationsError('{} locations must be a list'.format(kind))
+            for entry in entries:
+                location = Location(kind, entry)
+                if location.id in self.locationsByID[kind]:
+                    raise FileLocationsError('Duplicate {} location id {}'.format(kind, location.id))
+                self.locationsByID[kind][location.id] = location
+                self.locationsInOrder[kind].append(location)
+
+    def getLocation(self, kind, locationID):
+        return self.locationsByID[kind].get(locationID)
 
     def getRawVideoFilespec(self, locationID, recordingID):
-        try:
-            for location in self.fileLocations['rawVideo']:
-                if location['id'] == locationID:
-                    return location['filespec'].format(recordingID = recordingID)
-            return ''
-        except:
+        location = self.locationsByID['rawVideo'].get(locationID)
+        if location is None:
             return ''
+        return location.filespec.expand(recordingID)
 
     def getTranscodedVideoFilespec(self, locationID, recordingID):
-        try:
-            for location in self.fileLocations['transcodedVideo']:
-                if location['id'] == locationID:
-                    return location['filespec'].format(recordingID = recordingID)
-            return ''
-        except:
+        location = self.locationsByID['transcodedVideo'].get(locationID)
+        if location is None:
             return ''
+        return location.filespec.expand(recordingID)
 
     def getTranscodedVideoURL(self, locationID, recordingID):
-        try:
-            for location in self.fileLocations['transcodedVideo']:
-                if location['id'] == locationID:
-                    return location['url'].format(recordingID = recordingID)
-            return ''
-        except:
+        location = self.locationsByID['transcodedVideo'].get(locationID)
+        if location is None:
             return ''
+        return location.url.expand(recordingID)
 
     def getBifFilespec(self, locationID, recordingID):
-        try:
-            for location in self.fileLocations['bif']:
-                if location['id'] == locationID:
-                    return location['filespec'].format(recordingID = recordingID)
-            return ''
-        except:
+        location = self.locationsByID['bif'].get(locationID)
+        if location is None:
             return ''
+        return location.filespec.expand(recordingID)
 
     def getBifURL(self, locationID, recordingID):
-        try:
-            for location in self.fileLocations['bif']:
-                if location['id'] == locationID:
-                    return location['url'].format(recordingID = recordingID)
+        location = self.locationsByID['bif'].get(locationID)
+        if location is None:
+            return ''
+        return location.url.expand(recordingID)
+
+    def getHlsDirectory(self, locationID, recordingID):
+        location = self.locationsByID['hls'].get(locationID)
+        if location is None:
             return ''
-        except:
+        return location.filespec.expand(recordingID)
+
+    # the URL of the master playlist
+    def getHlsURL(self, locationID, recordingID):
+        location = self.locationsByID['hls'].get(locationID)
+        if location is None:
             return ''
+        return location.url.expand(recordingID) + '/' + HLS_MASTER_PLAYLIST
+
+    def getLocationIDs(self, kind, tier=None):
+        return [location.id for location in self.locationsInOrder[kind] if tier is None or location.tier == tier]
+
+    # placement policy: returns the ID of the location that new files of type 'kind' should be written to,
+    # or None if there are no locations of that kind (or tier)
+    def chooseLocation(self, kind, tier=None):
+        candidates = [location for location in self.locationsInOrder[kind] if tier is None or location.tier == tier]
+        if not candidates:
+            return None
+        for location in candidates:
+            if location.hasSpace():
+                return location.id
+        self.logger.warning('No {} location has enough free space, using location {}'.format(kind, candidates[0].id))
+        return candidates[0].id
+
+    def getFilespecs(self):
+        filespecs = set()
+        for locations in self.locationsInOrder.values():
+            for location in locations:
+                filespecs.add(location.filespec.template)
+        return filespecs
 
+    # a collect handler (see metrics.Registry.addCollectHandler)
+    def collectMetrics(self):
+        for kind, locations in self.locationsInOrder.items():
+            for location in locations:
+                try:
+                    usage = shutil.disk_usage(location.directory)
+                except OSError:
+                    continue
+                LOCATION_FREE_BYTES.labels(kind=kind, location=location.id).set(usage.free)
+                LOCATION_TOTAL_BYTES.labels(kind=kind, location=location.id).set(usage.total)
 
+    def getDirectories(self):
+        return set([os.path.dirname(filespec) for filespec in self.getFilespecs()])
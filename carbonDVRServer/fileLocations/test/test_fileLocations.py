@@ -0,0 +1,68 @@
+import json
+import unittest
+from fileLocations.fileLocations import FileLocations, FileLocationsError
+from unittest.mock import patch
+
+
+class Bunch:
+    def __init__(self, **kwds):
+        self.__dict__.update(kwds)
+
+
+def makeConfig(**kinds):
+    return json.dumps({'fileLocations': kinds})
+
+
+class TestFileLocations(unittest.TestCase):
+
+    def setUp(self):
+        self.config = makeConfig(
+            rawVideo=[{'id': 1, 'filespec': '/raw/{recordingID}.ts'}],
+            transcodedVideo=[{'id': 1, 'tier': 'fast', 'minFreeBytes': 1000, 'filespec': '/ssd/video/{recordingID}.mp4', 'url': 'http://dvr/ssd/{recordingID}.mp4'},
+                             {'id': 2, 'tier': 'bulk', 'filespec': '/hdd/video/{recordingID}.mp4', 'url': 'http://dvr/hdd/{recordingID}.mp4'}],
+            bif=[{'id': 3, 'filespec': '/bif/{recordingID:06d}.bif', 'url': 'http://dvr/bif/{recordingID:06d}.bif'}],
+            hls=[{'id': 1, 'filespec': '/ssd/hls/{recordingID}', 'url': 'http://dvr/hls/1/{recordingID}'}])
+
+    def test_fileLocations_lookups(self):
+        fileLocations = FileLocations(self.config)
+        self.assertEqual('/raw/42.ts', fileLocations.getRawVideoFilespec(1, 42))
+        self.assertEqual('/hdd/video/42.mp4', fileLocations.getTranscodedVideoFilespec(2, 42))
+        self.assertEqual('http://dvr/ssd/42.mp4', fileLocations.getTranscodedVideoURL(1, 42))
+        self.assertEqual('/bif/000042.bif', fileLocations.getBifFilespec(3, 42))
+        self.assertEqual('http://dvr/bif/000042.bif', fileLocations.getBifURL(3, 42))
+        self.assertEqual('/ssd/hls/42', fileLocations.getHlsDirectory(1, 42))
+        self.assertEqual('http://dvr/hls/1/42/master.m3u8', fileLocations.getHlsURL(1, 42))
+        # unknown locations
+        self.assertEqual('', fileLocations.getTranscodedVideoURL(7, 42))
+        self.assertEqual('', fileLocations.getBifURL(1, 42))
+        self.assertEqual('', fileLocations.getHlsURL(2, 42))
+
+    def test_fileLocations_invalidConfig(self):
+        with self.assertRaises(FileLocationsError):
+            FileLocations('not json')
+        with self.assertRaises(FileLocationsError):
+            FileLocations(json.dumps({'somethingElse': {}}))
+        with self.assertRaises(FileLocationsError):
+            FileLocations(makeConfig(video=[]))
+        with self.assertRaises(FileLocationsError):
+            FileLocations(makeConfig(bif=[{'id': 1, 'filespec': '/bif/{recordingID}.bif'}]))    # no url
+        with self.assertRaises(FileLocationsError):
+            FileLocations(makeConfig(rawVideo=[{'id': 1, 'filespec': '/raw/{showID}.ts'}]))     # unsupported field
+        with self.assertRaises(FileLocationsError):
+            FileLocations(makeConfig(rawVideo=[{'id': 1, 'filespec': '/a/{recordingID}'}, {'id': 1, 'filespec': '/b/{recordingID}'}]))
+
+    def test_fileLocations_chooseLocation(self):
+        fileLocations = FileLocations(self.config)
+        with patch('fileLocations.fileLocations.shutil.disk_usage', return_value=Bunch(free=5000)):
+            self.assertEqual(1, fileLocations.chooseLocation('transcodedVideo'))
+            self.assertEqual(2, fileLocations.chooseLocation('transcodedVideo', tier='bulk'))
+        # the fast tier is full, so fall back to the next location
+        with patch('fileLocations.fileLocations.shutil.disk_usage', return_value=Bunch(free=10)):
+            self.assertEqual(2, fileLocations.chooseLocation('transcodedVideo'))
+            self.assertEqual(1, fileLocations.chooseLocation('transcodedVideo', tier='fast'))
+        self.assertIsNone(fileLocations.chooseLocation('transcodedVideo', tier='tape'))
+        self.assertEqual([2], fileLocations.getLocationIDs('transcodedVideo', tier='bulk'))
+
+
+if __name__ == '__main__':
+    unittest.main()
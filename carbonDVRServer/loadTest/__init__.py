@@ -0,0 +1 @@
+from loadTest.loadTest import discoverRecordingPaths, runLoadTest, formatReport
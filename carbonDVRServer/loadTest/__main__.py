@@ -0,0 +1,19 @@
+#!/usr/bin/env python3.4
+
+import argparse
+import loadTest
+import logging
+
+if __name__ == '__main__':
+    FORMAT = "%(asctime)-15s: %(name)s:  %(message)s"
+    logging.basicConfig(level=logging.INFO, format=FORMAT)
+
+    parser = argparse.ArgumentParser(description='Load test the Roku REST API (/shows and /recordings/<id>).')
+    parser.add_argument('-u', '--url', default='http://localhost:8080', help='base URL of the web server')
+    parser.add_argument('-c', '--concurrency', type=int, default=10, help='number of concurrent clients')
+    parser.add_argument('-d', '--duration', type=int, default=30, help='test duration, in seconds')
+    parser.add_argument('-r', '--recordings', type=int, default=100, help='maximum number of recordings to request')
+    args = parser.parse_args()
+
+    summary = loadTest.runLoadTest(args.url, args.concurrency, args.duration, args.recordings)
+    print(loadTest.formatReport(summary))
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3.4
+
+import http.client
+import logging
+import math
+import threading
+import time
+import urllib.parse
+import xml.etree.ElementTree as ElementTree
+
+
+class Bunch:
+    def __init__(self, **kwds):
+        self.__dict__.update(kwds)
+
+
+#
+# Notes on the load test
+#
+# Each client thread holds one keep-alive HTTP connection, and sends requests back-to-back (like a Roku that's being
+# scrolled through as fast as it'll go) until the test duration is up.  Half the requests are for the show list, and
+# half are for recording springboards, chosen round-robin from the recordings found by crawling the feeds.
+#
+# Latencies are measured from sending the request to reading the last byte of the response.
+#
+
+EPISODE_LIST_ATTRIBUTES = ('new_episode_list_url', 'rerun_episode_list_url', 'archived_episode_list_url')
+
+
+# nearest-rank percentile
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = max(0, math.ceil(p / 100 * len(values)) - 1)
+    return values[index]
+
+
+def fetch(connection, path):
+    connection.request('GET', path)
+    response = connection.getresponse()
+    return response.status, response.read()
+
+
+# crawls the show and episode feeds, and returns the paths of (up to 'maxRecordings') recording springboards
+def discoverRecordingPaths(connection, maxRecordings):
+    recordingPaths = []
+    status, body = fetch(connection, '/shows')
+    if status != 200:
+        raise RuntimeError('GET /shows returned {}'.format(status))
+    for show in ElementTree.fromstring(body).iter('show'):
+        for attribute in EPISODE_LIST_ATTRIBUTES:
+            url = show.get(attribute)
+            if url is None:
+                continue
+            status, body = fetch(connection, urllib.parse.urlsplit(url).path)
+            if status != 200:
+                continue
+            for episode in ElementTree.fromstring(body).iter('show'):
+                springboardURL = episode.get('springboard_url')
+                if springboardURL is not None:
+                    recordingPaths.append(urllib.parse.urlsplit(springboardURL).path)
+                if len(recordingPaths) >= maxRecordings:
+                    return recordingPaths
+    return recordingPaths
+
+
+class Client(threading.Thread):
+    def __init__(self, host, port, requests, deadline):
+        threading.Thread.__init__(self, daemon=True)
+        self.host = host
+        self.port = port
+        self.requests = requests    # list of (endpoint, path)
+        self.deadline = deadline
+        self.results = []           # list of (endpoint, latency, succeeded)
+
+    def run(self):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        index = 0
+        while time.monotonic() < self.deadline:
+            endpoint, path = self.requests[index % len(self.requests)]
+            index += 1
+            startTime = time.monotonic()
+            try:
+                status, body = fetch(connection, path)
+                succeeded = (status == 200)
+            except (http.client.HTTPException, OSError):
+                succeeded = False
+                connection.close()
+                connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            self.results.append((endpoint, time.monotonic() - startTime, succeeded))
+        connection.close()
+
+
+def runLoadTest(url, concurrency, duration, maxRecordings):
+    logger = logging.getLogger(__name__)
+    parsedURL = urllib.parse.urlsplit(url)
+    host = parsedURL.hostname
+    port = parsedURL.port or 80
+
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    recordingPaths = discoverRecordingPaths(connection, maxRecordings)
+    connection.close()
+    logger.info('Found {} recordings'.format(len(recordingPaths)))
+
+    requests = []
+    for recordingPath in recordingPaths or [None]:
+        requests.append(('/shows', '/shows'))
+        if recordingPath is not None:
+            requests.append(('/recordings/<id>', recordingPath))
+
+    logger.info('Running {} clients for {} seconds'.format(concurrency, duration))
+    startTime = time.monotonic()
+    deadline = startTime + duration
+    clients = []
+    for i in range(concurrency):
+        # stagger the starting points, so that the clients aren't all requesting the same recording
+        offset = (i * len(requests)) // concurrency
+        clients.append(Client(host, port, requests[offset:] + requests[:offset], deadline))
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.monotonic() - startTime
+
+    results = []
+    for client in clients:
+        results.extend(client.results)
+    return summarize(results, elapsed)
+
+
+def summarize(results, elapsed):
+    summary = []
+    for endpoint in sorted(set([result[0] for result in results])):
+        latencies = [result[1] for result in results if result[0] == endpoint]
+        errors = len([result for result in results if result[0] == endpoint and not result[2]])
+        summary.append(Bunch(endpoint=endpoint, requests=len(latencies), errors=errors, requestsPerSecond=len(latencies) / elapsed,
+                             p50=percentile(latencies, 50), p99=percentile(latencies, 99)))
+    return summary
+
+
+def formatReport(summary):
+    lines = ['{:<20} {:>10} {:>8} {:>10} {:>10} {:>10}'.format('Endpoint', 'Requests', 'Errors', 'Req/s', 'p50 (ms)', 'p99 (ms)')]
+    for row in summary:
+        lines.append('{:<20} {:>10} {:>8} {:>10.1f} {:>10.1f} {:>10.1f}'.format(row.endpoint, row.requests, row.errors, row.requestsPerSecond,
+                                                                              row.p50 * 1000, row.p99 * 1000))
+    return '\n'.join(lines)
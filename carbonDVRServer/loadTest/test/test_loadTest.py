@@ -0,0 +1,74 @@
+import http.client
+import http.server
+import socketserver
+import threading
+import unittest
+from loadTest.loadTest import discoverRecordingPaths, percentile, runLoadTest
+
+
+SHOWS = ('<shows>\n'
+         '<show title="Nova" new_episode_list_url="http://dvr:8080/shows/1/episodes/new" rerun_episode_list_url="http://dvr:8080/shows/1/episodes/rerun" ></show>'
+         '</shows>\n').encode()
+NEW_EPISODES = ('<shows>\n'
+                '<show springboard_url="http://dvr:8080/recordings/10" ></show><show springboard_url="http://dvr:8080/recordings/11" ></show>'
+                '</shows>\n').encode()
+RERUN_EPISODES = '<shows>\n<show springboard_url="http://dvr:8080/recordings/12" ></show></shows>\n'.encode()
+SPRINGBOARD = '<springboard>\n<show title="Nova" ></show></springboard>\n'.encode()
+
+
+class FeedHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    responses = {'/shows': SHOWS, '/shows/1/episodes/new': NEW_EPISODES, '/shows/1/episodes/rerun': RERUN_EPISODES}
+
+    def do_GET(self):
+        body = self.responses.get(self.path, SPRINGBOARD if self.path.startswith('/recordings/') else None)
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FeedServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class TestLoadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FeedServer(('127.0.0.1', 0), FeedHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_loadTest_percentile(self):
+        self.assertEqual(0.0, percentile([], 99))
+        self.assertEqual(98, percentile(list(range(100)), 99))
+        self.assertEqual(7, percentile([7], 99))
+        self.assertEqual(50, percentile(list(range(101)), 50))
+
+    def test_loadTest_discoverRecordingPaths(self):
+        connection = http.client.HTTPConnection('127.0.0.1', self.server.server_port)
+        self.assertEqual(['/recordings/10', '/recordings/11', '/recordings/12'], discoverRecordingPaths(connection, 10))
+        self.assertEqual(['/recordings/10', '/recordings/11'], discoverRecordingPaths(connection, 2))
+        connection.close()
+
+    def test_loadTest_runLoadTest(self):
+        summary = runLoadTest('http://127.0.0.1:{}'.format(self.server.server_port), 2, 0.5, 10)
+        self.assertEqual(['/recordings/<id>', '/shows'], [row.endpoint for row in summary])
+        for row in summary:
+            self.assertGreater(row.requests, 0)
+            self.assertEqual(0, row.errors)
+            self.assertGreaterEqual(row.p99, row.p50)
+
+
+if __name__ == '__main__':
+    unittest.main()
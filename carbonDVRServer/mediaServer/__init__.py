@@ -0,0 +1 @@
+from mediaServer.mediaServer import MediaServer
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3.4
+
+import email.utils
+import http.server
+import logging
+import os
+import re
+import select
+import socket
+import socketserver
+import threading
+
+
+#
+# Notes on the media server
+#
+# The Roku streams video and fetches BIF files from the URLs in CARBONDVR_FILE_LOCATIONS.  They can be served by any
+# web server, or by the media server, which listens on a port of its own (CARBONDVR_MEDIA_SERVER_PORT), so that
+# long-running streams don't tie up the threads that serve the REST API and the UI.  Each connection gets its own
+# thread; they spend nearly all of their time blocked in sendfile(), so many concurrent streams are cheap.
+#
+# Paths are of the form /<kind>/<locationID>/<recordingID>[.<extension>], where kind is transcodedVideo or bif, so a
+# file location's url would be e.g. "http://dvr:8090/transcodedVideo/1/{recordingID}.mp4".  The location ID is part
+# of the URL, so the file is found without a database lookup.  HLS files are served from
+# /hls/<locationID>/<recordingID>/<filename>, where filename is the master playlist (master.m3u8), or one of the
+# rendition playlists or segments next to it; so an hls location's url would be e.g. "http://dvr:8090/hls/1/{recordingID}".  When the migrator moves a recording to another
+# location, its URL changes too, so a given URL always refers to the same file, and responses can be cached.
+#
+# The Roku seeks with Range requests (a single range, "bytes=<first>-<last>", "bytes=<first>-" or "bytes=-<length>"),
+# which get a 206 with just that part of the file.  Multiple ranges aren't supported, and get the whole file, as the
+# HTTP spec allows.  A range that starts past the end of the file gets a 416.
+#
+# Responses carry a strong ETag (size and mtime).  If-None-Match is handled as RFC 7232 says: a list of tags, any of
+# which may be weak (W/"..."), compared weakly, or "*", which matches any file that exists.  If-Range is compared
+# strongly, so a weak tag there gets the whole file.
+#
+# The file is copied to the socket with os.sendfile() (zero-copy), falling back to read/write where that isn't
+# available.
+#
+# A connection that sends nothing (or won't take what it's sent) for IDLE_TIMEOUT seconds is closed, so idle
+# keep-alive connections don't each hold a thread forever.
+#
+
+CONTENT_TYPES = {'transcodedVideo': 'video/mp4', 'bif': 'application/octet-stream'}
+HLS_CONTENT_TYPES = {'.m3u8': 'application/vnd.apple.mpegurl', '.ts': 'video/mp2t', '.m4s': 'video/iso.segment', '.mp4': 'video/mp4'}
+PATH_PATTERN = re.compile(r'^/(transcodedVideo|bif)/(\d+)/(\d+)(\.\w+)?$')
+HLS_PATH_PATTERN = re.compile(r'^/hls/(\d+)/(\d+)/([\w-]+(\.\w+))$')
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+ETAG_PATTERN = re.compile(r'(?:W/)?("[^"]*")')
+CHUNK_SIZE = 1024 * 1024
+MAX_AGE = 86400
+IDLE_TIMEOUT = 60
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+# returns (first, last) for a satisfiable single range, or None to send the whole file; raises RangeNotSatisfiable
+def parseRange(rangeHeader, fileSize):
+    if rangeHeader is None:
+        return None
+    match = RANGE_PATTERN.match(rangeHeader.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first == '':
+        if last == '':
+            return None
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(0, fileSize - length), fileSize - 1
+    first = int(first)
+    last = fileSize - 1 if last == '' else min(int(last), fileSize - 1)
+    if first > last:
+        if first >= fileSize:
+            raise RangeNotSatisfiable()
+        return None
+    return first, last
+
+
+def makeETag(stat):
+    return '"{:x}-{:x}"'.format(stat.st_size, int(stat.st_mtime))
+
+
+# whether an If-None-Match header matches the (strong) etag, using the weak comparison
+def matchesETag(ifNoneMatch, etag):
+    if ifNoneMatch is None:
+        return False
+    if ifNoneMatch.strip() == '*':
+        return True
+    return etag in ETAG_PATTERN.findall(ifNoneMatch)
+
+
+class MediaRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'       # keep-alive, since the Roku makes a series of range requests while seeking
+    timeout = IDLE_TIMEOUT
+
+    def do_GET(self):
+        self.sendMedia(True)
+
+    def do_HEAD(self):
+        self.sendMedia(False)
+
+    # returns the content type and filespec for the request's path, or (None, None)
+    def getFilespec(self):
+        path = self.path.split('?', 1)[0]
+        match = HLS_PATH_PATTERN.match(path)
+        if match is not None:
+            contentType = HLS_CONTENT_TYPES.get(match.group(4))
+            directory = self.server.fileLocations.getHlsDirectory(locationID=int(match.group(1)), recordingID=int(match.group(2)))
+            if contentType is None or not directory:
+                return None, None
+            return contentType, os.path.join(directory, match.group(3))
+        match = PATH_PATTERN.match(path)
+        if match is None:
+            return None, None
+        kind, locationID, recordingID = match.group(1), int(match.group(2)), int(match.group(3))
+        if kind == 'transcodedVideo':
+            filespec = self.server.fileLocations.getTranscodedVideoFilespec(locationID=locationID, recordingID=recordingID)
+        else:
+            filespec = self.server.fileLocations.getBifFilespec(locationID=locationID, recordingID=recordingID)
+        return CONTENT_TYPES[kind], filespec
+
+    def sendMedia(self, sendBody):
+        contentType, filespec = self.getFilespec()
+        if not filespec:
+            self.send_error(404)
+            return
+        try:
+            mediaFile = open(filespec, 'rb')
+        except OSError:
+            self.send_error(404)
+            return
+        with mediaFile:
+            stat = os.fstat(mediaFile.fileno())
+            fileSize = stat.st_size
+            etag = makeETag(stat)
+            if matchesETag(self.headers.get('If-None-Match'), etag):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            byteRange = None
+            if self.headers.get('If-Range', etag) == etag:
+                try:
+                    byteRange = parseRange(self.headers.get('Range'), fileSize)
+                except RangeNotSatisfiable:
+                    self.send_response(416)
+                    self.send_header('Content-Range', 'bytes */{}'.format(fileSize))
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+            if byteRange is None:
+                first, last = 0, fileSize - 1
+                self.send_response(200)
+            else:
+                first, last = byteRange
+                self.send_response(206)
+                self.send_header('Content-Range', 'bytes {}-{}/{}'.format(first, last, fileSize))
+            length = last - first + 1
+            self.send_header('Content-Type', contentType)
+            self.send_header('Content-Length', str(length))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', email.utils.formatdate(stat.st_mtime, usegmt=True))
+            self.send_header('Cache-Control', 'public, max-age={}'.format(MAX_AGE))
+            self.end_headers()
+            if sendBody and length > 0:
+                try:
+                    self.server.sendFile(self.wfile, self.connection, mediaFile, first, length)
+                except (ConnectionError, TimeoutError, socket.timeout):
+                    self.close_connection = True        # the client went away (e.g. it seeked, and made a new request)
+
+    def log_message(self, format, *args):
+        logging.getLogger(__name__).debug('%s: %s', self.address_string(), format % args)
+
+
+class MediaServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, fileLocations, host='0.0.0.0', port=0):
+        self.logger = logging.getLogger(__name__)
+        self.fileLocations = fileLocations
+        self.useSendfile = hasattr(os, 'sendfile')
+        super().__init__((host, port), MediaRequestHandler)
+
+    def sendFile(self, wfile, connection, mediaFile, offset, length):
+        wfile.flush()
+        if self.useSendfile:
+            requestedLength = length
+            try:
+                while length > 0:
+                    try:
+                        sent = os.sendfile(connection.fileno(), mediaFile.fileno(), offset, min(length, CHUNK_SIZE))
+                    except BlockingIOError:
+                        # the socket has a timeout, so it's non-blocking underneath; wait for the client to catch up
+                        if not select.select([], [connection], [], connection.gettimeout())[1]:
+                            raise TimeoutError('client stopped reading')
+                        continue
+                    if sent == 0:
+                        break
+                    offset += sent
+                    length -= sent
+                return
+            except OSError as e:
+                if isinstance(e, (ConnectionError, TimeoutError)) or length != requestedLength:     # not a sendfile() problem
+                    raise
+                self.logger.info('sendfile() is not supported here ({}), copying instead'.format(e))
+                self.useSendfile = False
+        mediaFile.seek(offset)
+        while length > 0:
+            data = mediaFile.read(min(length, CHUNK_SIZE))
+            if not data:
+                break
+            wfile.write(data)
+            length -= len(data)
+
+    def start(self):
+        self.logger.info('Media server listening on port {}'.format(self.server_address[1]))
+        thread = threading.Thread(target=self.serve_forever, name='mediaServer', daemon=True)
+        thread.start()
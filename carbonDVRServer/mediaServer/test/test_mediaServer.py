@@ -0,0 +1,135 @@
+import http.client
+import os
+import socket
+import tempfile
+import unittest
+from mediaServer import MediaServer
+from mediaServer.mediaServer import MediaRequestHandler, RangeNotSatisfiable, matchesETag, parseRange
+from unittest.mock import Mock, patch
+
+
+class TestParseRange(unittest.TestCase):
+
+    def test_parseRange(self):
+        self.assertIsNone(parseRange(None, 100))
+        self.assertEqual((10, 19), parseRange('bytes=10-19', 100))
+        self.assertEqual((10, 99), parseRange('bytes=10-', 100))
+        self.assertEqual((90, 99), parseRange('bytes=-10', 100))
+        self.assertEqual((0, 99), parseRange('bytes=-500', 100))
+        self.assertEqual((50, 99), parseRange('bytes=50-500', 100))
+
+    def test_parseRange_ignored(self):
+        self.assertIsNone(parseRange('bytes=0-10,20-30', 100))      # multiple ranges
+        self.assertIsNone(parseRange('items=0-10', 100))
+        self.assertIsNone(parseRange('bytes=20-10', 100))
+
+    def test_parseRange_notSatisfiable(self):
+        self.assertRaises(RangeNotSatisfiable, parseRange, 'bytes=100-', 100)
+        self.assertRaises(RangeNotSatisfiable, parseRange, 'bytes=-0', 100)
+
+
+class TestMatchesETag(unittest.TestCase):
+
+    def test_matchesETag(self):
+        self.assertTrue(matchesETag('"3e8-5f"', '"3e8-5f"'))
+        self.assertTrue(matchesETag('W/"3e8-5f"', '"3e8-5f"'))
+        self.assertTrue(matchesETag('"1-2", W/"3e8-5f"', '"3e8-5f"'))
+        self.assertTrue(matchesETag(' * ', '"3e8-5f"'))
+        self.assertFalse(matchesETag(None, '"3e8-5f"'))
+        self.assertFalse(matchesETag('"1-2", "3e8-60"', '"3e8-5f"'))
+
+
+class TestMediaServer(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.content = bytes(range(256)) * 1000
+        with open(os.path.join(self.tempDir.name, '5.mp4'), 'wb') as f:
+            f.write(self.content)
+        fileLocations = Mock()
+        fileLocations.getTranscodedVideoFilespec.side_effect = lambda locationID, recordingID: \
+            os.path.join(self.tempDir.name, '{}.mp4'.format(recordingID)) if locationID == 1 else ''
+        fileLocations.getHlsDirectory.side_effect = lambda locationID, recordingID: self.tempDir.name if locationID == 1 else ''
+        self.server = MediaServer(fileLocations, host='127.0.0.1')
+        self.server.start()
+        self.connection = http.client.HTTPConnection('127.0.0.1', self.server.server_address[1], timeout=10)
+
+    def tearDown(self):
+        self.connection.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tempDir.cleanup()
+
+    def get(self, path, headers=None):
+        self.connection.request('GET', path, headers=headers or {})
+        response = self.connection.getresponse()
+        return response, response.read()
+
+    def test_mediaServer_wholeFile(self):
+        response, body = self.get('/transcodedVideo/1/5.mp4')
+        self.assertEqual(200, response.status)
+        self.assertEqual(self.content, body)
+        self.assertEqual('bytes', response.getheader('Accept-Ranges'))
+        self.assertEqual('video/mp4', response.getheader('Content-Type'))
+        # revalidation, on the same (kept-alive) connection
+        response, body = self.get('/transcodedVideo/1/5.mp4', {'If-None-Match': response.getheader('ETag')})
+        self.assertEqual(304, response.status)
+
+    def test_mediaServer_ifNoneMatchList(self):
+        etag = self.get('/transcodedVideo/1/5.mp4')[0].getheader('ETag')
+        self.assertEqual(304, self.get('/transcodedVideo/1/5.mp4', {'If-None-Match': '"0-0", W/' + etag})[0].status)
+        self.assertEqual(304, self.get('/transcodedVideo/1/5.mp4', {'If-None-Match': '*'})[0].status)
+        self.assertEqual(200, self.get('/transcodedVideo/1/5.mp4', {'If-None-Match': '"0-0"'})[0].status)
+        # If-Range uses the strong comparison
+        response, body = self.get('/transcodedVideo/1/5.mp4', {'Range': 'bytes=0-9', 'If-Range': 'W/' + etag})
+        self.assertEqual(200, response.status)
+
+    def test_mediaServer_idleConnectionClosed(self):
+        with patch.object(MediaRequestHandler, 'timeout', 0.2):
+            idle = socket.create_connection(self.server.server_address, timeout=10)
+            with idle:
+                self.assertEqual(b'', idle.recv(1))      # closed by the server, rather than left waiting
+
+    def test_mediaServer_slowReader(self):
+        # a file bigger than the socket buffers, so sendfile() on the (timeout, so non-blocking) socket has to wait
+        content = os.urandom(16 * 1024 * 1024)
+        with open(os.path.join(self.tempDir.name, '6.mp4'), 'wb') as f:
+            f.write(content)
+        response, body = self.get('/transcodedVideo/1/6.mp4')
+        self.assertEqual(content, body)
+        self.assertTrue(self.server.useSendfile)
+
+    def test_mediaServer_range(self):
+        response, body = self.get('/transcodedVideo/1/5.mp4', {'Range': 'bytes=1000-1999'})
+        self.assertEqual(206, response.status)
+        self.assertEqual('bytes 1000-1999/256000', response.getheader('Content-Range'))
+        self.assertEqual(self.content[1000:2000], body)
+        response, body = self.get('/transcodedVideo/1/5.mp4', {'Range': 'bytes=-10'})
+        self.assertEqual(self.content[-10:], body)
+        response, body = self.get('/transcodedVideo/1/5.mp4', {'Range': 'bytes=256000-'})
+        self.assertEqual(416, response.status)
+        self.assertEqual('bytes */256000', response.getheader('Content-Range'))
+
+    def test_mediaServer_rangeWithoutSendfile(self):
+        self.server.useSendfile = False
+        response, body = self.get('/transcodedVideo/1/5.mp4', {'Range': 'bytes=255000-'})
+        self.assertEqual(self.content[255000:], body)
+
+    def test_mediaServer_hls(self):
+        with open(os.path.join(self.tempDir.name, 'master.m3u8'), 'w') as f:
+            f.write('#EXTM3U\n')
+        response, body = self.get('/hls/1/5/master.m3u8')
+        self.assertEqual(200, response.status)
+        self.assertEqual('application/vnd.apple.mpegurl', response.getheader('Content-Type'))
+        self.assertEqual(b'#EXTM3U\n', body)
+        self.assertEqual(404, self.get('/hls/1/5/../5.mp4')[0].status)
+        self.assertEqual(404, self.get('/hls/1/5/stream_0_00001.ts')[0].status)
+
+    def test_mediaServer_notFound(self):
+        self.assertEqual(404, self.get('/transcodedVideo/1/6.mp4')[0].status)
+        self.assertEqual(404, self.get('/transcodedVideo/2/5.mp4')[0].status)
+        self.assertEqual(404, self.get('/etc/passwd')[0].status)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1 @@
+from metrics.metrics import Counter, Gauge, Histogram, Registry, MetricsServer, REGISTRY, CONTENT_TYPE, DEFAULT_BUCKETS, LONG_BUCKETS
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3.4
+
+import bisect
+import contextlib
+import http.server
+import logging
+import socketserver
+import threading
+import time
+
+
+#
+# Notes on metrics
+#
+# Each subsystem defines its metrics at module level, e.g.
+#
+#     RECORDINGS = metrics.Counter('carbondvr_recordings_total', 'Recordings, by tuner and result', ['tuner', 'result'])
+#     ...
+#     RECORDINGS.labels(tuner='1010CC54-0', result='started').inc()
+#
+# and they're all registered with REGISTRY, which renders them in the Prometheus text format, for /metrics.
+#
+# Counters only go up (they're reset when the server restarts, which Prometheus allows for); gauges are set to the
+# current value of something; histograms count observations (e.g. durations, in seconds) in cumulative buckets, and
+# keep their sum, so that averages and percentiles can be computed.  Values that are only worth computing when
+# they're asked for (e.g. free disk space) are set by a handler registered with addCollectHandler(), which is called
+# each time the metrics are rendered.
+#
+# Updating a metric takes a lock and a dictionary lookup, so they can be used on hot paths.  Label values should come
+# from small sets (route names, tuners, profiles): each combination is kept forever.
+#
+# When the recorder runs in a process of its own (CARBONDVR_ROLE=worker), it has no web server; its metrics can be
+# served by a MetricsServer, on CARBONDVR_METRICS_PORT.
+#
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LONG_BUCKETS = (10.0, 30.0, 60.0, 300.0, 600.0, 1200.0, 1800.0, 3600.0, 7200.0, 14400.0)     # for transcodes etc.
+
+
+def formatValue(value):
+    if value == float('inf'):
+        return '+Inf'
+    if value == -float('inf'):
+        return '-Inf'
+    return repr(float(value))
+
+
+def escapeLabelValue(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def formatLabels(labelNames, labelValues, extra=None):
+    pairs = list(zip(labelNames, labelValues))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, escapeLabelValue(value)) for name, value in pairs) + '}'
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = []
+        self.collectHandlers = []
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+
+    # 'handler' is called (with no arguments) each time the metrics are rendered, to update gauges
+    def addCollectHandler(self, handler):
+        with self.lock:
+            self.collectHandlers.append(handler)
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics)
+            collectHandlers = list(self.collectHandlers)
+        for handler in collectHandlers:
+            try:
+                handler()
+            except Exception:
+                logging.getLogger(__name__).exception('Error collecting metrics')
+        lines = []
+        for metric in sorted(metrics, key=lambda metric: metric.name):
+            lines.append('# HELP {} {}'.format(metric.name, metric.help.replace('\\', '\\\\').replace('\n', '\\n')))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labelNames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labelNames)
+        self.lock = threading.Lock()
+        self.children = {}      # tuple of label values -> child
+        if not self.labelNames:
+            self.labels()       # so that it's rendered (as zero) before it's first updated
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, **labels):
+        labelValues = tuple(str(labels[name]) for name in self.labelNames)
+        child = self.children.get(labelValues)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(labelValues, self.makeChild())
+        return child
+
+    def getChildren(self):
+        with self.lock:
+            return sorted(self.children.items())
+
+    # a metric without labels can be updated directly
+    def unlabelled(self):
+        return self.labels()
+
+
+class CounterChild:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def makeChild(self):
+        return CounterChild()
+
+    def inc(self, amount=1):
+        self.unlabelled().inc(amount)
+
+    def render(self):
+        return ['{}{} {}'.format(self.name, formatLabels(self.labelNames, labelValues), formatValue(child.value))
+                for labelValues, child in self.getChildren()]
+
+
+class GaugeChild:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0.0
+
+    def set(self, value):
+        with self.lock:
+            self.value = value
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def makeChild(self):
+        return GaugeChild()
+
+    def set(self, value):
+        self.unlabelled().set(value)
+
+    def inc(self, amount=1):
+        self.unlabelled().inc(amount)
+
+    def dec(self, amount=1):
+        self.unlabelled().dec(amount)
+
+    def render(self):
+        return ['{}{} {}'.format(self.name, formatLabels(self.labelNames, labelValues), formatValue(child.value))
+                for labelValues, child in self.getChildren()]
+
+
+class HistogramChild:
+    def __init__(self, buckets):
+        self.lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)      # not cumulative; rendering accumulates them
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)      # the first bucket whose bound is >= value
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    # observes the time taken by the 'with' block
+    @contextlib.contextmanager
+    def time(self):
+        startTime = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - startTime)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelNames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets)) + (float('inf'), )
+        super().__init__(name, help, labelNames, registry)
+
+    def makeChild(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.unlabelled().observe(value)
+
+    def time(self):
+        return self.unlabelled().time()
+
+    def render(self):
+        lines = []
+        for labelValues, child in self.getChildren():
+            with child.lock:
+                counts = list(child.counts)
+                total = child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(self.name, formatLabels(self.labelNames, labelValues, ('le', formatValue(bound))), cumulative))
+            lines.append('{}_sum{} {}'.format(self.name, formatLabels(self.labelNames, labelValues), formatValue(total)))
+            lines.append('{}_count{} {}'.format(self.name, formatLabels(self.labelNames, labelValues), cumulative))
+        return lines
+
+
+class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass        # scraped every few seconds; not worth logging
+
+
+class MetricsServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, registry=REGISTRY, host='0.0.0.0', port=0):
+        self.logger = logging.getLogger(__name__)
+        self.registry = registry
+        super().__init__((host, port), MetricsRequestHandler)
+
+    def start(self):
+        self.logger.info('Metrics server listening on port {}'.format(self.server_address[1]))
+        thread = threading.Thread(target=self.serve_forever, name='metricsServer', daemon=True)
+        thread.start()
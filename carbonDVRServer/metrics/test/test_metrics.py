@@ -0,0 +1,78 @@
+import unittest
+import urllib.request
+from metrics import Counter, Gauge, Histogram, Registry, MetricsServer
+from metrics.metrics import formatLabels
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_metrics_counter(self):
+        counter = Counter('test_recordings_total', 'Recordings', ['tuner', 'result'], registry=self.registry)
+        counter.labels(tuner='A-0', result='started').inc()
+        counter.labels(tuner='A-0', result='started').inc()
+        counter.labels(tuner='A-1', result='failed').inc(3)
+        lines = self.registry.render().splitlines()
+        self.assertEqual(['# HELP test_recordings_total Recordings',
+                          '# TYPE test_recordings_total counter',
+                          'test_recordings_total{tuner="A-0",result="started"} 2.0',
+                          'test_recordings_total{tuner="A-1",result="failed"} 3.0'], lines)
+
+    def test_metrics_gauge(self):
+        gauge = Gauge('test_queue', 'Queue', registry=self.registry)
+        self.assertIn('test_queue 0.0', self.registry.render())        # rendered before it's first set
+        gauge.set(5)
+        gauge.dec()
+        self.assertIn('test_queue 4.0', self.registry.render())
+
+    def test_metrics_histogram(self):
+        histogram = Histogram('test_seconds', 'Durations', buckets=(0.1, 1.0), registry=self.registry)
+        histogram.observe(0.05)
+        histogram.observe(0.1)
+        histogram.observe(0.5)
+        histogram.observe(30)
+        lines = self.registry.render().splitlines()
+        self.assertIn('test_seconds_bucket{le="0.1"} 2', lines)
+        self.assertIn('test_seconds_bucket{le="1.0"} 3', lines)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 4', lines)
+        self.assertIn('test_seconds_sum 30.65', lines)
+        self.assertIn('test_seconds_count 4', lines)
+        with histogram.time():
+            pass
+        self.assertIn('test_seconds_count 5', self.registry.render().splitlines())
+
+    def test_metrics_labelEscaping(self):
+        self.assertEqual('', formatLabels((), ()))
+        self.assertEqual('{location="a\\"b\\\\c\\nd",le="+Inf"}', formatLabels(('location', ), ('a"b\\c\nd', ), ('le', '+Inf')))
+
+    def test_metrics_collectHandler(self):
+        gauge = Gauge('test_free_bytes', 'Free bytes', ['location'], registry=self.registry)
+        def collect():
+            gauge.labels(location=1).set(100)
+        def brokenCollect():
+            raise OSError('no such volume')
+        self.registry.addCollectHandler(brokenCollect)
+        self.registry.addCollectHandler(collect)
+        with self.assertLogs('metrics.metrics', 'ERROR'):
+            self.assertIn('test_free_bytes{location="1"} 100.0', self.registry.render())
+
+    def test_metrics_server(self):
+        Counter('test_requests_total', 'Requests', registry=self.registry).inc()
+        server = MetricsServer(self.registry, host='127.0.0.1', port=0)
+        server.start()
+        try:
+            url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+            with urllib.request.urlopen(url + '/metrics') as response:
+                self.assertTrue(response.headers['Content-Type'].startswith('text/plain'))
+                self.assertIn(b'test_requests_total 1.0', response.read())
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen(url + '/other')
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
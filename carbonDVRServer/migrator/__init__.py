@@ -0,0 +1 @@
+from migrator.migrator import Migrator
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3.4
+
+import os, os.path
+import hashlib
+import logging
+import threading
+import time
+
+
+class Bunch:
+    def __init__(self, **kwds):
+        self.__dict__.update(kwds)
+
+
+COPY_BLOCK_SIZE = 1024 * 1024
+
+TABLES = {'transcodedVideo': 'file_transcoded_video', 'bif': 'file_bif'}
+CONDITIONS = {'transcodedVideo': 'AND file_transcoded_video.state = 0 ', 'bif': ''}    # don't migrate failed transcodes
+
+
+# copies 'srcFile' to 'destFile', at no more than 'bytesPerSecond', and returns the SHA-256 digest of the data copied
+def throttledCopy(srcFile, destFile, bytesPerSecond):
+    checksum = hashlib.sha256()
+    bytesCopied = 0
+    startTime = time.monotonic()
+    with open(srcFile, 'rb') as src, open(destFile, 'wb') as dest:
+        while True:
+            block = src.read(COPY_BLOCK_SIZE)
+            if not block:
+                break
+            dest.write(block)
+            checksum.update(block)
+            bytesCopied += len(block)
+            if bytesPerSecond:
+                delay = bytesCopied / bytesPerSecond - (time.monotonic() - startTime)
+                if delay > 0:
+                    time.sleep(delay)
+        dest.flush()
+        os.fsync(dest.fileno())
+    return checksum.hexdigest()
+
+
+def fileChecksum(filename):
+    checksum = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(COPY_BLOCK_SIZE)
+            if not block:
+                break
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+class MigrationException(Exception):
+    pass
+
+
+#
+# Notes on migration
+#
+# New transcoded videos and BIFs are written to whichever location fileLocations.chooseLocation() picks, which is
+# normally the fast storage.  Once a recording is archived (rerun_code = 'A'), the migrator moves its files to the
+# archive tier:
+#     1. the file is copied (throttled, so that it doesn't starve playback) to '<destination>.partial'
+#     2. the copy is re-read, and its checksum compared to the checksum of the data that was read from the source
+#     3. the copy is renamed into place
+#     4. the file's row is updated (location_id and filename) in a single UPDATE, which only succeeds if the row
+#        still points at the source; if it doesn't (e.g. the recording was deleted mid-copy), the copy is removed
+#     5. the source is deleted
+# Since RestServer builds playback URLs from location_id, clients are sent to the new location as soon as step 4
+# commits.  A client that's already streaming from the old location keeps its open file until it's done.
+#
+
+class Migrator:
+    def __init__(self, dbPool, fileLocations, archiveTier, bytesPerSecond):
+        self.logger = logging.getLogger(__name__)
+        self.migratingLock = threading.Lock()
+        self.dbPool = dbPool
+        self.fileLocations = fileLocations
+        self.archiveTier = archiveTier
+        self.bytesPerSecond = bytesPerSecond
+        self.logger.debug("Archive tier: {}".format(self.archiveTier))
+        self.logger.debug("Copy rate: {} bytes/s".format(self.bytesPerSecond))
+
+    def dbGetFilesToMigrate(self, kind, archiveLocationIDs):
+        files = []
+        query = str('SELECT {table}.recording_id, {table}.location_id, {table}.filename '
+                    'FROM {table} '
+                    'INNER JOIN recording ON (recording.recording_id = {table}.recording_id) '
+                    "WHERE recording.rerun_code = 'A' "
+                    'AND {table}.location_id NOT IN %s '
+                    '{condition}'
+                    'ORDER BY recording.date_recorded;').format(table=TABLES[kind], condition=CONDITIONS[kind])
+        with self.dbPool.connection('files_to_migrate') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query, (tuple(archiveLocationIDs), ))
+                for row in cursor:
+                    files.append(Bunch(kind=kind, recordingID=row[0], locationID=row[1], filename=row[2]))
+        return files
+
+    def dbMoveFile(self, kind, recordingID, fromLocationID, toLocationID, filename):
+        rowCount = 0
+        query = 'UPDATE {} SET location_id = %s, filename = %s WHERE recording_id = %s AND location_id = %s;'.format(TABLES[kind])
+        with self.dbPool.connection('move_file') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query, (toLocationID, filename, recordingID, fromLocationID))
+                rowCount = cursor.rowcount
+        return rowCount
+
+    def getFilespec(self, kind, locationID, recordingID):
+        if kind == 'transcodedVideo':
+            return self.fileLocations.getTranscodedVideoFilespec(locationID, recordingID)
+        return self.fileLocations.getBifFilespec(locationID, recordingID)
+
+    def migrateFile(self, file, toLocationID):
+        srcFile = file.filename or self.getFilespec(file.kind, file.locationID, file.recordingID)
+        destFile = self.getFilespec(file.kind, toLocationID, file.recordingID)
+        partialFile = destFile + '.partial'
+        if not os.path.isfile(srcFile):
+            raise MigrationException('Source file not found: {}'.format(srcFile))
+        self.logger.info('Migrating {} to {}'.format(srcFile, destFile))
+        try:
+            sourceChecksum = throttledCopy(srcFile, partialFile, self.bytesPerSecond)
+            if fileChecksum(partialFile) != sourceChecksum:
+                raise MigrationException('Checksum mismatch copying {} to {}'.format(srcFile, partialFile))
+            os.rename(partialFile, destFile)
+        except:
+            if os.path.exists(partialFile):
+                os.unlink(partialFile)
+            raise
+        if self.dbMoveFile(file.kind, file.recordingID, file.locationID, toLocationID, destFile) != 1:
+            self.logger.info('Recording {} changed during migration, discarding copy'.format(file.recordingID))
+            os.unlink(destFile)
+            return
+        os.unlink(srcFile)
+        self.logger.info('Migrated {} to location {}'.format(srcFile, toLocationID))
+
+    def migrateRecordings(self):
+        if not self.migratingLock.acquire(blocking=False):
+            return
+        try:
+            for kind in TABLES:
+                archiveLocationIDs = self.fileLocations.getLocationIDs(kind, self.archiveTier)
+                if not archiveLocationIDs:
+                    continue
+                for file in self.dbGetFilesToMigrate(kind, archiveLocationIDs):
+                    toLocationID = self.fileLocations.chooseLocation(kind, self.archiveTier)
+                    try:
+                        self.migrateFile(file, toLocationID)
+                    except (MigrationException, OSError) as e:
+                        self.logger.error('Unable to migrate recording {}: {}'.format(file.recordingID, e))
+        finally:
+            self.migratingLock.release()
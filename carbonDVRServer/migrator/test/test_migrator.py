@@ -0,0 +1,66 @@
+import hashlib
+import os
+import tempfile
+import unittest
+from migrator.migrator import Migrator, MigrationException, throttledCopy
+from unittest.mock import Mock, patch
+
+
+class Bunch:
+    def __init__(self, **kwds):
+        self.__dict__.update(kwds)
+
+
+class TestMigrator(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.srcFile = os.path.join(self.tempDir.name, 'fast_5.mp4')
+        self.destFile = os.path.join(self.tempDir.name, 'bulk_5.mp4')
+        self.data = os.urandom(300000)
+        with open(self.srcFile, 'wb') as f:
+            f.write(self.data)
+        fileLocations = Mock()
+        fileLocations.getTranscodedVideoFilespec.side_effect = lambda locationID, recordingID: self.destFile if locationID == 2 else self.srcFile
+        self.migrator = Migrator(Mock(), fileLocations, 'bulk', 0)
+        self.migrator.logger = Mock()
+        self.file = Bunch(kind='transcodedVideo', recordingID=5, locationID=1, filename=self.srcFile)
+
+    def tearDown(self):
+        self.tempDir.cleanup()
+
+    def test_migrator_throttledCopy(self):
+        checksum = throttledCopy(self.srcFile, self.destFile, 0)
+        self.assertEqual(hashlib.sha256(self.data).hexdigest(), checksum)
+        with open(self.destFile, 'rb') as f:
+            self.assertEqual(self.data, f.read())
+
+    def test_migrator_migrateFile(self):
+        self.migrator.dbMoveFile = Mock(return_value=1)
+        self.migrator.migrateFile(self.file, 2)
+        self.migrator.dbMoveFile.assert_called_once_with('transcodedVideo', 5, 1, 2, self.destFile)
+        self.assertFalse(os.path.exists(self.srcFile))
+        self.assertFalse(os.path.exists(self.destFile + '.partial'))
+        with open(self.destFile, 'rb') as f:
+            self.assertEqual(self.data, f.read())
+
+    def test_migrator_migrateFile_recordingChanged(self):
+        # the row no longer points at the source (e.g. the recording was deleted), so the copy is discarded
+        self.migrator.dbMoveFile = Mock(return_value=0)
+        self.migrator.migrateFile(self.file, 2)
+        self.assertTrue(os.path.exists(self.srcFile))
+        self.assertFalse(os.path.exists(self.destFile))
+
+    def test_migrator_migrateFile_checksumMismatch(self):
+        self.migrator.dbMoveFile = Mock()
+        with patch('migrator.migrator.fileChecksum', return_value='bogus'):
+            with self.assertRaises(MigrationException):
+                self.migrator.migrateFile(self.file, 2)
+        self.assertFalse(self.migrator.dbMoveFile.called)
+        self.assertTrue(os.path.exists(self.srcFile))
+        self.assertFalse(os.path.exists(self.destFile))
+        self.assertFalse(os.path.exists(self.destFile + '.partial'))
+
+
+if __name__ == '__main__':
+    unittest.main()
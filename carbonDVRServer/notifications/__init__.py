@@ -0,0 +1 @@
+from notifications.notifications import Notifier, Listener, SCHEDULE_RECORDINGS, RECORDING_DELETED, RECORDINGS_CHANGED, STATUS_CHANGED
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3.4
+
+import logging
+import psycopg2
+import psycopg2.extensions
+import select
+import threading
+import time
+
+
+#
+# Notes on notifications
+#
+# When the web server and the recorder run in separate processes (CARBONDVR_ROLE=web and CARBONDVR_ROLE=worker),
+# they can't call each other directly.  Instead, one sends a PostgreSQL NOTIFY, and the other, which LISTENs on a
+# connection of its own, runs the handler.  NOTIFYs are delivered when the sending transaction commits,
+# so the listener always sees the change that prompted the notification.
+#
+# Notifications are not queued: if the listener isn't connected, they're lost.  That's OK for the current uses, since
+# the worker reschedules recordings and purges deleted recordings' files (a full cleanup) when it starts, and
+# periodically after that, and the web server empties its feed cache whenever its listener (re)connects.
+#
+
+SCHEDULE_RECORDINGS = 'carbondvr_schedule_recordings'
+RECORDING_DELETED = 'carbondvr_recording_deleted'
+RECORDINGS_CHANGED = 'carbondvr_recordings_changed'
+STATUS_CHANGED = 'carbondvr_status_changed'      # the payload is the status event, as JSON
+
+
+class Notifier:
+    def __init__(self, dbPool):
+        self.dbPool = dbPool
+
+    def notify(self, channel, payload=''):
+        with self.dbPool.connection('notify') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute('SELECT pg_notify(%s, %s);', (channel, str(payload)))
+
+
+class Listener:
+    def __init__(self, dbConnectString, pollInterval=60, reconnectInterval=10):
+        self.logger = logging.getLogger(__name__)
+        self.dbConnectString = dbConnectString
+        self.pollInterval = pollInterval
+        self.reconnectInterval = reconnectInterval
+        self.handlers = {}
+        self.connectHandlers = []
+
+    # 'handler' is called with the notification's payload (a string)
+    def addHandler(self, channel, handler):
+        self.handlers[channel] = handler
+
+    # 'handler' is called (with no arguments) each time the listener connects, since notifications may have been missed
+    def addConnectHandler(self, handler):
+        self.connectHandlers.append(handler)
+
+    def connect(self):
+        dbConnection = psycopg2.connect(self.dbConnectString)
+        dbConnection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with dbConnection.cursor() as cursor:
+            for channel in self.handlers:
+                cursor.execute('LISTEN {};'.format(channel))
+        return dbConnection
+
+    def dispatch(self, notification):
+        handler = self.handlers.get(notification.channel)
+        if handler is None:
+            return
+        try:
+            handler(notification.payload)
+        except Exception:
+            self.logger.exception('Error handling notification {} ({})'.format(notification.channel, notification.payload))
+
+    def listen(self, dbConnection):
+        while True:
+            if select.select([dbConnection], [], [], self.pollInterval) == ([], [], []):
+                continue
+            dbConnection.poll()
+            while dbConnection.notifies:
+                self.dispatch(dbConnection.notifies.pop(0))
+
+    def run(self):
+        while True:
+            try:
+                dbConnection = self.connect()
+                for handler in self.connectHandlers:
+                    handler()
+                try:
+                    self.listen(dbConnection)
+                finally:
+                    dbConnection.close()
+            except psycopg2.Error as e:
+                self.logger.error('Lost notification connection: {}'.format(e))
+            time.sleep(self.reconnectInterval)
+
+    def start(self):
+        thread = threading.Thread(target=self.run, name='notificationListener', daemon=True)
+        thread.start()
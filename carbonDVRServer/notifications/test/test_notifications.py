@@ -0,0 +1,34 @@
+import unittest
+from notifications.notifications import Listener, Notifier
+from unittest.mock import MagicMock, Mock
+
+
+class Bunch:
+    def __init__(self, **kwds):
+        self.__dict__.update(kwds)
+
+
+class TestNotifications(unittest.TestCase):
+
+    def test_notifications_notify(self):
+        dbPool = MagicMock()
+        cursor = dbPool.connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        Notifier(dbPool).notify('channel', 1234)
+        cursor.execute.assert_called_once_with('SELECT pg_notify(%s, %s);', ('channel', '1234'))
+
+    def test_notifications_dispatch(self):
+        listener = Listener('dbname=test')
+        listener.logger = Mock()
+        handler = Mock()
+        failingHandler = Mock(side_effect=RuntimeError())
+        listener.addHandler('a', handler)
+        listener.addHandler('b', failingHandler)
+        listener.dispatch(Bunch(channel='a', payload='42'))
+        handler.assert_called_once_with('42')
+        listener.dispatch(Bunch(channel='b', payload=''))
+        self.assertTrue(listener.logger.exception.called)
+        listener.dispatch(Bunch(channel='c', payload=''))     # no handler: ignored
+
+
+if __name__ == '__main__':
+    unittest.main()
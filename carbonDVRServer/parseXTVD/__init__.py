@@ -1,2 +1,4 @@
 from parseXTVD.parseXTVD import carbonDVRDatabase
 from parseXTVD.parseXTVD import parseXTVD
+from parseXTVD.parseXTVD import sqliteDatabase
+from parseXTVD.parseXTVD import PhaseTimer
@@ -2,8 +2,26 @@
 
 import logging
 import psycopg2
+import time
 from xml.etree import ElementTree
 
+import metrics
+
+
+IMPORT_PHASE_SECONDS = metrics.Gauge('carbondvr_listings_import_phase_seconds', 'Time taken by each phase of the latest listings import', ['phase'])
+IMPORT_ROWS = metrics.Gauge('carbondvr_listings_import_rows', 'Rows inserted by the latest listings import, by table', ['table'])
+
+
+# records the time taken by each phase of a listings import, for /metrics
+class PhaseTimer:
+    def __init__(self):
+        self.startTime = time.monotonic()
+
+    def endPhase(self, phase):
+        now = time.monotonic()
+        IMPORT_PHASE_SECONDS.labels(phase=phase).set(now - self.startTime)
+        self.startTime = now
+
 
 class carbonDVRDatabase:
     def __init__(self, dbConnection, schema):
@@ -214,8 +232,10 @@ def extractSchedulesWithValidChannels(schedules, channelSet):
 def parseXTVD(xtvdFile, db):
     logger = logging.getLogger(__name__)
     logger.info('Parsing file "%s"', xtvdFile)
+    phaseTimer = PhaseTimer()
     xmlElementTree = ElementTree.parse(xtvdFile)
     logger.info('Finished parsing file "%s"', xtvdFile)
+    phaseTimer.endPhase('parse')
 
     # process XML
     stations = extractStations(xmlElementTree)
@@ -235,6 +255,8 @@ def parseXTVD(xtvdFile, db):
         logger.error('No programs found.  Aborting.')
         return
 
+    phaseTimer.endPhase('extract')
+
     # insert records
     logger.info('Inserting shows')
     numShowsInserted = 0
@@ -242,6 +264,8 @@ def parseXTVD(xtvdFile, db):
         numShowsInserted += db.insertShow(program.showID, program.showType, program.showName);
     db.commit()
     logger.info('%d shows inserted', numShowsInserted)
+    IMPORT_ROWS.labels(table='show').set(numShowsInserted)
+    phaseTimer.endPhase('shows')
 
 
     logger.info('Inserting episodes')
@@ -250,10 +274,13 @@ def parseXTVD(xtvdFile, db):
         numEpisodesInserted += db.insertEpisode(program.showID, program.episodeID, program.episodeTitle, program.episodeDescription, program.partCode)
     db.commit();
     logger.info('%d episodes inserted', numEpisodesInserted)
+    IMPORT_ROWS.labels(table='episode').set(numEpisodesInserted)
+    phaseTimer.endPhase('episodes')
 
     logger.info('Clearing schedule table')
     numRowsDeleted = db.clearScheduleTable()
     logger.info('%s rows deleted from schedule table', numRowsDeleted)
+    phaseTimer.endPhase('clearSchedule')
 
     logger.info('Fetching channel list')
     channelSet = db.getChannels()
@@ -269,4 +296,6 @@ def parseXTVD(xtvdFile, db):
     logger.info('%d of %d schedules inserted', numSchedulesInserted, len(schedules))
     logger.info('%d schedules skipped (undefined channel)', len(schedules) - numSchedulesAttempted)
     logger.info('%d schedule inserts failed', numSchedulesAttempted - numSchedulesInserted)
+    IMPORT_ROWS.labels(table='schedule').set(numSchedulesInserted)
+    phaseTimer.endPhase('schedules')
 
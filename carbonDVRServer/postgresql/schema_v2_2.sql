@@ -0,0 +1,300 @@
+-- 
+-- PostgreSQL
+--
+
+CREATE SCHEMA carbon_v2;
+SET SCHEMA 'carbon_v2';
+
+CREATE SEQUENCE uniqueid;
+
+CREATE TABLE show (
+  show_id        text PRIMARY KEY,
+  show_type      character(2),
+  name           text,
+  imageurl       text
+);
+
+CREATE TABLE episode (
+  show_id        text,
+  episode_id     text,
+  title          text,
+  description    text,
+  part_code      text,
+  imageurl       text,
+  PRIMARY KEY (show_id, episode_id),
+  FOREIGN KEY (show_id) REFERENCES show(show_id)
+);
+
+CREATE TABLE channel (
+  major          integer,
+  minor          integer,
+  actual         integer,
+  program        integer,
+  PRIMARY KEY (major, minor)
+  );
+
+CREATE TABLE tuner (
+  device_id      text,
+  ipaddress      inet,
+  tuner_id       integer
+  );
+
+CREATE TABLE schedule (
+  schedule_id    SERIAL PRIMARY KEY,
+  channel_major  integer,
+  channel_minor  integer,
+  start_time     timestamp with time zone,
+  duration       interval,
+  show_id        text,
+  episode_id     text,
+  rerun_code     character(1),
+  FOREIGN KEY (channel_major, channel_minor) REFERENCES channel(major, minor),
+  FOREIGN KEY (show_id, episode_id) REFERENCES episode(show_id, episode_id)
+  );
+
+CREATE TABLE subscription (
+  show_id        text PRIMARY KEY,
+  priority       integer
+  );
+
+CREATE TABLE recording_state (
+  state          integer,
+  description    text
+  );
+
+CREATE TABLE recording (
+  recording_id   int4 PRIMARY KEY,
+  show_id        text,
+  episode_id     text,
+  episode_number integer,
+  date_recorded  timestamp with time zone,
+  duration       interval,
+  rerun_code     character(1),
+  FOREIGN KEY (show_id, episode_id) REFERENCES episode(show_id, episode_id)
+  );
+
+CREATE INDEX recording_episode_order ON recording (show_id, rerun_code, episode_number, recording_id);
+
+CREATE TABLE file_raw_video (
+  recording_id   int4 PRIMARY KEY,
+  filename       text,
+  size           bigint
+  );
+
+CREATE TABLE file_transcoded_video (
+  recording_id   int4 PRIMARY KEY,
+  location_id    int NOT NULL,
+  filename       text,
+  state          int,
+  size           bigint
+  );
+
+CREATE TABLE file_bif (
+  recording_id   int4 PRIMARY KEY,
+  location_id    int NOT NULL,
+  filename       text,
+  size           bigint
+  );
+
+CREATE TABLE playback_position (
+  recording_id   int4 PRIMARY KEY,
+  position       int4
+  );
+
+CREATE OR REPLACE VIEW recorded_episodes_by_id AS
+  SELECT recording.recording_id, recording.show_id, recording.episode_id
+  FROM recording
+  LEFT JOIN file_raw_video ON (recording.recording_id = file_raw_video.recording_id)
+  LEFT JOIN file_transcoded_video ON (recording.recording_id = file_transcoded_video.recording_id)
+  WHERE file_raw_video.filename IS NOT NULL
+  OR file_transcoded_video.filename IS NOT NULL;
+
+CREATE TABLE retention_rule (
+  show_id        text PRIMARY KEY,
+  keep_count     integer NOT NULL
+  );
+
+CREATE OR REPLACE VIEW recording_disk_usage AS
+  SELECT recording.recording_id, recording.show_id, recording.rerun_code,
+    coalesce(file_raw_video.size, 0) + coalesce(file_transcoded_video.size, 0) + coalesce(file_bif.size, 0) AS bytes
+  FROM recording
+  LEFT JOIN file_raw_video ON (recording.recording_id = file_raw_video.recording_id)
+  LEFT JOIN file_transcoded_video ON (recording.recording_id = file_transcoded_video.recording_id)
+  LEFT JOIN file_bif ON (recording.recording_id = file_bif.recording_id);
+
+CREATE OR REPLACE VIEW show_disk_usage AS
+  SELECT show_id, count(*) AS recordings, sum(bytes) AS bytes
+  FROM recording_disk_usage
+  GROUP BY show_id;
+
+CREATE OR REPLACE VIEW category_disk_usage AS
+  SELECT rerun_code, count(*) AS recordings, sum(bytes) AS bytes
+  FROM recording_disk_usage
+  GROUP BY rerun_code;
+
+CREATE TABLE reconciliation_checkpoint (
+  directory        text PRIMARY KEY,
+  directory_mtime  double precision,
+  entry_ctime      double precision
+  );
+
+CREATE TABLE reconciliation_issue (
+  filename       text PRIMARY KEY,
+  directory      text,
+  issue          character(1),
+  recording_id   int4,
+  size           bigint,
+  detected       timestamp with time zone
+  );
+
+CREATE TABLE file_hls (
+  recording_id   int4 PRIMARY KEY,
+  location_id    int NOT NULL,
+  filename       text,
+  state          int
+  );
+
+CREATE INDEX recording_date_order ON recording (date_recorded DESC, recording_id DESC);
+
+--
+-- upcoming_recording holds the schedule entries that the recorder may record: those for subscribed shows, whose
+-- episodes haven't been recorded yet (see recorded_episodes_by_id).  It's kept up to date by the triggers below, as
+-- listings are imported, subscriptions change, and recordings are made and deleted, so readers don't have to
+-- compute it from the whole schedule.  Entries that have started are left in place until the next listings import
+-- clears the schedule, so readers select start_time > now().
+--
+CREATE TABLE upcoming_recording (
+  schedule_id    int4 PRIMARY KEY REFERENCES schedule(schedule_id) ON DELETE CASCADE,
+  channel_major  integer,
+  channel_minor  integer,
+  start_time     timestamp with time zone,
+  duration       interval,
+  show_id        text,
+  episode_id     text,
+  rerun_code     character(1)
+  );
+
+CREATE INDEX upcoming_recording_start_time ON upcoming_recording (start_time);
+CREATE INDEX upcoming_recording_episode ON upcoming_recording (show_id, episode_id);
+
+-- recomputes the upcoming recordings for one show, or for one episode of a show
+CREATE OR REPLACE FUNCTION refresh_upcoming_recordings(p_show_id text, p_episode_id text) RETURNS void AS $$
+BEGIN
+  DELETE FROM upcoming_recording
+    WHERE show_id = p_show_id
+    AND (p_episode_id IS NULL OR episode_id = p_episode_id);
+  INSERT INTO upcoming_recording (schedule_id, channel_major, channel_minor, start_time, duration, show_id, episode_id, rerun_code)
+    SELECT schedule.schedule_id, schedule.channel_major, schedule.channel_minor, schedule.start_time, schedule.duration,
+      schedule.show_id, schedule.episode_id, schedule.rerun_code
+    FROM schedule
+    INNER JOIN subscription ON (schedule.show_id = subscription.show_id)
+    WHERE schedule.show_id = p_show_id
+    AND (p_episode_id IS NULL OR schedule.episode_id = p_episode_id)
+    AND NOT EXISTS (SELECT 1 FROM recorded_episodes_by_id
+                    WHERE recorded_episodes_by_id.show_id = schedule.show_id
+                    AND recorded_episodes_by_id.episode_id = schedule.episode_id);
+END;
+$$ LANGUAGE plpgsql;
+
+-- listings are imported a row at a time, so each new schedule entry is checked on its own; deleted entries are
+-- removed by the foreign key's ON DELETE CASCADE
+CREATE OR REPLACE FUNCTION upcoming_recording_schedule_changed() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP = 'UPDATE' THEN
+    PERFORM refresh_upcoming_recordings(OLD.show_id, OLD.episode_id);
+    PERFORM refresh_upcoming_recordings(NEW.show_id, NEW.episode_id);
+  ELSIF EXISTS (SELECT 1 FROM subscription WHERE subscription.show_id = NEW.show_id)
+  AND NOT EXISTS (SELECT 1 FROM recorded_episodes_by_id
+                  WHERE recorded_episodes_by_id.show_id = NEW.show_id
+                  AND recorded_episodes_by_id.episode_id = NEW.episode_id) THEN
+    INSERT INTO upcoming_recording (schedule_id, channel_major, channel_minor, start_time, duration, show_id, episode_id, rerun_code)
+      VALUES (NEW.schedule_id, NEW.channel_major, NEW.channel_minor, NEW.start_time, NEW.duration, NEW.show_id, NEW.episode_id, NEW.rerun_code);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION upcoming_recording_subscription_changed() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM refresh_upcoming_recordings(OLD.show_id, NULL);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM refresh_upcoming_recordings(NEW.show_id, NULL);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION upcoming_recording_recording_changed() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM refresh_upcoming_recordings(OLD.show_id, OLD.episode_id);
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM refresh_upcoming_recordings(NEW.show_id, NEW.episode_id);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- an episode counts as recorded while it has a raw or transcoded video file
+CREATE OR REPLACE FUNCTION upcoming_recording_file_changed() RETURNS trigger AS $$
+DECLARE
+  changed_recording_id int4;
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    changed_recording_id := OLD.recording_id;
+  ELSE
+    changed_recording_id := NEW.recording_id;
+  END IF;
+  PERFORM refresh_upcoming_recordings(recording.show_id, recording.episode_id)
+    FROM recording
+    WHERE recording.recording_id = changed_recording_id;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER upcoming_recording_schedule AFTER INSERT OR UPDATE ON schedule
+  FOR EACH ROW EXECUTE PROCEDURE upcoming_recording_schedule_changed();
+
+CREATE TRIGGER upcoming_recording_subscription AFTER INSERT OR UPDATE OR DELETE ON subscription
+  FOR EACH ROW EXECUTE PROCEDURE upcoming_recording_subscription_changed();
+
+CREATE TRIGGER upcoming_recording_recording AFTER INSERT OR UPDATE OF show_id, episode_id OR DELETE ON recording
+  FOR EACH ROW EXECUTE PROCEDURE upcoming_recording_recording_changed();
+
+CREATE TRIGGER upcoming_recording_raw_video AFTER INSERT OR DELETE ON file_raw_video
+  FOR EACH ROW EXECUTE PROCEDURE upcoming_recording_file_changed();
+
+CREATE TRIGGER upcoming_recording_transcoded_video AFTER INSERT OR UPDATE OF filename OR DELETE ON file_transcoded_video
+  FOR EACH ROW EXECUTE PROCEDURE upcoming_recording_file_changed();
+
+--
+-- one row per run of ffmpeg (see the notes on transcode progress in transcoder.py); rows are kept after their
+-- recordings are deleted, as history for transcode_speed
+--
+CREATE TABLE transcode_job (
+  recording_id   int4 NOT NULL,
+  profile        text NOT NULL,            -- low, medium, high or hls
+  video_duration interval NOT NULL,
+  start_time     timestamp with time zone NOT NULL,
+  finish_time    timestamp with time zone,
+  percent        integer NOT NULL DEFAULT 0,
+  fps            real,
+  speed          real,                     -- seconds of video encoded per second
+  state          integer,                  -- NULL while running, then 0 on success, 1 on failure, 2 if abandoned
+  PRIMARY KEY (recording_id, profile)
+  );
+
+CREATE INDEX transcode_job_finish_time ON transcode_job (finish_time);
+
+CREATE OR REPLACE VIEW transcode_speed AS
+  SELECT profile, count(*) AS jobs,
+    sum(extract(epoch FROM video_duration)) / sum(extract(epoch FROM finish_time - start_time)) AS speed,
+    avg(fps) AS fps
+  FROM transcode_job
+  WHERE state = 0
+  AND finish_time > now() - interval '30 days'
+  AND finish_time > start_time
+  GROUP BY profile;
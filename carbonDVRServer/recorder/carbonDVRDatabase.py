@@ -28,71 +28,73 @@ class TunerInfo:
 
 
 class CarbonDVRDatabase:
-    def __init__(self, dbConnection):
-        self.connection = dbConnection
-        self.connection.autocommit = True
+    def __init__(self, dbPool):
+        self.dbPool = dbPool
 
     def getChannels(self):
         channels = []
-        with self.connection.cursor() as cursor:
-          cursor.execute("SELECT major, minor, actual, program FROM channel")
-          for row in cursor:
-            channels.append(ChannelInfo(channelMajor=row[0], channelMinor=row[1], channelActual=row[2], program=row[3]))
-        self.connection.commit()
+        with self.dbPool.connection('channels') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute("SELECT major, minor, actual, program FROM channel")
+                for row in cursor:
+                    channels.append(ChannelInfo(channelMajor=row[0], channelMinor=row[1], channelActual=row[2], program=row[3]))
         return channels
 
     def getTuners(self):
         tuners = []
-        with self.connection.cursor() as cursor:
-          cursor.execute("SELECT device_id, ipaddress, tuner_id FROM tuner")
-          for row in cursor:
-            tuners.append(TunerInfo(deviceID=row[0], ipAddress=row[1], tunerID=row[2]))
-        self.connection.commit()
+        with self.dbPool.connection('tuners') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute("SELECT device_id, ipaddress, tuner_id FROM tuner")
+                for row in cursor:
+                    tuners.append(TunerInfo(deviceID=row[0], ipAddress=row[1], tunerID=row[2]))
         return tuners
 
-    def getPendingRecordings(self, lookaheadTime):
+    # if 'showIDs' is given, only those shows' pending recordings are returned
+    def getPendingRecordings(self, lookaheadTime, showIDs=None):
         schedules = []
-        with self.connection.cursor() as cursor:
-            query = str("SELECT DISTINCT ON (schedule.show_id, schedule.episode_id) "
-                        "schedule.schedule_id, schedule.channel_major, schedule.channel_minor, schedule.start_time, "
-                        "schedule.duration, schedule.show_id, schedule.episode_id, schedule.rerun_code "
-                        "FROM schedule "
-                        "INNER JOIN subscription ON (schedule.show_id = subscription.show_id) "
-                        "WHERE schedule.start_time > now() "
-                        "AND schedule.start_time < now() + %s "
-                        "AND (schedule.show_id, schedule.episode_id) NOT IN "
-                            "(SELECT recorded_episodes_by_id.show_id, recorded_episodes_by_id.episode_id FROM recorded_episodes_by_id) "
-                        "ORDER BY schedule.show_id, schedule.episode_id;");
-            cursor.execute(query, (lookaheadTime, ))
-            for row in cursor:
-                schedules.append(Bunch(channelMajor=row[1], channelMinor=row[2], startTime=row[3], duration=row[4], showID=row[5], episodeID=row[6], rerunCode=row[7]))
-        self.connection.commit()
+        parameters = [lookaheadTime]
+        showFilter = ""
+        if showIDs is not None:
+            showFilter = "AND show_id IN %s "
+            parameters.append(tuple(showIDs))
+        with self.dbPool.connection('pending_recordings') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                query = str("SELECT DISTINCT ON (show_id, episode_id) "
+                            "schedule_id, channel_major, channel_minor, start_time, duration, show_id, episode_id, rerun_code "
+                            "FROM upcoming_recording "
+                            "WHERE start_time > now() "
+                            "AND start_time < now() + %s "
+                            + showFilter +
+                            "ORDER BY show_id, episode_id, start_time;");
+                cursor.execute(query, parameters)
+                for row in cursor:
+                    schedules.append(Bunch(channelMajor=row[1], channelMinor=row[2], startTime=row[3], duration=row[4], showID=row[5], episodeID=row[6], rerunCode=row[7]))
         return schedules
 
     def getUniqueID(self):
         uniqueID = None
-        with self.connection.cursor() as cursor:
-            cursor.execute("SELECT nextval('uniqueid');", ())
-            if cursor:
-                uniqueID = cursor.fetchone()[0]
-        self.connection.commit()
+        with self.dbPool.connection('unique_id') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute("SELECT nextval('uniqueid');", ())
+                if cursor:
+                    uniqueID = cursor.fetchone()[0]
         return uniqueID
 
     def insertRecording(self, recordingID, showID, episodeID, duration, rerunCode):
         rowCount = 0
-        with self.connection.cursor() as cursor:
-            query = str("INSERT INTO recording(recording_id, show_id, episode_id, date_recorded, duration, rerun_code) "
-                        "VALUES (%s, %s, %s, now(), %s, %s);")
-            cursor.execute(query, (recordingID, showID, episodeID, duration, rerunCode))
-            rowCount = cursor.rowcount
-        self.connection.commit()
+        with self.dbPool.connection('insert_recording') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                query = str("INSERT INTO recording(recording_id, show_id, episode_id, episode_number, date_recorded, duration, rerun_code) "
+                            "VALUES (%s, %s, %s, NULLIF(substring(%s from '[[:digit:]]*'), '')::integer, now(), %s, %s);")
+                cursor.execute(query, (recordingID, showID, episodeID, episodeID, duration, rerunCode))
+                rowCount = cursor.rowcount
         return rowCount
 
     def insertRawVideoLocation(self, recordingID, filename):
         rowCount = 0
-        with self.connection.cursor() as cursor:
-            cursor.execute("INSERT INTO file_raw_video(recording_id, filename) VALUES (%s, %s);", (recordingID, filename))
-            rowCount = cursor.rowcount
-        self.connection.commit()
+        with self.dbPool.connection('insert_raw_video_location') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute("INSERT INTO file_raw_video(recording_id, filename) VALUES (%s, %s);", (recordingID, filename))
+                rowCount = cursor.rowcount
         return rowCount
 
@@ -12,6 +12,11 @@ import pytz
 
 from bunch import Bunch
 
+import metrics
+
+
+RECORDINGS = metrics.Counter('carbondvr_recordings_total', 'Recordings, by tuner and result (started, succeeded, failed)', ['tuner', 'result'])
+
 
 # we're not really checking much here, but it's better than nothing
 # at least it will detect 0-byte files
@@ -102,7 +107,10 @@ class HDHomeRunInterface:
         tuner = self.tunerList.lockTuner()
         if tuner == None:
             self.logger.error("No tuners available")
+            RECORDINGS.labels(tuner='none', result='failed').inc()
             raise NoTunersAvailableException
+        tunerName = '{}-{}'.format(tuner.deviceID, tuner.tunerID)
+        RECORDINGS.labels(tuner=tunerName, result='started').inc()
         self.logger.info("Selected tuner {}:{}".format(tuner.deviceID, tuner.tunerID))
         # setup logfile
         self.logger.info("Logging to {}".format(logFile))
@@ -138,6 +146,8 @@ class HDHomeRunInterface:
         # did we actually get a recording?
         if not isaValidRecording(destFile):
             self.logger.info("Recording failed on tuner {}:{}".format(tuner.deviceID, tuner.tunerID))
+            RECORDINGS.labels(tuner=tunerName, result='failed').inc()
             raise BadRecordingException
         self.logger.info("Recording succeeded on tuner {}:{}".format(tuner.deviceID, tuner.tunerID))
+        RECORDINGS.labels(tuner=tunerName, result='succeeded').inc()
 
@@ -8,16 +8,39 @@ from datetime import datetime, timedelta
 from .hdhomerun import UnrecognizedChannelException, NoTunersAvailableException, BadRecordingException
 
 
+#
+# Notes on rescheduling
+#
+# scheduleRecordings() replaces the recording jobs for every pending recording, which means running the whole pending
+# query.  That's done at startup and every six hours (shortly after the listings have been imported).
+#
+# When a subscription changes, only that show's recordings need to change.  requestReschedule() notes the show, and
+# (re)adds a single 'reschedule' job, 'rescheduleDelay' seconds in the future, and returns; so the web server doesn't
+# wait for the scheduling, and a burst of subscribes and unsubscribes (each of which pushes the job back) results in a
+# single reschedule, of just the shows that changed.  A request without a show reschedules everything.
+#
+
+RESCHEDULE_JOB_ID = 'reschedule'
+
+
 
 class Recorder:
-    def __init__(self, scheduler, hdhomerunInterface, dbInterface, videoFilespec, logFilespec):
+    def __init__(self, scheduler, hdhomerunInterface, dbInterface, videoFilespec, logFilespec, diskSpaceCallback=None, fileLocations=None,
+                 rescheduleDelay=5, statusCallback=None, diskSpaceTimeout=10):
         self.logger = logging.getLogger(__name__)
         self.schedulingLock = threading.Lock()
+        self.rescheduleLock = threading.Lock()
+        self.rescheduleShowIDs = set()      # shows waiting to be rescheduled; None means all of them
+        self.rescheduleDelay = rescheduleDelay
+        self.statusCallback = statusCallback
         self.scheduler = scheduler
         self.hdhomerunInterface = hdhomerunInterface
         self.dbInterface = dbInterface
         self.videoFilespec = videoFilespec
         self.logFilespec = logFilespec
+        self.diskSpaceCallback = diskSpaceCallback
+        self.diskSpaceTimeout = diskSpaceTimeout
+        self.fileLocations = fileLocations
         self.scheduleRecordings()
         self.scheduler.add_job(self.scheduleRecordings, trigger=CronTrigger(hour='0,6,12,18', minute='40'), misfire_grace_time=600)
 
@@ -28,29 +51,94 @@ class Recorder:
                 self.logger.debug('Removing job: {}'.format(job))
                 self.scheduler.remove_job(job.id)
 
-    def scheduleRecordings(self):
+    def removeRecordingJobsForShows(self, showIDs):
+        self.logger.debug('Removing recording jobs for shows: {}'.format(', '.join(sorted(showIDs))))
+        for job in self.scheduler.get_jobs():
+            if job.func == self.record and job.args[0].showID in showIDs:
+                self.logger.debug('Removing job: {}'.format(job))
+                self.scheduler.remove_job(job.id)
+
+    # if 'showIDs' is given, only those shows' recordings are rescheduled
+    def scheduleRecordings(self, showIDs=None):
         with self.schedulingLock:
-            self.logger.info("Scheduling recordings")
-            self.removeAllRecordingJobs()
-            pendingRecordings = self.dbInterface.getPendingRecordings(timedelta(hours=12))
+            if showIDs is None:
+                self.logger.info("Scheduling recordings")
+                self.removeAllRecordingJobs()
+                pendingRecordings = self.dbInterface.getPendingRecordings(timedelta(hours=12))
+            else:
+                self.logger.info("Scheduling recordings for shows: {}".format(', '.join(sorted(showIDs))))
+                self.removeRecordingJobsForShows(showIDs)
+                pendingRecordings = self.dbInterface.getPendingRecordings(timedelta(hours=12), showIDs)
             pendingRecordings.sort(key=lambda pendingRecording: pendingRecording.startTime) # not really necessary, just makes log files easier to follow
             for pendingRecording in pendingRecordings:
                 self.logger.info("Scheduling recording on channel {}-{} at {}".
                     format(pendingRecording.channelMajor, pendingRecording.channelMinor, pendingRecording.startTime.astimezone(pytz.timezone('US/Central'))))
                 self.scheduler.add_job(self.record, args = [pendingRecording], trigger = 'date', run_date = pendingRecording.startTime, misfire_grace_time=60)
+        self.publishStatus('scheduleChanged')
+
+    # returns immediately; the rescheduling is done by the scheduler, after 'rescheduleDelay' seconds
+    def requestReschedule(self, showID=None):
+        with self.rescheduleLock:
+            if showID is None:
+                self.rescheduleShowIDs = None
+            elif self.rescheduleShowIDs is not None:
+                self.rescheduleShowIDs.add(showID)
+            runDate = datetime.now(pytz.utc) + timedelta(seconds=self.rescheduleDelay)
+            self.scheduler.add_job(self.reschedule, trigger='date', run_date=runDate, id=RESCHEDULE_JOB_ID, replace_existing=True,
+                                   misfire_grace_time=600)
+
+    def reschedule(self):
+        with self.rescheduleLock:
+            showIDs = self.rescheduleShowIDs
+            self.rescheduleShowIDs = set()
+        if showIDs is None or showIDs:
+            self.scheduleRecordings(showIDs)
+
+    def publishStatus(self, eventType, **fields):
+        if self.statusCallback is not None:
+            self.statusCallback(eventType, **fields)
+
+    # placement: use the location chosen by fileLocations, if any raw video locations are configured
+    def chooseDestination(self, recordingID):
+        if self.fileLocations is not None:
+            locationID = self.fileLocations.chooseLocation('rawVideo')
+            if locationID is not None:
+                return self.fileLocations.getRawVideoFilespec(locationID, recordingID)
+        return self.videoFilespec.format(recordingID=recordingID)
+
+    # asks 'diskSpaceCallback' for room for the recording, without letting it hold up (or stop) the recording: it runs
+    # in a thread of its own, which is given 'diskSpaceTimeout' seconds before the recording starts anyway, and any
+    # error is logged (the periodic free space check will try again)
+    def makeRoom(self, destinationFile, duration):
+        def makeRoomInBackground():
+            try:
+                self.diskSpaceCallback(destinationFile, duration)
+            except Exception as e:
+                self.logger.error('Unable to make room for {}: {}'.format(destinationFile, e))
+        thread = threading.Thread(target=makeRoomInBackground, name='makeRoom', daemon=True)
+        thread.start()
+        thread.join(self.diskSpaceTimeout)
+        if thread.is_alive():
+            self.logger.warning('Still making room for {} after {} seconds; recording anyway'.format(destinationFile, self.diskSpaceTimeout))
 
     def record(self, schedule):
         self.logger.info("Recording channel {}-{}".format(schedule.channelMajor, schedule.channelMinor))
         recordingID = self.dbInterface.getUniqueID()
-        destinationFile = self.videoFilespec.format(recordingID=recordingID)
+        destinationFile = self.chooseDestination(recordingID)
         logFile = self.logFilespec.format(recordingID=recordingID)
         stopTime = schedule.startTime + schedule.duration
+        if self.diskSpaceCallback is not None:
+            self.makeRoom(destinationFile, schedule.duration)
         self.dbInterface.insertRecording(recordingID, schedule.showID, schedule.episodeID, schedule.duration, schedule.rerunCode)
+        self.publishStatus('recordingStarted', recordingID=recordingID, showID=schedule.showID, episodeID=schedule.episodeID,
+                           channel='{}.{}'.format(schedule.channelMajor, schedule.channelMinor), stopTime=stopTime.isoformat())
         try:
             self.hdhomerunInterface.record(schedule.channelMajor, schedule.channelMinor, stopTime, destinationFile, logFile)
             self.logger.info("Successfully recorded")
             self.dbInterface.insertRawVideoLocation(recordingID, destinationFile);
+            self.publishStatus('recordingFinished', recordingID=recordingID, success=True)
         except (UnrecognizedChannelException, NoTunersAvailableException, BadRecordingException):
             self.logger.error("Recording failed")
+            self.publishStatus('recordingFinished', recordingID=recordingID, success=False)
 
 
@@ -3,6 +3,7 @@ import os
 import psycopg2
 #from carbonDVRDatabase import CarbonDVRDatabase
 from recorder import CarbonDVRDatabase
+from dbPool import DBPool
 from datetime import timedelta
 
 
@@ -27,9 +28,12 @@ class TestDatabase(unittest.TestCase):
             with self.dbConnection.cursor() as cursor:
                 cursor.execute("SET SCHEMA %s", (schema, ))
 
+        self.dbPool = DBPool(dbConnectString, schema)
+
         self.clearDatabase()
 
     def tearDown(self):
+        self.dbPool.close()
         self.dbConnection.close()
 
     def clearDatabase(self):
@@ -74,10 +78,17 @@ class TestDatabase(unittest.TestCase):
             cursor.execute("INSERT INTO channel(major, minor, actual, program) VALUES (%s, %s, %s, %s)", (channelMajor, channelMinor, channelActual, program))
             return cursor.rowcount
 
+    def insertSchedule(self, channelMajor, channelMinor, startTime, duration, showID, episodeID, rerunCode):
+        with self.dbConnection.cursor() as cursor:
+            cursor.execute("INSERT INTO schedule(channel_major, channel_minor, start_time, duration, show_id, episode_id, rerun_code) "
+                           "VALUES (%s, %s, now() + %s, %s, %s, %s, %s)",
+                           (channelMajor, channelMinor, startTime, duration, showID, episodeID, rerunCode))
+            return cursor.rowcount
+
     def test_carbonDVRDatabase_getTuners(self):
         self.assertEqual(1, self.insertTuner('foo','192.168.1.1',1))
         self.assertEqual(1, self.insertTuner('baz','10.10.10.1',0))
-        db = CarbonDVRDatabase(self.dbConnection)
+        db = CarbonDVRDatabase(self.dbPool)
         tuners = sorted(db.getTuners(), key=lambda tuner:tuner.deviceID)
         self.assertEqual(2, len(tuners))
         self.assertEqual('baz', tuners[0].deviceID)
@@ -91,7 +102,7 @@ class TestDatabase(unittest.TestCase):
         self.assertEqual(1, self.insertChannel(4,1,5,1))
         self.assertEqual(1, self.insertChannel(19,3,18,2))
         self.assertEqual(1, self.insertChannel(5,2,37,3))
-        db = CarbonDVRDatabase(self.dbConnection)
+        db = CarbonDVRDatabase(self.dbPool)
         channels = sorted(db.getChannels(), key=lambda channel:channel.channelMajor)
         self.assertEqual(3, len(channels))
         self.assertEqual(4, channels[0].channelMajor)
@@ -109,14 +120,46 @@ class TestDatabase(unittest.TestCase):
 
     # trivial 'does it throw an exception' test
     def test_carbonDVRDatabase_getPendingRecordings(self):
-        db = CarbonDVRDatabase(self.dbConnection)
+        db = CarbonDVRDatabase(self.dbPool)
         pendingRecordings = db.getPendingRecordings(timedelta(hours=12))
-        
+
+    # upcoming_recording is maintained by triggers, as schedules, subscriptions and recordings change
+    def test_carbonDVRDatabase_getPendingRecordings_upcomingRecordings(self):
+        self.insertChannel(4, 1, 5, 1)
+        self.insertShow('show', 'EP', 'foo')
+        self.insertEpisode('show', 'episode1', 'foo', 'foo')
+        self.insertEpisode('show', 'episode2', 'foo', 'foo')
+        self.insertSchedule(4, 1, timedelta(hours=1), timedelta(minutes=30), 'show', 'episode1', 'R')
+        self.insertSchedule(4, 1, timedelta(hours=2), timedelta(minutes=30), 'show', 'episode2', 'R')
+        self.insertSchedule(4, 1, timedelta(hours=3), timedelta(minutes=30), 'show', 'episode2', 'R')
+        self.insertSchedule(4, 1, timedelta(hours=24), timedelta(minutes=30), 'show', 'episode1', 'R')
+        db = CarbonDVRDatabase(self.dbPool)
+        self.assertEqual([], db.getPendingRecordings(timedelta(hours=12)))
+
+        self.insertSubscription('show', 1)
+        pendingRecordings = sorted(db.getPendingRecordings(timedelta(hours=12)), key=lambda schedule:schedule.startTime)
+        self.assertEqual(['episode1', 'episode2'], [schedule.episodeID for schedule in pendingRecordings])
+        self.assertLess(pendingRecordings[1].startTime, pendingRecordings[0].startTime + timedelta(hours=1, minutes=30))
+
+        self.insertRecording(1, 'show', 'episode1', '1970-01-01', timedelta(minutes=30), 'R')
+        self.assertEqual(2, len(db.getPendingRecordings(timedelta(hours=12))))
+        db.insertRawVideoLocation(recordingID='1', filename='1')
+        pendingRecordings = db.getPendingRecordings(timedelta(hours=12))
+        self.assertEqual(['episode2'], [schedule.episodeID for schedule in pendingRecordings])
+
+        with self.dbConnection.cursor() as cursor:
+            cursor.execute("DELETE FROM file_raw_video")
+        self.assertEqual(2, len(db.getPendingRecordings(timedelta(hours=12))))
+
+        with self.dbConnection.cursor() as cursor:
+            cursor.execute("DELETE FROM subscription")
+        self.assertEqual([], db.getPendingRecordings(timedelta(hours=12)))
+
     # trivial 'does it throw an exception' test
     def test_carbonDVRDatabase_insertRecording(self):
         self.insertShow('show','EP','foo')
         self.insertEpisode('show','episode','foo','foo')
-        db = CarbonDVRDatabase(self.dbConnection)
+        db = CarbonDVRDatabase(self.dbPool)
         rowsInserted = db.insertRecording(recordingID='1',showID='show', episodeID='episode',duration='1',rerunCode='R')
         
     # trivial 'does it throw an exception' test
@@ -124,7 +167,7 @@ class TestDatabase(unittest.TestCase):
         self.insertShow('show','EP','foo')
         self.insertEpisode('show','episode','foo','foo')
         self.insertRecording(1,'show','episode', '1970-01-01', timedelta(minutes=30), 'R')
-        db = CarbonDVRDatabase(self.dbConnection)
+        db = CarbonDVRDatabase(self.dbPool)
         rowsInserted = db.insertRawVideoLocation(recordingID='1',filename='1')
 
 
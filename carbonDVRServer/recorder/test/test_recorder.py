@@ -1,4 +1,5 @@
 import pytz
+import threading
 import unittest
 from apscheduler.schedulers.background import BlockingScheduler
 from recorder.carbonDVRDatabase import CarbonDVRDatabase
@@ -64,6 +65,62 @@ class TestRecorder(unittest.TestCase):
         call2 = call(recorder.record, args=[mockPendingRecordings[2]], trigger='date', run_date=mockPendingRecordings[2].startTime, misfire_grace_time=60)
         self.assertEqual(recorder.scheduler.add_job.call_args_list[2], call2)
 
+    def test_recorder_scheduleRecordings_showIDs(self):
+        scheduler = Mock(BlockingScheduler)
+        scheduler.get_jobs.return_value = []
+        hdhomerun = Mock(HDHomeRunInterface)
+        db = Mock(CarbonDVRDatabase)
+        db.getPendingRecordings.return_value = []
+        recorder = Recorder(scheduler, hdhomerun, db, 'recs', 'logs')
+        recorder.logger = Mock()
+        recorder.scheduler = Mock()
+        # given: recording jobs for two shows, and a pending recording for one of them
+        recorder.scheduler.get_jobs.return_value = [ Bunch(func=recorder.record, id=3, args=[Bunch(showID='show1')]),
+                                                     Bunch(func=recorder.scheduleRecordings, id=1, args=[]),
+                                                     Bunch(func=recorder.record, id=4, args=[Bunch(showID='show2')]) ]
+        pendingRecording = Bunch(channelMajor=1, channelMinor=2, startTime=datetime(2000,1,1,12,00,00, tzinfo=pytz.utc), showID='show1')
+        db.getPendingRecordings.reset_mock()
+        db.getPendingRecordings.return_value = [pendingRecording]
+        # when: scheduleRecordings, for one show
+        recorder.scheduleRecordings({'show1'})
+        # then: only that show's jobs are replaced
+        recorder.scheduler.remove_job.assert_called_once_with(3)
+        db.getPendingRecordings.assert_called_once_with(timedelta(hours=12), {'show1'})
+        recorder.scheduler.add_job.assert_called_once_with(recorder.record, args=[pendingRecording], trigger='date',
+                                                            run_date=pendingRecording.startTime, misfire_grace_time=60)
+
+    def test_recorder_requestReschedule(self):
+        scheduler = Mock(BlockingScheduler)
+        scheduler.get_jobs.return_value = []
+        hdhomerun = Mock(HDHomeRunInterface)
+        db = Mock(CarbonDVRDatabase)
+        db.getPendingRecordings.return_value = []
+        recorder = Recorder(scheduler, hdhomerun, db, 'recs', 'logs')
+        recorder.scheduler = Mock()
+        recorder.scheduleRecordings = Mock()
+        # when: a burst of requests
+        recorder.requestReschedule('show1')
+        recorder.requestReschedule('show2')
+        recorder.requestReschedule('show1')
+        # then: each one replaces the same job, and nothing is scheduled until it runs
+        self.assertEqual(3, recorder.scheduler.add_job.call_count)
+        for args, kwargs in recorder.scheduler.add_job.call_args_list:
+            self.assertEqual(recorder.reschedule, args[0])
+            self.assertEqual('reschedule', kwargs['id'])
+            self.assertTrue(kwargs['replace_existing'])
+        self.assertFalse(recorder.scheduleRecordings.called)
+        # when: the job runs, then: one reschedule, of the shows that changed
+        recorder.reschedule()
+        recorder.scheduleRecordings.assert_called_once_with({'show1', 'show2'})
+        recorder.reschedule()
+        recorder.scheduleRecordings.assert_called_once_with({'show1', 'show2'})
+        # a request without a show reschedules everything
+        recorder.requestReschedule('show1')
+        recorder.requestReschedule()
+        recorder.requestReschedule('show2')
+        recorder.reschedule()
+        recorder.scheduleRecordings.assert_called_with(None)
+
     def test_recorder_record_success(self):
         scheduler = Mock(BlockingScheduler)
         scheduler.get_jobs.return_value = []
@@ -96,6 +153,55 @@ class TestRecorder(unittest.TestCase):
                                                  '/var/spool/carbondvr/recordings/raw_58162.mp4', '/var/log/carbondvr/recordings/rec58162.log')
         self.assertFalse(db.insertRawVideoLocation.called)
 
+    def test_recorder_record_diskSpaceCallback(self):
+        scheduler = Mock(BlockingScheduler)
+        scheduler.get_jobs.return_value = []
+        hdhomerun = Mock(HDHomeRunInterface)
+        db = Mock(CarbonDVRDatabase)
+        db.getPendingRecordings.return_value = []
+        diskSpaceCallback = Mock()
+        recorder = Recorder(scheduler, hdhomerun, db, 'rec/recording_{recordingID}.mp4', 'logs/recording_{recordingID}.log', diskSpaceCallback)
+        recorder.logger = Mock()
+        schedule = Bunch(channelMajor=1, channelMinor=2, startTime=datetime(1970,1,1,0,0,0), duration=timedelta(minutes=30), showID='show1', episodeID='episode1', rerunCode='R')
+        db.getUniqueID.return_value = 12
+        recorder.record(schedule)
+        diskSpaceCallback.assert_called_once_with('rec/recording_12.mp4', timedelta(minutes=30))
+        hdhomerun.record.assert_called_once_with(1, 2, datetime(1970,1,1,0,0,0) + timedelta(minutes=30), 'rec/recording_12.mp4', 'logs/recording_12.log')
+
+    def test_recorder_record_diskSpaceCallbackFails(self):
+        scheduler = Mock(BlockingScheduler)
+        scheduler.get_jobs.return_value = []
+        hdhomerun = Mock(HDHomeRunInterface)
+        db = Mock(CarbonDVRDatabase)
+        db.getPendingRecordings.return_value = []
+        diskSpaceCallback = Mock(side_effect=OSError('No such file or directory'))
+        recorder = Recorder(scheduler, hdhomerun, db, 'rec/recording_{recordingID}.mp4', 'logs/recording_{recordingID}.log', diskSpaceCallback)
+        recorder.logger = Mock()
+        schedule = Bunch(channelMajor=1, channelMinor=2, startTime=datetime(1970,1,1,0,0,0), duration=timedelta(minutes=30), showID='show1', episodeID='episode1', rerunCode='R')
+        db.getUniqueID.return_value = 12
+        recorder.record(schedule)
+        self.assertTrue(recorder.logger.error.called)
+        db.insertRecording.assert_called_once_with(12, 'show1', 'episode1', timedelta(minutes=30), 'R')
+        hdhomerun.record.assert_called_once_with(1, 2, datetime(1970,1,1,0,0,0) + timedelta(minutes=30), 'rec/recording_12.mp4', 'logs/recording_12.log')
+
+    def test_recorder_record_diskSpaceCallbackSlow(self):
+        scheduler = Mock(BlockingScheduler)
+        scheduler.get_jobs.return_value = []
+        hdhomerun = Mock(HDHomeRunInterface)
+        db = Mock(CarbonDVRDatabase)
+        db.getPendingRecordings.return_value = []
+        finished = threading.Event()
+        diskSpaceCallback = Mock(side_effect=lambda destinationFile, duration: finished.wait(5))
+        recorder = Recorder(scheduler, hdhomerun, db, 'rec/recording_{recordingID}.mp4', 'logs/recording_{recordingID}.log', diskSpaceCallback,
+                            diskSpaceTimeout=0.1)
+        recorder.logger = Mock()
+        schedule = Bunch(channelMajor=1, channelMinor=2, startTime=datetime(1970,1,1,0,0,0), duration=timedelta(minutes=30), showID='show1', episodeID='episode1', rerunCode='R')
+        db.getUniqueID.return_value = 12
+        recorder.record(schedule)
+        finished.set()
+        self.assertTrue(recorder.logger.warning.called)
+        self.assertTrue(hdhomerun.record.called)
+
 
 if __name__ == '__main__':
     unittest.main()  
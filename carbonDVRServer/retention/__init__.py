@@ -0,0 +1 @@
+from retention.retention import Retention
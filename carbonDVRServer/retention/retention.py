@@ -0,0 +1,170 @@
+#!/usr/bin/env python3.4
+
+import os, os.path
+import logging
+import psycopg2
+import shutil
+import threading
+
+
+class Bunch:
+    def __init__(self, **kwds):
+        self.__dict__.update(kwds)
+
+
+# returns the ID of the filesystem that holds 'path' (or, if 'path' doesn't exist, its nearest existing parent)
+def getDevice(path):
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return os.stat(path).st_dev
+
+
+#
+# Notes on eviction
+#
+# When a volume runs short of space, recordings are evicted in this order:
+#     0: recordings beyond the show's keep count (the oldest are evicted first): the keep_count in its retention_rule,
+#        which is set on the show list page, or, if it has none, 'defaultKeepCount' (RETENTION_DEFAULT_KEEP_COUNT; if
+#        that's unset too, the show's recordings are only evicted as below)
+#     1: reruns which have been (at least partially) watched
+# and, only if 'extendedEviction' is set (RETENTION_EXTENDED_EVICTION=1):
+#     2: new episodes which have been (at least partially) watched
+#     3: reruns which have not been watched
+# Archived recordings, and unwatched new episodes, are never evicted, unless a retention rule says otherwise.
+# Within each group, the oldest recordings are evicted first.  A recording is only evicted if it frees space on the volume
+# that's running short; evicting a recording whose files are all on another volume wouldn't help.
+#
+
+class Retention:
+    def __init__(self, dbPool, fileLocations, cleanup, recordingDirectory, minimumFreeBytes, recordingBitrate, recordingsChangedCallback=None,
+                 extendedEviction=False, defaultKeepCount=None):
+        self.logger = logging.getLogger(__name__)
+        self.evictionLock = threading.Lock()
+        self.dbPool = dbPool
+        self.fileLocations = fileLocations
+        self.cleanup = cleanup
+        self.recordingDirectory = recordingDirectory
+        self.minimumFreeBytes = minimumFreeBytes
+        self.recordingBitrate = recordingBitrate
+        self.recordingsChangedCallback = recordingsChangedCallback
+        self.extendedEviction = extendedEviction
+        self.defaultKeepCount = defaultKeepCount
+        self.logger.debug("Recording directory: {}".format(self.recordingDirectory))
+        self.logger.debug("Minimum free space: {} bytes".format(self.minimumFreeBytes))
+        self.logger.debug("Estimated recording bitrate: {}b/s".format(self.recordingBitrate))
+        self.logger.debug("Extended eviction: {}".format(self.extendedEviction))
+        self.logger.debug("Default keep count: {}".format(self.defaultKeepCount))
+
+    def dbGetFilesWithoutSize(self):
+        files = []
+        query = str("SELECT 'file_raw_video', recording_id, filename FROM file_raw_video WHERE size IS NULL "
+                    "UNION ALL "
+                    "SELECT 'file_transcoded_video', recording_id, filename FROM file_transcoded_video WHERE size IS NULL AND state = 0 "
+                    "UNION ALL "
+                    "SELECT 'file_bif', recording_id, filename FROM file_bif WHERE size IS NULL;")
+        with self.dbPool.connection('files_without_size') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query)
+                for row in cursor:
+                    files.append(Bunch(table=row[0], recordingID=row[1], filename=row[2]))
+        return files
+
+    def dbSetFileSize(self, table, recordingID, size):
+        # 'table' comes from dbGetFilesWithoutSize, never from user input
+        with self.dbPool.connection('set_file_size') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute('UPDATE {} SET size = %s WHERE recording_id = %s;'.format(table), (size, recordingID))
+
+    def dbGetEvictionCandidates(self):
+        candidates = []
+        query = str("SELECT recording.recording_id, show.name, recording.rerun_code, "
+                    "  file_raw_video.filename, file_raw_video.size, "
+                    "  file_transcoded_video.filename, file_transcoded_video.size, "
+                    "  file_bif.filename, file_bif.size, "
+                    "  CASE WHEN ranked.newer_recordings > coalesce(retention_rule.keep_count, %(defaultKeepCount)s) THEN 0 "
+                    "       WHEN recording.rerun_code = 'R' AND playback_position.position > 0 THEN 1 "
+                    "       WHEN playback_position.position > 0 THEN 2 "
+                    "       ELSE 3 END AS priority "
+                    "FROM recording "
+                    "INNER JOIN show ON (recording.show_id = show.show_id) "
+                    "INNER JOIN (SELECT recording_id, row_number() OVER (PARTITION BY show_id ORDER BY date_recorded DESC) AS newer_recordings "
+                    "            FROM recording WHERE rerun_code <> 'A') AS ranked ON (recording.recording_id = ranked.recording_id) "
+                    "LEFT JOIN retention_rule ON (recording.show_id = retention_rule.show_id) "
+                    "LEFT JOIN playback_position ON (recording.recording_id = playback_position.recording_id) "
+                    "LEFT JOIN file_raw_video ON (recording.recording_id = file_raw_video.recording_id) "
+                    "LEFT JOIN file_transcoded_video ON (recording.recording_id = file_transcoded_video.recording_id) "
+                    "LEFT JOIN file_bif ON (recording.recording_id = file_bif.recording_id) "
+                    "WHERE ranked.newer_recordings > coalesce(retention_rule.keep_count, %(defaultKeepCount)s) "
+                    "OR (recording.rerun_code = 'R' AND playback_position.position > 0) "
+                    "OR (%(extendedEviction)s AND (playback_position.position > 0 OR recording.rerun_code = 'R')) "
+                    "ORDER BY priority, recording.date_recorded;")
+        with self.dbPool.connection('eviction_candidates') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query, {'extendedEviction': self.extendedEviction, 'defaultKeepCount': self.defaultKeepCount})
+                for row in cursor:
+                    files = [Bunch(filename=row[3], size=row[4]), Bunch(filename=row[5], size=row[6]), Bunch(filename=row[7], size=row[8])]
+                    candidates.append(Bunch(recordingID=row[0], show=row[1], rerunCode=row[2], files=[f for f in files if f.filename], priority=row[9]))
+        return candidates
+
+    def dbDeleteRecording(self, recordingID):
+        with self.dbPool.connection('evict_recording') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute('DELETE FROM recording WHERE recording_id = %s;', (recordingID, ))
+
+    def updateFileSizes(self):
+        for file in self.dbGetFilesWithoutSize():
+            if os.path.isfile(file.filename):
+                self.dbSetFileSize(file.table, file.recordingID, os.path.getsize(file.filename))
+
+    def reclaimableBytes(self, candidate, device, deviceCache):
+        reclaimable = 0
+        for file in candidate.files:
+            directory = os.path.dirname(file.filename)
+            if directory not in deviceCache:
+                deviceCache[directory] = getDevice(directory)
+            if deviceCache[directory] == device and file.size:
+                reclaimable += file.size
+        return reclaimable
+
+    # evict recordings until 'directory' has at least 'requiredBytes' free; returns False if that isn't possible
+    def makeRoom(self, directory, requiredBytes):
+        with self.evictionLock:
+            freeBytes = shutil.disk_usage(directory).free
+            if freeBytes >= requiredBytes:
+                return True
+            self.logger.warning('{} has {} bytes free, {} bytes needed'.format(directory, freeBytes, requiredBytes))
+            self.updateFileSizes()
+            device = getDevice(directory)
+            deviceCache = {}
+            for candidate in self.dbGetEvictionCandidates():
+                reclaimable = self.reclaimableBytes(candidate, device, deviceCache)
+                if reclaimable == 0:
+                    continue
+                self.logger.info('Evicting recording {} ({}, category {}, priority {}) to reclaim {} bytes'.format(
+                    candidate.recordingID, candidate.show, candidate.rerunCode, candidate.priority, reclaimable))
+                self.dbDeleteRecording(candidate.recordingID)
+                if self.recordingsChangedCallback is not None:
+                    self.recordingsChangedCallback()
+                self.cleanup.purgeDeletedRecording(candidate.recordingID)
+                freeBytes = shutil.disk_usage(directory).free
+                if freeBytes >= requiredBytes:
+                    return True
+            self.logger.error('Unable to free enough space in {}: {} bytes free, {} bytes needed'.format(directory, freeBytes, requiredBytes))
+            return False
+
+    # called by the recorder, before it starts recording to 'destinationFile'
+    def makeRoomForRecording(self, destinationFile, duration):
+        requiredBytes = int(duration.total_seconds() * self.recordingBitrate / 8) + self.minimumFreeBytes
+        return self.makeRoom(os.path.dirname(destinationFile), requiredBytes)
+
+    def checkFreeSpace(self):
+        self.updateFileSizes()
+        directories = self.fileLocations.getDirectories()
+        directories.add(self.recordingDirectory)
+        for directory in sorted(directories):
+            if os.path.isdir(directory):
+                self.makeRoom(directory, self.minimumFreeBytes)
@@ -0,0 +1,57 @@
+import unittest
+from retention.retention import Retention
+from unittest.mock import MagicMock, Mock, patch
+
+
+class Bunch:
+    def __init__(self, **kwds):
+        self.__dict__.update(kwds)
+
+
+class TestRetention(unittest.TestCase):
+
+    def setUp(self):
+        self.cleanup = Mock()
+        self.retention = Retention(Mock(), Mock(), self.cleanup, '/recordings', 1000, 8000)
+        self.retention.logger = Mock()
+        self.retention.updateFileSizes = Mock()
+        self.retention.dbDeleteRecording = Mock()
+
+    def test_retention_makeRoom_enoughSpace(self):
+        self.retention.dbGetEvictionCandidates = Mock()
+        with patch('retention.retention.shutil.disk_usage', return_value=Bunch(free=5000)):
+            self.assertTrue(self.retention.makeRoom('/recordings', 5000))
+        self.assertFalse(self.retention.dbGetEvictionCandidates.called)
+        self.assertFalse(self.retention.dbDeleteRecording.called)
+
+    def test_retention_makeRoom_evictsUntilEnoughSpace(self):
+        # given: three candidates, the first of which has no files on the volume that's short of space
+        self.retention.dbGetEvictionCandidates = Mock(return_value=[
+            Bunch(recordingID=1, show='a', rerunCode='R', priority=0, files=[Bunch(filename='/transcoded/1.mp4', size=3000)]),
+            Bunch(recordingID=2, show='b', rerunCode='R', priority=1, files=[Bunch(filename='/recordings/2.ts', size=3000)]),
+            Bunch(recordingID=3, show='c', rerunCode='R', priority=3, files=[Bunch(filename='/recordings/3.ts', size=3000)]) ])
+        devices = {'/recordings': 1, '/transcoded': 2}
+        with patch('retention.retention.getDevice', side_effect=lambda path: devices[path]), \
+             patch('retention.retention.shutil.disk_usage', side_effect=[Bunch(free=1000), Bunch(free=4000)]):
+            self.assertTrue(self.retention.makeRoom('/recordings', 3500))
+        # then: only the recording on the same volume is evicted, and eviction stops once there's enough room
+        self.retention.dbDeleteRecording.assert_called_once_with(2)
+        self.cleanup.purgeDeletedRecording.assert_called_once_with(2)
+
+    def test_retention_makeRoom_notEnoughCandidates(self):
+        self.retention.dbGetEvictionCandidates = Mock(return_value=[])
+        with patch('retention.retention.getDevice', return_value=1), \
+             patch('retention.retention.shutil.disk_usage', return_value=Bunch(free=10)):
+            self.assertFalse(self.retention.makeRoom('/recordings', 3500))
+
+    def test_retention_extendedEvictionIsOptIn(self):
+        dbPool = MagicMock()
+        cursor = dbPool.connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        cursor.__iter__.return_value = iter([])
+        for extendedEviction in (False, True):
+            Retention(dbPool, Mock(), Mock(), '/recordings', 1000, 8000, extendedEviction=extendedEviction).dbGetEvictionCandidates()
+            self.assertEqual({'extendedEviction': extendedEviction, 'defaultKeepCount': None}, cursor.execute.call_args[0][1])
+
+
+if __name__ == '__main__':
+    unittest.main()
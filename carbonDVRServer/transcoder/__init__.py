@@ -1 +1,4 @@
 from transcoder.transcoder import Transcoder
+from transcoder.transcoder import TranscoderCommandError
+from transcoder.transcoder import checkCommand
+from transcoder.transcoder import hasOtherDestinations
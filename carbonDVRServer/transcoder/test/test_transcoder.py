@@ -0,0 +1,196 @@
+import datetime
+import os
+import sys
+import tempfile
+import unittest
+from transcoder import Transcoder, TranscoderCommandError, checkCommand, hasOtherDestinations
+from fileLocations import FileLocations
+from transcoder.transcoder import runCommand, makeFfmpegProgress
+from unittest.mock import MagicMock, Mock, call
+
+
+# writes ffmpeg-like progress to stderr, rewriting the status line with carriage returns
+FAKE_FFMPEG = str("import sys; sys.stderr.write('Input #0\\n'); "
+                  "[sys.stderr.write('frame={} fps=30 time=00:{:02d}:00.00 bitrate=1.0kbits/s speed=2.5x\\r'.format(i, i)) for i in (15, 30, 45, 60)]")
+
+# writes progress in the form given by -progress pipe:1
+FAKE_FFMPEG_PROGRESS = str("import sys; "
+                           "[sys.stdout.write('frame={}\\nfps=24.5\\nout_time_us={}\\nout_time=00:00:{:02d}.000000\\nspeed={}\\nprogress={}\\n'.format(i, i * 1000000, i, s, p)) "
+                           "for i, s, p in ((0, 'N/A', 'continue'), (10, '1.5x', 'continue'), (20, '1.6x', 'end'))]")
+
+
+class TestTranscoderHls(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.fileLocations = Mock()
+        self.fileLocations.chooseLocation.return_value = 2
+        self.fileLocations.getHlsDirectory.side_effect = lambda locationID, recordingID: os.path.join(self.tempDir.name, str(recordingID))
+        self.logFile = os.path.join(self.tempDir.name, '5.log')
+
+    def tearDown(self):
+        self.tempDir.cleanup()
+
+    def makeTranscoder(self, hlsCommand):
+        transcoder = Transcoder(Mock(), 'low', 'medium', 'high', '/video/{recordingID}.mp4', '/log/{recordingID}.log', self.fileLocations,
+                                hlsCommand=hlsCommand)
+        transcoder.dbInsertHlsFileLocation = Mock()
+        transcoder.dbStartTranscodeJob = Mock()
+        transcoder.dbFinishTranscodeJob = Mock()
+        return transcoder
+
+    def test_transcoder_hls(self):
+        transcoder = self.makeTranscoder('touch "{destDir}/master.m3u8" {destDir}/stream_0.m3u8')
+        transcoder.makeHls(5, '/raw/5.ts', self.logFile)
+        destDir = os.path.join(self.tempDir.name, '5')
+        self.assertTrue(os.path.isfile(os.path.join(destDir, 'master.m3u8')))
+        self.fileLocations.chooseLocation.assert_called_once_with('hls')
+        transcoder.dbInsertHlsFileLocation.assert_called_once_with(5, 2, destDir, 0)
+        transcoder.dbStartTranscodeJob.assert_called_once_with(5, 'hls', datetime.timedelta(seconds=0))
+        transcoder.dbFinishTranscodeJob.assert_called_once_with(5, 'hls', 0, 100, None, None)
+
+    def test_transcoder_hlsPathWithSpaces(self):
+        destDir = os.path.join(self.tempDir.name, "Bob's recordings", '5')
+        self.fileLocations.getHlsDirectory.side_effect = None
+        self.fileLocations.getHlsDirectory.return_value = destDir
+        transcoder = self.makeTranscoder('touch {destDir}/master.m3u8')
+        transcoder.makeHls(5, '/raw/5.ts', self.logFile)
+        self.assertTrue(os.path.isfile(os.path.join(destDir, 'master.m3u8')))
+        transcoder.dbInsertHlsFileLocation.assert_called_once_with(5, 2, destDir, 0)
+
+    def test_transcoder_hlsFailed(self):
+        transcoder = self.makeTranscoder('false {sourceFile} {destDir}')
+        transcoder.makeHls(5, '/raw/5.ts', self.logFile)
+        destDir = os.path.join(self.tempDir.name, '5')
+        self.assertFalse(os.path.exists(destDir))
+        transcoder.dbInsertHlsFileLocation.assert_called_once_with(5, 2, destDir, 1)
+        transcoder.dbFinishTranscodeJob.assert_called_once_with(5, 'hls', 1, 0, None, None)
+
+    def test_transcoder_hlsNotConfigured(self):
+        transcoder = self.makeTranscoder(None)
+        transcoder.makeHls(5, '/raw/5.ts', self.logFile)
+        self.fileLocations.chooseLocation.return_value = None
+        self.makeTranscoder('touch {destDir}/master.m3u8').makeHls(5, '/raw/5.ts', self.logFile)
+        self.assertFalse(os.path.exists(os.path.join(self.tempDir.name, '5')))
+
+    def test_transcoder_mp4PublishedBeforeHls(self):
+        events = Mock()
+        transcoder = Transcoder(Mock(), 'low', 'medium', 'high', '/video/{recordingID}.mp4', self.logFile, self.fileLocations,
+                                events.recordingsChanged, 'touch {destDir}/master.m3u8', events.status)
+        self.fileLocations.chooseLocation.return_value = None        # the MP4 goes to the fallback
+        transcoder.dbSelectRecordingsToTranscode = Mock(return_value=[{'recordingID': 5, 'filename': '/raw/5.ts'}])
+        transcoder.dbGetDuration = Mock(return_value=datetime.timedelta(minutes=30))
+        transcoder.dbInsertTranscodedFileLocation = Mock()
+        transcoder.transcode = Mock(return_value=True)
+        events.makeHls.return_value = True
+        transcoder.makeHls = lambda *args: events.makeHls()
+        transcoder.transcodeRecordings()
+        self.assertEqual([call.status('transcodeFinished', recordingID=5, success=True),
+                          call.recordingsChanged(),
+                          call.makeHls(),
+                          call.status('transcodeFinished', recordingID=5, stage='hls', success=True),
+                          call.recordingsChanged()], events.mock_calls)
+
+
+class TestTranscoderCommands(unittest.TestCase):
+
+    def test_transcoder_checkCommand(self):
+        checkCommand('ffmpeg -i {sourceFile} -c:v libx264 {destFile}')
+        checkCommand('ffmpeg -i {sourceFile} -f hls {destDir}/stream_%v.m3u8', ('sourceFile', 'destDir'))
+        with self.assertRaisesRegex(TranscoderCommandError, r'\{destFile\}'):
+            checkCommand('ffmpeg -i {sourceFile} /video/{recordingID}.mp4')
+        with self.assertRaises(TranscoderCommandError):
+            checkCommand('ffmpeg -i {sourceFile {destFile}')
+
+    def test_transcoder_baselineCommand(self):
+        # a command that only uses {recordingID} is accepted when the fallback is the only destination
+        self.assertFalse(hasOtherDestinations(None, '/video/{recordingID}.mp4'))
+        sameAsFallback = FileLocations('{"fileLocations": {"transcodedVideo": [{"id": 1, "filespec": "/video/{recordingID}.mp4", "url": "http://dvr/{recordingID}.mp4"}]}}')
+        self.assertFalse(hasOtherDestinations(sameAsFallback, '/video/{recordingID}.mp4'))
+        self.assertEqual(['sourceFile', 'destFile'], checkCommand('ffmpeg -i /raw/{recordingID}.ts /video/{recordingID}.mp4', (), ('sourceFile', 'destFile')))
+        # but not when there are other locations
+        elsewhere = FileLocations('{"fileLocations": {"transcodedVideo": [{"id": 2, "filespec": "/big/{recordingID}.mp4", "url": "http://dvr/{recordingID}.mp4"}]}}')
+        self.assertTrue(hasOtherDestinations(elsewhere, '/video/{recordingID}.mp4'))
+        # and it still transcodes, to the fallback
+        with tempfile.TemporaryDirectory() as tempDir:
+            outputFilespec = os.path.join(tempDir, '{recordingID}.mp4')
+            transcoder = Transcoder(Mock(), 'touch ' + outputFilespec, 'touch ' + outputFilespec, 'touch ' + outputFilespec, outputFilespec,
+                                    os.path.join(tempDir, '{recordingID}.log'))
+            transcoder.dbSelectRecordingsToTranscode = Mock(return_value=[{'recordingID': 5, 'filename': '/raw/5.ts'}])
+            transcoder.dbGetDuration = Mock(return_value=datetime.timedelta(minutes=30))
+            transcoder.dbInsertTranscodedFileLocation = Mock()
+            transcoder.dbStartTranscodeJob = Mock()
+            transcoder.dbFinishTranscodeJob = Mock()
+            transcoder.transcodeRecordings()
+            self.assertTrue(os.path.isfile(os.path.join(tempDir, '5.mp4')))
+            transcoder.dbInsertTranscodedFileLocation.assert_called_once_with(5, 1, os.path.join(tempDir, '5.mp4'), 0)
+
+    def test_transcoder_isTranscodingReset(self):
+        transcoder = Transcoder(Mock(), 'low', 'medium', 'high', '/video/{recordingID}.mp4', '/log/{recordingID}.log')
+        transcoder.dbSelectRecordingsToTranscode = Mock(side_effect=RuntimeError('database went away'))
+        with self.assertRaises(RuntimeError):
+            transcoder.transcodeRecordings()
+        self.assertFalse(transcoder.isTranscoding)
+
+    def test_transcoder_abandonUnfinishedJobs(self):
+        transcoder = Transcoder(MagicMock(), 'low', 'medium', 'high', '/video/{recordingID}.mp4', '/log/{recordingID}.log')
+        cursor = transcoder.dbPool.connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        cursor.rowcount = 1
+        transcoder.abandonUnfinishedJobs()
+        query = cursor.execute.call_args[0][0]
+        self.assertIn('state = 2', query)
+        self.assertIn('WHERE finish_time IS NULL', query)
+
+
+class TestTranscoderProgress(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.logFile = os.path.join(self.tempDir.name, '5.log')
+
+    def tearDown(self):
+        self.tempDir.cleanup()
+
+    def runFakeFfmpeg(self, script):
+        progress = []
+        with open(self.logFile, 'wb') as logFileHandle:
+            result = runCommand([sys.executable, '-c', script], logFileHandle, progress.append)
+        self.assertEqual(0, result)
+        return [(p.seconds, p.fps, p.speed) for p in progress]
+
+    def test_transcoder_runCommand(self):
+        self.assertEqual([(900.0, 30.0, 2.5), (1800.0, 30.0, 2.5), (2700.0, 30.0, 2.5), (3600.0, 30.0, 2.5)], self.runFakeFfmpeg(FAKE_FFMPEG))
+        with open(self.logFile, 'rb') as logFileHandle:
+            self.assertIn(b'time=00:45:00.00', logFileHandle.read())
+
+    def test_transcoder_runCommand_progressPipe(self):
+        self.assertEqual([(0.0, 24.5, None), (10.0, 24.5, 1.5), (20.0, 24.5, 1.6)], self.runFakeFfmpeg(FAKE_FFMPEG_PROGRESS))
+
+    def test_transcoder_makeFfmpegProgress(self):
+        progress = makeFfmpegProgress({'time': 'N/A', 'fps': '0.0', 'speed': 'N/A'})
+        self.assertEqual((None, 0.0, None), (progress.seconds, progress.fps, progress.speed))
+        self.assertEqual(5025.5, makeFfmpegProgress({'out_time': '01:23:45.500000'}).seconds)
+
+    def test_transcoder_transcodeProgress(self):
+        fakeFfmpeg = os.path.join(self.tempDir.name, 'ffmpeg.py')
+        with open(fakeFfmpeg, 'w') as scriptFile:
+            scriptFile.write(FAKE_FFMPEG)
+        command = '{} {}'.format(sys.executable, fakeFfmpeg)
+        statusCallback = Mock()
+        transcoder = Transcoder(Mock(), command, command, command, '/video/{recordingID}.mp4', '/log/{recordingID}.log', statusCallback=statusCallback,
+                                progressInterval=0)
+        transcoder.dbStartTranscodeJob = Mock()
+        transcoder.dbUpdateTranscodeJob = Mock()
+        transcoder.dbFinishTranscodeJob = Mock()
+        self.assertTrue(transcoder.transcode(5, '/raw/5.ts', '/video/5.mp4', self.logFile, datetime.timedelta(hours=2)))
+        # the source file doesn't exist, so its bitrate is unknown, and the medium profile is used
+        transcoder.dbStartTranscodeJob.assert_called_once_with(5, 'medium', datetime.timedelta(hours=2))
+        self.assertEqual([call(5, 'medium', percent, 30.0, 2.5) for percent in (12, 25, 37, 50)], transcoder.dbUpdateTranscodeJob.call_args_list)
+        transcoder.dbFinishTranscodeJob.assert_called_once_with(5, 'medium', 0, 100, 30.0, 2.5)
+        percents = [kwargs['percent'] for args, kwargs in statusCallback.call_args_list]
+        self.assertEqual([0, 12, 25, 37, 50], percents)
+        statusCallback.assert_called_with('transcodeProgress', recordingID=5, stage='mp4', percent=50, fps=30.0, speed=2.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
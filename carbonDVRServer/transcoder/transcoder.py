@@ -7,6 +7,13 @@ import subprocess
 import io
 import psycopg2
 import datetime
+import re
+import shlex
+import shutil
+import string
+
+import metrics
+from fileLocations import HLS_MASTER_PLAYLIST
 
 
 
@@ -20,47 +27,291 @@ def getMegabitsPerSecond(filename, duration):
     return int((filesize/duration.total_seconds())/125000)
 
 
+class Bunch:
+    def __init__(self, **kwds):
+        self.__dict__.update(kwds)
+
+
+class TranscoderCommandError(Exception):
+    pass
+
+
+# The file_transcoded_video row records the location and filename that the transcoder chose, so if it can choose a
+# location other than its fallback (location 1, at TRANSCODER_VIDEO_FILESPEC), a command that doesn't write to
+# {destFile} would leave the row pointing at the wrong file; such a command is refused at startup.  Otherwise, commands
+# that only use {recordingID} (as they all did before file locations) still work.  'requiredFields' are the fields
+# that the command must contain; returns those of 'recommendedFields' that it doesn't.
+def checkCommand(command, requiredFields=('sourceFile', 'destFile'), recommendedFields=()):
+    try:
+        fieldNames = set(fieldName for literalText, fieldName, formatSpec, conversion in string.Formatter().parse(command) if fieldName is not None)
+    except ValueError as e:
+        raise TranscoderCommandError('"{}" is not a valid command template: {}'.format(command, e))
+    missingFields = [fieldName for fieldName in requiredFields if fieldName not in fieldNames]
+    if missingFields:
+        raise TranscoderCommandError('"{}" does not contain {}'.format(command, ', '.join('{{{}}}'.format(fieldName) for fieldName in missingFields)))
+    return [fieldName for fieldName in recommendedFields if fieldName not in fieldNames]
+
+
+# returns True if chooseDestination() can choose anything other than its fallback
+def hasOtherDestinations(fileLocations, outputFilespec):
+    if fileLocations is None:
+        return False
+    for locationID in fileLocations.getLocationIDs('transcodedVideo'):
+        if locationID != 1 or fileLocations.getLocation('transcodedVideo', locationID).filespec.template != outputFilespec:
+            return True
+    return False
+
+
+#
+# Notes on transcode progress
+#
+# ffmpeg reports its progress as it goes, either on its status line (written to stderr, and rewritten with carriage
+# returns: "frame= 2400 fps= 95 q=28.0 size= 4096kB time=00:01:20.00 bitrate= 419.4kbits/s speed=3.17x"), or, if the
+# command includes "-progress pipe:1", as blocks of key=value lines, each ending with "progress=continue" (or
+# "progress=end").  runCommand() reads the command's output as it's written (still copying it to the log file), and
+# understands both; "-progress pipe:1 -nostats" gives the same information in a form that's meant to be parsed.
+#
+# Each run of ffmpeg is a job, in transcode_job: which recording, which profile (low, medium, high or hls), how much
+# video, when it started and finished, and, as it goes, the percentage of the video that's been encoded, the frames
+# per second and the speed (seconds of video encoded per second).  Progress is written every 'progressInterval'
+# seconds, and published (see webServer/statusFeed.py) each time it passes another whole percent.
+#
+# The transcode_speed view averages the speed of each profile over the last 30 days' successful jobs, from which the
+# pending transcoding jobs page estimates how long the backlog will take to clear.
+#
+# A transcoder that crashes, or is killed, leaves its job unfinished, which would show as running forever.  So when
+# the worker starts, abandonUnfinishedJobs() marks any unfinished jobs as abandoned (state 2).  An interrupted MP4
+# transcode is started again, since its recording still has no file_transcoded_video row.
+#
+
+TRANSCODE_SECONDS = metrics.Histogram('carbondvr_transcode_seconds', 'Time taken by transcodes, by profile and result', ['profile', 'result'],
+                                      buckets=metrics.LONG_BUCKETS)
+TRANSCODE_SPEED = metrics.Gauge('carbondvr_transcode_speed', 'Speed of the latest transcode (seconds of video per second), by profile', ['profile'])
+TRANSCODE_QUEUE = metrics.Gauge('carbondvr_transcode_queue', 'Recordings waiting to be transcoded')
+
+FFMPEG_PROGRESS_PATTERN = re.compile(rb'(\w+)=\s*(\S+)')
+FFMPEG_TIME_PATTERN = re.compile(r'(\d+):(\d+):(\d+(?:\.\d+)?)$')
+
+
+def parseFfmpegTime(value):
+    match = FFMPEG_TIME_PATTERN.match(value)
+    if not match:
+        return None         # e.g. N/A
+    return int(match.group(1)) * 3600 + int(match.group(2)) * 60 + float(match.group(3))
+
+
+def parseFfmpegNumber(value):
+    try:
+        return float(value.rstrip('x'))
+    except ValueError:
+        return None         # e.g. N/A
+
+
+# returns a Bunch(seconds, fps, speed) (any of which may be None) from the values in a status line or progress block
+def makeFfmpegProgress(values):
+    seconds = parseFfmpegTime(values.get('out_time', values.get('time', '')))
+    return Bunch(seconds=seconds, fps=parseFfmpegNumber(values.get('fps', '')), speed=parseFfmpegNumber(values.get('speed', '')))
+
+
+# runs 'args', writing its output to 'logFileHandle' (a binary file), and returns the exit code; while it runs,
+# 'progressCallback' (if any) is called with ffmpeg's progress (see makeFfmpegProgress)
+def runCommand(args, logFileHandle, progressCallback=None):
+    if progressCallback is None:
+        return subprocess.call(args, stdout=logFileHandle, stderr=subprocess.STDOUT)
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    pending = b''
+    values = {}
+    while True:
+        output = os.read(process.stdout.fileno(), 65536)
+        if not output:
+            break
+        logFileHandle.write(output)
+        lines = re.split(b'[\r\n]', pending + output)
+        pending = lines.pop()[-1024:]
+        for line in lines:
+            for key, value in FFMPEG_PROGRESS_PATTERN.findall(line):
+                values[key.decode('ascii')] = value.decode('ascii', 'replace')
+            if 'time' in values or 'progress' in values:
+                progress = makeFfmpegProgress(values)
+                values = {}
+                if progress.seconds is not None:
+                    progressCallback(progress)
+            elif len(values) > 100:
+                values = {}         # not ffmpeg
+    process.stdout.close()
+    return process.wait()
+
+
+# one run of ffmpeg, for a recording
+class TranscodeJob:
+    def __init__(self, transcoder, recordingID, profile, duration):
+        self.logger = logging.getLogger(__name__)
+        self.transcoder = transcoder
+        self.recordingID = recordingID
+        self.profile = profile
+        self.stage = 'hls' if profile == 'hls' else 'mp4'
+        self.duration = duration
+        self.percent = 0
+        self.fps = None
+        self.speed = None
+        self.lastWriteTime = None
+        self.startTime = None
+
+    def start(self):
+        self.startTime = time.monotonic()
+        self.lastWriteTime = time.monotonic()
+        self.writeJob(self.transcoder.dbStartTranscodeJob, self.recordingID, self.profile, self.duration)
+        self.transcoder.publishStatus('transcodeStarted', recordingID=self.recordingID, stage=self.stage, percent=0)
+
+    def progress(self, progress):
+        percent = self.percent
+        if self.duration.total_seconds() > 0:
+            percent = min(100, int(100 * progress.seconds / self.duration.total_seconds()))
+        self.fps = progress.fps if progress.fps is not None else self.fps
+        self.speed = progress.speed if progress.speed is not None else self.speed
+        if percent > self.percent:
+            self.percent = percent
+            self.transcoder.publishStatus('transcodeProgress', recordingID=self.recordingID, stage=self.stage, percent=percent,
+                                          fps=self.fps, speed=self.speed)
+        if time.monotonic() - self.lastWriteTime >= self.transcoder.progressInterval:
+            self.lastWriteTime = time.monotonic()
+            self.writeJob(self.transcoder.dbUpdateTranscodeJob, self.recordingID, self.profile, self.percent, self.fps, self.speed)
+
+    def finish(self, success):
+        state = 0 if success else 1
+        percent = 100 if success else self.percent
+        TRANSCODE_SECONDS.labels(profile=self.profile, result='succeeded' if success else 'failed').observe(time.monotonic() - self.startTime)
+        if self.speed is not None:
+            TRANSCODE_SPEED.labels(profile=self.profile).set(self.speed)
+        self.writeJob(self.transcoder.dbFinishTranscodeJob, self.recordingID, self.profile, state, percent, self.fps, self.speed)
+
+    # the job's record is informational, so failing to write it doesn't fail the transcode
+    def writeJob(self, dbMethod, *args):
+        try:
+            dbMethod(*args)
+        except psycopg2.Error as e:
+            self.logger.error('Unable to record transcode job for recording {}: {}'.format(self.recordingID, e))
+
+
+#
+# Notes on HLS
+#
+# The MP4 is a single rendition, at one bitrate, so a Roku on a poor connection stalls rather than stepping down.  If
+# TRANSCODER_COMMAND_HLS is set (and there's an hls file location), each recording is also transcoded to an HLS
+# ladder, after its MP4: several renditions, each cut into short segments, listed in a master playlist, which the
+# springboard advertises in preference to the MP4.  The Roku picks a rendition to suit its connection, and can start
+# playing as soon as the first segment arrives.
+#
+# The command is given {recordingID}, {sourceFile} and {destDir}, and must write {destDir}/master.m3u8 (the
+# directory is created beforehand).  Unlike the other commands, it's split like a shell command line, so arguments
+# can be quoted; it's split before the values are filled in, so they needn't be.  A command which decodes the source once, and encodes three renditions from it:
+#
+#   ffmpeg -i {sourceFile} -filter_complex "[0:v]split=3[a][b][c];[a]scale=-2:720[v0];[b]scale=-2:480[v1];[c]scale=-2:360[v2]"
+#     -map [v0] -map 0:a -map [v1] -map 0:a -map [v2] -map 0:a
+#     -c:v libx264 -b:v:0 3000k -b:v:1 1500k -b:v:2 800k -c:a aac -b:a 128k
+#     -f hls -hls_time 6 -hls_playlist_type vod -master_pl_name master.m3u8
+#     -var_stream_map "v:0,a:0 v:1,a:1 v:2,a:2" -hls_segment_filename {destDir}/stream_%v_%05d.ts {destDir}/stream_%v.m3u8
+#
+# The MP4 is still made, since the BIF generator and the migrator work from it, and older clients play it.  The HLS
+# directory is recorded in file_hls (state 0 on success, 1 on failure), and is deleted, along with the recording's
+# other files, by the cleanup.  It isn't migrated between tiers, reconciled, or counted by the retention policy.
+#
+# The HLS transcode starts only once the MP4 has been published (transcodeFinished, and recordingsChangedCallback),
+# so the recording is playable while the second transcode runs.  It has its own transcodeFinished (with stage 'hls'),
+# and, if it succeeds, another recordingsChangedCallback, so the springboard picks up the master playlist.
+#
 
 class Transcoder:
 
-    def __init__(self, dbConnection, transcoderLow, transcoderMedium, transcoderHigh, outputFilespec, logFilespec):
+    def __init__(self, dbPool, transcoderLow, transcoderMedium, transcoderHigh, outputFilespec, logFilespec, fileLocations=None, recordingsChangedCallback=None,
+                 hlsCommand=None, statusCallback=None, progressInterval=10):
         self.logger = logging.getLogger(__name__)
-        self.dbConnection = dbConnection
+        self.dbPool = dbPool
         self.ffmpegCommand_low = transcoderLow
         self.ffmpegCommand_medium = transcoderMedium
         self.ffmpegCommand_high = transcoderHigh
         self.transcodedVideoFilespec = outputFilespec
         self.logFilespec = logFilespec
+        self.fileLocations = fileLocations
+        self.recordingsChangedCallback = recordingsChangedCallback
+        self.ffmpegCommand_hls = hlsCommand
+        self.statusCallback = statusCallback
+        self.progressInterval = progressInterval
         self.isTranscoding = False
         self.logger.debug("Template ffmpeg command (low): {}".format(self.ffmpegCommand_low))
         self.logger.debug("Template ffmpeg command (medium): {}".format(self.ffmpegCommand_medium))
         self.logger.debug("Template ffmpeg command (high): {}".format(self.ffmpegCommand_high))
+        self.logger.debug("Template ffmpeg command (HLS): {}".format(self.ffmpegCommand_hls))
         self.logger.debug("Transcoded video filespec: {}".format(self.transcodedVideoFilespec))
         self.logger.debug("Log filespec: {}".format(self.logFilespec))
 
     def dbSelectRecordingsToTranscode(self):
         recordings = []
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute("SELECT recording_id, filename FROM file_raw_video WHERE recording_id NOT IN (SELECT recording_id FROM file_transcoded_video);")
-            for row in cursor:
-                recordings.append({'recordingID':row[0], 'filename':row[1]})
-        self.dbConnection.commit()
+        with self.dbPool.connection('recordings_to_transcode') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute("SELECT recording_id, filename FROM file_raw_video WHERE recording_id NOT IN (SELECT recording_id FROM file_transcoded_video);")
+                for row in cursor:
+                    recordings.append({'recordingID':row[0], 'filename':row[1]})
         return recordings
 
     def dbGetDuration(self, recordingID):
         duration = datetime.timedelta(seconds=0)
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute("SELECT duration FROM recording WHERE recording_id = %s;", (recordingID,))
-            row = cursor.fetchone()
-            if row :
-                duration = row[0]
-        self.dbConnection.commit()
+        with self.dbPool.connection('recording_duration') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute("SELECT duration FROM recording WHERE recording_id = %s;", (recordingID,))
+                row = cursor.fetchone()
+                if row :
+                    duration = row[0]
         return duration
 
     def dbInsertTranscodedFileLocation(self, recordingID, locationID, filename, state):
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute("INSERT INTO file_transcoded_video(recording_id, location_id, filename, state) VALUES (%s, %s, %s, %s)", (recordingID, locationID, filename, state))
-        self.dbConnection.commit()
+        with self.dbPool.connection('insert_transcoded_file_location') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute("INSERT INTO file_transcoded_video(recording_id, location_id, filename, state) VALUES (%s, %s, %s, %s)", (recordingID, locationID, filename, state))
+
+    def dbInsertHlsFileLocation(self, recordingID, locationID, directory, state):
+        with self.dbPool.connection('insert_hls_file_location') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                query = str("INSERT INTO file_hls(recording_id, location_id, filename, state) VALUES (%s, %s, %s, %s) "
+                            "ON CONFLICT (recording_id) DO UPDATE SET location_id = EXCLUDED.location_id, filename = EXCLUDED.filename, state = EXCLUDED.state;")
+                cursor.execute(query, (recordingID, locationID, directory, state))      # a retried transcode replaces a failed one
+
+    def publishStatus(self, eventType, **fields):
+        if self.statusCallback is not None:
+            self.statusCallback(eventType, **fields)
+
+    def dbStartTranscodeJob(self, recordingID, profile, duration):
+        with self.dbPool.connection('start_transcode_job') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                query = str("INSERT INTO transcode_job(recording_id, profile, video_duration, start_time) VALUES (%s, %s, %s, now()) "
+                            "ON CONFLICT (recording_id, profile) DO UPDATE SET video_duration = EXCLUDED.video_duration, start_time = EXCLUDED.start_time, "
+                            "finish_time = NULL, percent = 0, fps = NULL, speed = NULL, state = NULL;")
+                cursor.execute(query, (recordingID, profile, duration))      # a retried transcode replaces a failed one
+
+    def dbUpdateTranscodeJob(self, recordingID, profile, percent, fps, speed):
+        with self.dbPool.connection('update_transcode_job') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                query = str("UPDATE transcode_job SET percent = %s, fps = %s, speed = %s WHERE recording_id = %s AND profile = %s;")
+                cursor.execute(query, (percent, fps, speed, recordingID, profile))
+
+    def dbFinishTranscodeJob(self, recordingID, profile, state, percent, fps, speed):
+        with self.dbPool.connection('finish_transcode_job') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                query = str("UPDATE transcode_job SET finish_time = now(), state = %s, percent = %s, fps = %s, speed = %s "
+                            "WHERE recording_id = %s AND profile = %s;")
+                cursor.execute(query, (state, percent, fps, speed, recordingID, profile))
+
+    def dbAbandonUnfinishedTranscodeJobs(self):
+        with self.dbPool.connection('abandon_transcode_jobs') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute("UPDATE transcode_job SET finish_time = now(), state = 2 WHERE finish_time IS NULL;")
+                return cursor.rowcount
+
+    # called once, at startup, before any transcodes are started
+    def abandonUnfinishedJobs(self):
+        count = self.dbAbandonUnfinishedTranscodeJobs()
+        if count:
+            self.logger.warning('Marked {} unfinished transcode jobs as abandoned'.format(count))
 
     def transcode(self, recordingID, sourceFile, destFile, logFile, duration):
         self.logger.info("Transcoding {} to {}".format(sourceFile, destFile))
@@ -68,37 +319,101 @@ class Transcoder:
         self.logger.info('Source file bitrate is {}Mb/s (avg)'.format(sourceBitrate))
         if sourceBitrate == 0:
              # error reading source rate, default to medium quality
-            cmd = self.ffmpegCommand_medium.format(recordingID=recordingID)
+            profile, command = 'medium', self.ffmpegCommand_medium
         elif sourceBitrate < 3:
-            cmd = self.ffmpegCommand_low.format(recordingID=recordingID)
+            profile, command = 'low', self.ffmpegCommand_low
         elif sourceBitrate < 8:
-            cmd = self.ffmpegCommand_medium.format(recordingID=recordingID)
+            profile, command = 'medium', self.ffmpegCommand_medium
         else:
-            cmd = self.ffmpegCommand_high.format(recordingID=recordingID)
+            profile, command = 'high', self.ffmpegCommand_high
+        cmd = command.format(recordingID=recordingID, sourceFile=sourceFile, destFile=destFile)
         self.logger.info("ffmpeg command: {}".format(cmd))
-        logFileHandle = io.open(logFile, "w+")
-        result = subprocess.call(cmd.split(), stdout=logFileHandle, stderr=subprocess.STDOUT)
-        logFileHandle.close()
+        job = TranscodeJob(self, recordingID, profile, duration)
+        job.start()
+        with io.open(logFile, "wb") as logFileHandle:
+            result = runCommand(cmd.split(), logFileHandle, job.progress)
         self.logger.info("Exit code: {}".format(result))
+        job.finish(result == 0)
         return result == 0
 
+    def transcodeHls(self, recordingID, sourceFile, destDir, logFile, duration=datetime.timedelta(seconds=0)):
+        self.logger.info("Transcoding {} to HLS in {}".format(sourceFile, destDir))
+        # split first, so that paths with spaces or quotes in them stay single arguments
+        args = [arg.format(recordingID=recordingID, sourceFile=sourceFile, destDir=destDir) for arg in shlex.split(self.ffmpegCommand_hls)]
+        self.logger.info("ffmpeg command: {}".format(args))
+        shutil.rmtree(destDir, ignore_errors=True)      # left over from an interrupted transcode
+        os.makedirs(destDir)
+        job = TranscodeJob(self, recordingID, 'hls', duration)
+        job.start()
+        with io.open(logFile, "ab") as logFileHandle:
+            result = runCommand(args, logFileHandle, job.progress)
+        self.logger.info("Exit code: {}".format(result))
+        success = result == 0 and os.path.isfile(os.path.join(destDir, HLS_MASTER_PLAYLIST))
+        job.finish(success)
+        return success
+
+    # the HLS ladder is made only if there's a command for it, and somewhere to put it; returns None if it wasn't
+    # attempted, otherwise whether it succeeded
+    def makeHls(self, recordingID, sourceFile, logFile, duration=datetime.timedelta(seconds=0)):
+        if self.ffmpegCommand_hls is None or self.fileLocations is None:
+            return None
+        locationID = self.fileLocations.chooseLocation('hls')
+        if locationID is None:
+            return None
+        destDir = self.fileLocations.getHlsDirectory(locationID, recordingID)
+        if self.transcodeHls(recordingID, sourceFile, destDir, logFile, duration):
+            self.logger.info("HLS transcode successful")
+            self.dbInsertHlsFileLocation(recordingID, locationID, destDir, 0)
+            return True
+        else:
+            self.logger.info("HLS transcode failed")
+            shutil.rmtree(destDir, ignore_errors=True)
+            self.dbInsertHlsFileLocation(recordingID, locationID, destDir, 1)
+            return False
+
+    # placement: use the location chosen by fileLocations, if any transcoded video locations are configured
+    def chooseDestination(self, recordingID):
+        if self.fileLocations is not None:
+            locationID = self.fileLocations.chooseLocation('transcodedVideo')
+            if locationID is not None:
+                return locationID, self.fileLocations.getTranscodedVideoFilespec(locationID, recordingID)
+        return 1, self.transcodedVideoFilespec.format(recordingID=recordingID)
+
+    def recordingsChanged(self):
+        if self.recordingsChangedCallback is not None:
+            self.recordingsChangedCallback()
+
     def transcodeRecordings(self):
         if self.isTranscoding:
             return
         self.isTranscoding = True
+        try:
+            self.transcodeNextRecording()
+        finally:
+            self.isTranscoding = False
+
+    def transcodeNextRecording(self):
         recordings = self.dbSelectRecordingsToTranscode()
+        TRANSCODE_QUEUE.set(len(recordings))
         for recording in recordings[:1]:
             recordingID = recording['recordingID']
-            locationID = 1
             srcFile = recording['filename']
-            destFile = self.transcodedVideoFilespec.format(recordingID=recordingID)
+            locationID, destFile = self.chooseDestination(recordingID)
             logFile = self.logFilespec.format(recordingID=recordingID)
             duration = self.dbGetDuration(recordingID)
             if self.transcode(recordingID, srcFile, destFile, logFile, duration):
                 self.logger.info("Transcode successful")
                 self.dbInsertTranscodedFileLocation(recordingID, locationID, destFile, 0)
+                # the MP4 is playable now; don't hold it back for the (second, full length) HLS transcode
+                self.publishStatus('transcodeFinished', recordingID=recordingID, success=True)
+                self.recordingsChanged()
+                hlsSuccess = self.makeHls(recordingID, srcFile, logFile, duration)
+                if hlsSuccess is not None:
+                    self.publishStatus('transcodeFinished', recordingID=recordingID, stage='hls', success=hlsSuccess)
+                    if hlsSuccess:
+                        self.recordingsChanged()
             else:
                 self.logger.info("Transcode failed")
                 self.dbInsertTranscodedFileLocation(recordingID, locationID, destFile, 1)
-        self.isTranscoding = False
+                self.publishStatus('transcodeFinished', recordingID=recordingID, success=False)
 
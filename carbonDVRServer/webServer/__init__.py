@@ -1,3 +1,7 @@
 from webServer.webServer import webServerApp
+from webServer.feedCache import FeedCache
+from webServer.lruCache import LRUCache
+from webServer.playbackPositions import PlaybackPositions
 from webServer.restServer import RestServer
+from webServer.statusFeed import StatusFeed
 from webServer.uiServer import UIServer
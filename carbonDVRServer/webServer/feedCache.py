@@ -0,0 +1,67 @@
+#!/usr/bin/env python3.4
+
+import hashlib
+
+from webServer.lruCache import LRUCache
+
+
+class Bunch():
+    def __init__(self, **kwds):
+        self.__dict__.update(kwds)
+
+
+#
+# Notes on the feed cache
+#
+# The Roku show and episode lists only change when a recording becomes playable (its transcode and BIF are done), a
+# recording is deleted or archived, or the listings (show names, episode descriptions) are reloaded.  So, each feed's
+# XML is built once and kept, keyed by endpoint and category (and show, for episode lists), until one of those things
+# happens and invalidate() is called.  Writes are rare, so invalidate() simply drops everything.
+#
+# Each entry carries an ETag, which is a hash of the XML.  The Roku client sends it back in If-None-Match, and gets a
+# 304 (no body) if the feed hasn't changed; since the ETag depends only on the content, an invalidation that didn't
+# actually change a feed doesn't force the client to re-download it.
+#
+# A feed that's being built when invalidate() is called is returned to its caller, but not cached, since it may
+# have been read from the database before the change.
+#
+# Episode lists are keyed by show and page (offset and limit), which come from the client, so the feeds are kept in an
+# LRUCache of 'maxSize' entries; a client that walks through shows or pages pushes out the least recently used feeds,
+# rather than growing the cache without limit.
+#
+# Other caches that hold data from the same tables (e.g. RestServer's recording and show caches) register with
+# addInvalidateHandler(), and are cleared along with the feeds.
+#
+
+def makeEntry(xml):
+    return Bunch(xml=xml, etag=hashlib.sha1(xml.encode('utf-8')).hexdigest())
+
+
+class FeedCache:
+    def __init__(self, maxSize=1024):
+        self.entries = LRUCache(maxSize)
+        self.invalidateHandlers = []
+
+    @property
+    def hits(self):
+        return self.entries.hits
+
+    @property
+    def misses(self):
+        return self.entries.misses
+
+    # 'handler' is called (with no arguments) each time the cache is invalidated
+    def addInvalidateHandler(self, handler):
+        self.invalidateHandlers.append(handler)
+
+    # returns the cached feed for 'key', calling 'buildXml' to (re)build it if necessary
+    def get(self, key, buildXml):
+        return self.entries.get(key, lambda key: makeEntry(buildXml()))
+
+    def invalidate(self):
+        self.entries.clear()
+        for handler in self.invalidateHandlers:
+            handler()
+
+    def getStats(self):
+        return self.entries.getStats()
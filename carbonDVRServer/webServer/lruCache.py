@@ -0,0 +1,95 @@
+#!/usr/bin/env python3.4
+
+import collections
+import threading
+
+
+class Bunch():
+    def __init__(self, **kwds):
+        self.__dict__.update(kwds)
+
+
+#
+# Notes on the LRU cache
+#
+# A size-bounded, thread-safe, read-through cache: get() returns the cached value for a key, or calls 'load' to fetch
+# it (outside the lock, so a slow load doesn't hold up other threads) and caches the result.  When the cache is full,
+# the least recently used entry is dropped.  getMany() does the same for a list of keys, loading all of the missing
+# ones with a single call, so that e.g. a page of episodes costs one query rather than one per episode.
+#
+# Loaders return None for keys that don't exist; None is not cached.
+#
+# As with the feed cache, a value that's being loaded when clear() is called is returned to its caller, but not cached.
+#
+
+class LRUCache:
+    def __init__(self, maxSize):
+        self.lock = threading.Lock()
+        self.maxSize = maxSize
+        self.generation = 0
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, generation=None):
+        if value is None:
+            return
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+    # 'load' is called with the key
+    def get(self, key, load):
+        generation = self.generation
+        value = self.lookup(key)
+        if value is None:
+            value = load(key)
+            self.put(key, value, generation)
+        return value
+
+    # returns a dictionary (key -> value) of the keys that exist; 'loadMany' is called with a list of the keys that
+    # aren't cached, and returns a dictionary of their values
+    def getMany(self, keys, loadMany):
+        generation = self.generation
+        values = {}
+        missingKeys = []
+        for key in keys:
+            value = self.lookup(key)
+            if value is None:
+                missingKeys.append(key)
+            else:
+                values[key] = value
+        if missingKeys:
+            for key, value in loadMany(missingKeys).items():
+                self.put(key, value, generation)
+                values[key] = value
+        return values
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def getStats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return Bunch(size=len(self.entries), maxSize=self.maxSize, hits=self.hits, misses=self.misses,
+                         hitRate=self.hits / lookups if lookups else 0.0)
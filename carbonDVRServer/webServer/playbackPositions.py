@@ -0,0 +1,120 @@
+#!/usr/bin/env python3.4
+
+import atexit
+import logging
+import psycopg2
+import psycopg2.extras
+import threading
+
+
+#
+# Notes on playback positions
+#
+# While a recording is playing, the Roku client sends its position every few seconds.  Rather than writing each one
+# to the database, positions are kept in memory, and the ones that have changed are written every 'flushInterval'
+# seconds, in a single INSERT ... ON CONFLICT; only the latest position for each recording is written.  Whatever
+# hasn't been written is flushed at shutdown.
+#
+# Positions that have been read from (or written to) the database are kept, so that the client's GETs are answered
+# from memory.  There's one entry per recording that's been played, so this doesn't grow large.
+#
+# If the server dies without flushing, up to 'flushInterval' seconds of position updates are lost; the client just
+# resumes a few seconds earlier.  If the database can't be reached, the positions are written at the next flush.  But
+# if it rejects the batch (e.g. for a recording ID from the URL that's too big for an int4), the positions are written
+# one at a time, and any that are rejected are dropped, so that one bad row doesn't stop all the others from ever being saved.
+# Positions are clamped to the range of the position column (an int4).
+#
+
+MAX_POSITION = 2 ** 31 - 1
+
+class PlaybackPositions:
+    def __init__(self, dbPool, flushInterval=5):
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.flushLock = threading.Lock()
+        self.dbPool = dbPool
+        self.flushInterval = flushInterval
+        self.positions = {}     # recordingID -> position
+        self.dirty = set()      # recordingIDs whose positions haven't been written yet
+        self.stopping = threading.Event()
+        self.flushThread = None
+
+    def dbGetPlaybackPosition(self, recordingID):
+        playbackPosition = 0
+        with self.dbPool.connection('get_playback_position') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute('SELECT position FROM playback_position WHERE recording_id = %s;', (recordingID, ))
+                row = cursor.fetchone()
+                if row:
+                    playbackPosition = row[0]
+        return playbackPosition
+
+    def dbSetPlaybackPositions(self, positions):
+        query = str('INSERT INTO playback_position (recording_id, position) VALUES %s '
+                    'ON CONFLICT (recording_id) DO UPDATE SET position = EXCLUDED.position;')
+        with self.dbPool.connection('set_playback_positions') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                psycopg2.extras.execute_values(cursor, query, positions)
+
+    def get(self, recordingID):
+        recordingID = int(recordingID)
+        with self.lock:
+            playbackPosition = self.positions.get(recordingID)
+        if playbackPosition is None:
+            playbackPosition = self.dbGetPlaybackPosition(recordingID)
+            with self.lock:
+                playbackPosition = self.positions.setdefault(recordingID, playbackPosition)
+        return playbackPosition
+
+    def set(self, recordingID, playbackPosition):
+        recordingID = int(recordingID)
+        with self.lock:
+            self.positions[recordingID] = min(max(0, int(playbackPosition)), MAX_POSITION)
+            self.dirty.add(recordingID)
+
+    def flush(self):
+        with self.flushLock:
+            with self.lock:
+                positions = [(recordingID, self.positions[recordingID]) for recordingID in self.dirty]
+                self.dirty.clear()
+            if not positions:
+                return
+            try:
+                self.dbSetPlaybackPositions(positions)
+            except psycopg2.DataError as e:
+                self.logger.warning('Playback positions rejected, saving them one at a time: {}'.format(e))
+                self.flushEach(positions)
+            except psycopg2.Error as e:
+                self.logger.error('Unable to save {} playback positions: {}'.format(len(positions), e))
+                self.retry(positions)
+
+    def flushEach(self, positions):
+        for index, (recordingID, playbackPosition) in enumerate(positions):
+            try:
+                self.dbSetPlaybackPositions([(recordingID, playbackPosition)])
+            except psycopg2.DataError as e:
+                self.logger.error('Dropping playback position {} for recording {}: {}'.format(playbackPosition, recordingID, e))
+            except psycopg2.Error as e:
+                self.logger.error('Unable to save {} playback positions: {}'.format(len(positions) - index, e))
+                self.retry(positions[index:])
+                return
+
+    # marks 'positions' to be written at the next flush, unless they've been set again since
+    def retry(self, positions):
+        with self.lock:
+            self.dirty.update([recordingID for recordingID, playbackPosition in positions])
+
+    def run(self):
+        while not self.stopping.wait(self.flushInterval):
+            self.flush()
+
+    def start(self):
+        self.flushThread = threading.Thread(target=self.run, name='playbackPositions', daemon=True)
+        self.flushThread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self.stopping.set()
+        if self.flushThread is not None:
+            self.flushThread.join()
+        self.flush()
@@ -1,11 +1,14 @@
 #!/usr/bin/env python3.4
 
 import datetime
+import functools
 import json
 import os
 import psycopg2
+import time
 import tzlocal
 from xml.sax import saxutils
+from webServer.lruCache import LRUCache
 
 from psycopg2.extensions import register_type, UNICODE
 register_type(UNICODE)
@@ -21,33 +24,59 @@ class Bunch():
 # So, we're stuck with XML
 
 # To reduce transmission size, the TrinTV Roku app uses XML attributes, rather than child nodes, to hold values
-def dictionaryToRokuXml(tag, d):
+#
+# The XML is built as a list of fragments, which are joined once at the end.  (CPython extends a string in place when
+# it can, so repeated "xml += ..." wasn't quadratic; the list was measured at about 5% faster with 'python -m benchmark
+# rokuXml', and it lets the same code yield the document an item at a time.)  Tag and attribute names come from a
+# small, fixed set, so their escaped forms are cached.
+
+@functools.lru_cache(maxsize=256)
+def escapeName(name):
+    return saxutils.escape(name)
+
+
+def appendRokuXml(fragments, tag, d):
+    escapedTag = escapeName(tag)
 
     # tag + attributes
-    xml = '<' + saxutils.escape(tag) + ' '
+    fragments.append('<' + escapedTag + ' ')
     for key, value in d.items():
         if type(value) is not list and type(value) is not dict:
-            xml += saxutils.escape(key) + '=' + saxutils.quoteattr(str(value)) + ' '
-    xml += '>'
+            fragments.append(escapeName(key) + '=' + saxutils.quoteattr(str(value)) + ' ')
+    fragments.append('>')
 
     # contents
     for key, value in d.items():
         if type(value) is dict:
-            xml += dictionaryToRokuXml(key, value)
+            appendRokuXml(fragments, key, value)
 
     # closing tag
-    xml += '</' + saxutils.escape(tag) + '>'
-
-    return xml
+    fragments.append('</' + escapedTag + '>')
 
 
-def listToRokuXml(listTag, itemTag, l):
-    xml = '<' + saxutils.escape(listTag) + '>\n'
+def dictionaryToRokuXml(tag, d):
+    fragments = []
+    appendRokuXml(fragments, tag, d)
+    return ''.join(fragments)
+
+
+# yields the XML in chunks (one per item), e.g. for a streamed response; 'attributes' (optional) go on the list tag
+def iterListToRokuXml(listTag, itemTag, l, attributes=None):
+    escapedListTag = escapeName(listTag)
+    if attributes:
+        yield '<' + escapedListTag + ' ' + ''.join([escapeName(key) + '=' + saxutils.quoteattr(str(value)) + ' ' for key, value in attributes.items()]) + '>\n'
+    else:
+        yield '<' + escapedListTag + '>\n'
     for item in l:
         if type(item) is dict:
-            xml += dictionaryToRokuXml(itemTag, item)
-    xml += '</' + saxutils.escape(listTag) + '>\n'
-    return xml
+            fragments = []
+            appendRokuXml(fragments, itemTag, item)
+            yield ''.join(fragments)
+    yield '</' + escapedListTag + '>\n'
+
+
+def listToRokuXml(listTag, itemTag, l, attributes=None):
+    return ''.join(iterListToRokuXml(listTag, itemTag, l, attributes))
 
 
 def formatTime(t):
@@ -69,11 +98,90 @@ def stripLeadingArticles(title):
     return title
 
 
+# the local timezone, for formatting recording dates; looked up once, rather than on every request
+localTimezone = tzlocal.get_localzone()
+
+
+#
+# Notes on the recording and show caches
+#
+# A recording's show, episode title and description, date and duration don't change once it's been recorded (except
+# when the listings are reloaded), but the episode lists and springboard used to fetch them, and encode them for the
+# Roku, on every request.  So, RestServer keeps them in two LRU caches: recording metadata, keyed by recording_id, and
+# show names and images, keyed by show_id.  The strings are stored already encoded (non-ASCII characters replaced by
+# character references), ready for the XML serializer.
+#
+# Both caches are cleared whenever the feed cache is invalidated (recordings changed, or the listings were reloaded),
+# and a recording's entry is dropped explicitly when it's deleted or archived.
+#
+# A page of episodes needs the total number of the show's episodes (for the 'total' attribute).  Counting them in the
+# page query (count(*) OVER ()) would have PostgreSQL find and sort all of them for every page, so they're counted by
+# a query of their own, and kept in a third cache, keyed by show and categories, which is cleared along with the
+# others.  A page that isn't full doesn't need the count: it's the last page.
+#
+# Where a recording's files are (file_transcoded_video, file_bif and file_hls location IDs) is not cached, since the migrator
+# moves files between locations at any time.  When the recording is cached, the springboard only looks up its
+# locations; otherwise, it runs the full query, and caches what it gets back.
+#
+
+RECORDING_COLUMNS = str("recording.recording_id, recording.show_id, substring(recording.episode_id from '[[:digit:]]*'), "
+                        "  episode.title, episode.description, episode.imageurl, recording.date_recorded, recording.duration")
+
+RECORDING_METADATA_QUERY = str("SELECT " + RECORDING_COLUMNS + " "
+                               "FROM recording "
+                               "INNER JOIN episode ON (recording.show_id = episode.show_id AND recording.episode_id = episode.episode_id) "
+                               "WHERE recording.recording_id IN %s;")
+
+# columns 0-7 are the recording's metadata, 8-10 its show's, and 11-13 its locations
+SPRINGBOARD_QUERY = str("SELECT " + RECORDING_COLUMNS + ", show.show_id, show.name, show.imageurl, "
+                        "  file_transcoded_video.location_id, file_bif.location_id, file_hls.location_id "
+                        "FROM recording "
+                        "INNER JOIN show ON (recording.show_id = show.show_id) "
+                        "INNER JOIN episode ON (recording.show_id = episode.show_id AND recording.episode_id = episode.episode_id) "
+                        "LEFT JOIN file_transcoded_video ON (recording.recording_id = file_transcoded_video.recording_id) "
+                        "LEFT JOIN file_bif ON (recording.recording_id = file_bif.recording_id) "
+                        "LEFT JOIN file_hls ON (recording.recording_id = file_hls.recording_id AND file_hls.state = 0) "
+                        "WHERE recording.recording_id = $1")
+
+RECORDING_LOCATIONS_QUERY = str("SELECT recording.recording_id, file_transcoded_video.location_id, file_bif.location_id, file_hls.location_id "
+                                "FROM recording "
+                                "LEFT JOIN file_transcoded_video ON (recording.recording_id = file_transcoded_video.recording_id) "
+                                "LEFT JOIN file_bif ON (recording.recording_id = file_bif.recording_id) "
+                                "LEFT JOIN file_hls ON (recording.recording_id = file_hls.recording_id AND file_hls.state = 0) "
+                                "WHERE recording.recording_id = $1")
+
+
+def encodeForRoku(s):
+    return s.encode('ascii', 'xmlcharrefreplace').decode('ascii')         # compensate for Python's inability to cope with unicode
+
+
+def makeRecordingMetadata(row):
+    return {'recordingID':row[0], 'showID':row[1], 'episodeNumber':row[2], 'episodeTitle':encodeForRoku(row[3]),
+            'episodeDescription':encodeForRoku(row[4]), 'episodeImageURL':row[5], 'dateRecorded':row[6].astimezone(localTimezone),
+            'duration':row[7]}
+
+
+def makeShowMetadata(showID, name, imageURL):
+    return {'showID':showID, 'showName':encodeForRoku(name), 'showImageURL':imageURL}
+
+
 class RestServer:
-    def __init__(self, dbConnection, fileLocations, restServerURL):
-        self.dbConnection = dbConnection
+    def __init__(self, dbPool, fileLocations, restServerURL, recordingDeletedCallback, feedCache, playbackPositions,
+                 recordingCacheSize=4096, showCacheSize=512, episodeCountCacheSize=1024):
+        self.dbPool = dbPool
         self.fileLocations = fileLocations
         self.restServerURL = restServerURL
+        self.recordingDeletedCallback = recordingDeletedCallback
+        self.feedCache = feedCache
+        self.playbackPositions = playbackPositions
+        self.recordingCache = LRUCache(recordingCacheSize)
+        self.showCache = LRUCache(showCacheSize)
+        self.feedCache.addInvalidateHandler(self.recordingCache.clear)
+        self.episodeCountCache = LRUCache(episodeCountCacheSize)
+        self.feedCache.addInvalidateHandler(self.showCache.clear)
+        self.feedCache.addInvalidateHandler(self.episodeCountCache.clear)
+        self.dbPool.prepare('get_springboard', SPRINGBOARD_QUERY, 1)
+        self.dbPool.prepare('get_recording_locations', RECORDING_LOCATIONS_QUERY, 1)
 
     def makeURL(self, endpoint):
         return self.restServerURL + endpoint
@@ -85,123 +193,153 @@ class RestServer:
                     "WHERE recording.show_id = show.show_id "
                     "AND recording.recording_id IN (SELECT recording_id FROM file_bif) "
                     "AND recording.rerun_code IN %s ;")
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute(query, (tuple(categoryCodes), ))
-            for row in cursor:
-                shows.append({'showID':row[0], 'name':row[1], 'imageURL':row[2]})
-        self.dbConnection.commit()
+        with self.dbPool.connection('shows_with_recordings') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query, (tuple(categoryCodes), ))
+                for row in cursor:
+                    shows.append({'showID':row[0], 'name':row[1], 'imageURL':row[2]})
         return shows
 
 
-    def dbGetEpisodeData(self, showID, categoryCodes):
-        recordings = []
-        query = str("SELECT recording.recording_id, recording.show_id, substring(recording.episode_id from '[[:digit:]]*'), "
-                    "  episode.title, episode.description, episode.imageurl, show.imageURL "
+    # returns the recording IDs on one page of a show's episodes; a 'limit' of None means no limit
+    def dbGetEpisodePage(self, showID, categoryCodes, offset=0, limit=None):
+        recordingIDs = []
+        query = str("SELECT recording.recording_id "
                     "FROM recording "
                     "INNER JOIN file_transcoded_video ON (recording.recording_id = file_transcoded_video.recording_id) "
                     "INNER JOIN file_bif ON (recording.recording_id = file_bif.recording_id) "
-                    "INNER JOIN episode ON (recording.show_id = episode.show_id AND recording.episode_id = episode.episode_id) "
-                    "INNER JOIN show ON (recording.show_id = show.show_id) "
                     "WHERE file_transcoded_video.state = 0 "
                     "AND recording.show_id = %s "
                     "AND recording.rerun_code IN %s "
-                    "ORDER BY substring(recording.episode_id from '[[:digit:]]*')::integer;")
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute(query, (showID, tuple(categoryCodes)))
-            for row in cursor:
-                episodeTitle = row[3].encode('ascii', 'xmlcharrefreplace').decode('ascii')           # compensate for Python's inability to cope with unicode
-                episodeDescription = row[4].encode('ascii', 'xmlcharrefreplace').decode('ascii')     # compensate for Python's inability to cope with unicode
-                recordings.append({'recordingID':row[0], 'showID':row[1], 'episodeID':row[2], 'episodeTitle':episodeTitle, 'episodeDescription':episodeDescription, 'imageURL':row[5], 'showImageURL':row[6], 'episodeNumber':row[2]})
-        self.dbConnection.commit()
+                    "ORDER BY recording.episode_number, recording.recording_id "
+                    "LIMIT %s OFFSET %s;")
+        with self.dbPool.connection('episode_page') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query, (showID, tuple(categoryCodes), limit, offset))
+                for row in cursor:
+                    recordingIDs.append(row[0])
+        return recordingIDs
+
+    # 'key' is (showID, categoryCodes)
+    def dbGetEpisodeCount(self, key):
+        showID, categoryCodes = key
+        query = str("SELECT count(*) "
+                    "FROM recording "
+                    "INNER JOIN file_transcoded_video ON (recording.recording_id = file_transcoded_video.recording_id) "
+                    "INNER JOIN file_bif ON (recording.recording_id = file_bif.recording_id) "
+                    "WHERE file_transcoded_video.state = 0 "
+                    "AND recording.show_id = %s "
+                    "AND recording.rerun_code IN %s;")
+        with self.dbPool.connection('episode_count') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query, (showID, categoryCodes))
+                return cursor.fetchone()[0]
+
+    # returns the total number of a show's episodes, given one page of them
+    def getEpisodeCount(self, showID, categoryCodes, offset, limit, recordingIDs):
+        if recordingIDs and (limit is None or len(recordingIDs) < limit):
+            return offset + len(recordingIDs)
+        if not recordingIDs and offset == 0:
+            return 0
+        return self.episodeCountCache.get((showID, tuple(categoryCodes)), self.dbGetEpisodeCount)
+
+    # returns a dictionary (recordingID -> metadata); recordings that don't exist are left out
+    def dbGetRecordingMetadata(self, recordingIDs):
+        recordings = {}
+        with self.dbPool.connection('recording_metadata') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(RECORDING_METADATA_QUERY, (tuple(recordingIDs), ))
+                for row in cursor:
+                    recordings[row[0]] = makeRecordingMetadata(row)
         return recordings
 
-
-    def dbGetRecordingData(self, recordingID):
-        recordingData = None
-        query = str("SELECT recording.recording_id, show.name, show.imageurl, episode.title, episode.description, (recording.date_recorded), "
-                    "  recording.duration, substring(episode.episode_id from '[[:digit:]]*') "
-                    "FROM recording, show, episode "
-                    "WHERE recording.show_id = show.show_id "
-                    "AND recording.show_id = episode.show_id "
-                    "AND recording.episode_id = episode.episode_id "
-                    "AND recording_id = %s;")
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute(query, (recordingID, ))
-            row = cursor.fetchone()
-            if row:
-                recordingData = {}
-                showName = row[1].encode('ascii', 'xmlcharrefreplace').decode('ascii')               # compensate for Python's inability to cope with unicode
-                showName = row[1].encode('ascii', 'xmlcharrefreplace').decode('ascii')               # compensate for Python's inability to cope with unicode
-                episodeTitle = row[3].encode('ascii', 'xmlcharrefreplace').decode('ascii')           # compensate for Python's inability to cope with unicode
-                episodeDescription = row[4].encode('ascii', 'xmlcharrefreplace').decode('ascii')     # compensate for Python's inability to cope with unicode
-                dateRecorded = row[5].astimezone(tzlocal.get_localzone())
-                recordingData = {'recordingID':row[0], 'showName':showName, 'imageURL':row[2], 'episodeTitle':episodeTitle, 'episodeDescription':episodeDescription, 'dateRecorded':dateRecorded, 'duration':row[6], 'episodeNumber':row[7]}
-        self.dbConnection.commit()
-        return recordingData
-
-
-    def dbGetTranscodedVideoLocationID(self, recordingID):
-        locationID = 0
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute('SELECT location_id FROM file_transcoded_video WHERE recording_id = %s;', (recordingID, ))
-            row = cursor.fetchone()
-            if row:
-                locationID = row[0]
-        self.dbConnection.commit()
-        return locationID
-
-
-    def dbGetBifLocationID(self, recordingID):
-        locationID = 0
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute('SELECT location_id FROM file_bif WHERE recording_id = %s;', (recordingID, ))
-            row = cursor.fetchone()
-            if row:
-                locationID = row[0]
-        self.dbConnection.commit()
-        return locationID
+    def dbGetShowMetadata(self, showID):
+        show = None
+        with self.dbPool.connection('show_metadata') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute('SELECT show_id, name, imageurl FROM show WHERE show_id = %s;', (showID, ))
+                row = cursor.fetchone()
+                if row:
+                    show = makeShowMetadata(*row)
+        return show
+
+    # returns one page of a show's episodes, and the total number of episodes
+    def dbGetEpisodeData(self, showID, categoryCodes, offset=0, limit=None):
+        recordingIDs = self.dbGetEpisodePage(showID, categoryCodes, offset, limit)
+        totalCount = self.getEpisodeCount(showID, categoryCodes, offset, limit, recordingIDs)
+        if not recordingIDs:
+            return [], totalCount
+        recordings = self.recordingCache.getMany(recordingIDs, self.dbGetRecordingMetadata)
+        show = self.showCache.get(showID, self.dbGetShowMetadata) or {'showImageURL': None}
+        episodes = []
+        for recordingID in recordingIDs:
+            recording = recordings.get(recordingID)
+            if recording is not None:
+                episodes.append({'recordingID':recordingID, 'episodeNumber':recording['episodeNumber'], 'episodeTitle':recording['episodeTitle'],
+                                 'episodeDescription':recording['episodeDescription'], 'imageURL':recording['episodeImageURL'],
+                                 'showImageURL':show['showImageURL']})
+        return episodes, totalCount
+
+
+    # everything the springboard needs; one round trip, with both statements prepared once per connection, since they
+    # run on every episode selection
+    def dbGetSpringboardData(self, recordingID):
+        recordingID = int(recordingID)
+        recordingGeneration = self.recordingCache.generation
+        showGeneration = self.showCache.generation
+        recording = self.recordingCache.lookup(recordingID)
+        show = None
+        with self.dbPool.connection('springboard_data') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                if recording is None:
+                    self.dbPool.executePrepared(dbConnection, cursor, 'get_springboard', (recordingID, ))
+                    row = cursor.fetchone()
+                    if row is None:
+                        return None
+                    recording = makeRecordingMetadata(row)
+                    show = makeShowMetadata(*row[8:11])
+                    self.recordingCache.put(recordingID, recording, recordingGeneration)
+                    self.showCache.put(show['showID'], show, showGeneration)
+                    locationIDs = row[11:14]
+                else:
+                    self.dbPool.executePrepared(dbConnection, cursor, 'get_recording_locations', (recordingID, ))
+                    row = cursor.fetchone()
+                    if row is None:
+                        return None
+                    locationIDs = row[1:4]
+        if show is None:
+            show = self.showCache.get(recording['showID'], self.dbGetShowMetadata)
+            if show is None:
+                return None
+        return {'recordingID':recordingID, 'showName':show['showName'], 'imageURL':show['showImageURL'], 'episodeTitle':recording['episodeTitle'],
+                'episodeDescription':recording['episodeDescription'], 'dateRecorded':recording['dateRecorded'], 'duration':recording['duration'],
+                'episodeNumber':recording['episodeNumber'], 'transcodedVideoLocationID':locationIDs[0] or 0, 'bifLocationID':locationIDs[1] or 0,
+                'hlsLocationID':locationIDs[2]}
 
 
     def dbDeleteRecording(self, recordingID):
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute('DELETE FROM recording WHERE recording_id = %s;', (recordingID, ))
-        self.dbConnection.commit()
-
-    def dbSetPlaybackPosition(self, recordingID, playbackPosition):
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute('UPDATE playback_position SET position = %s WHERE recording_id = %s;', (playbackPosition, recordingID))
-            if cursor.rowcount == 0:
-                cursor.execute('INSERT INTO playback_position (recording_id, position) VALUES (%s, %s);', (recordingID, playbackPosition))
-        self.dbConnection.commit()
-
-    def dbGetPlaybackPosition(self, recordingID):
-        playbackPosition = 0
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute('SELECT position FROM playback_position WHERE recording_id = %s;', (recordingID, ))
-            row = cursor.fetchone()
-            if row:
-                playbackPosition = row[0]
-        self.dbConnection.commit()
-        return {'playbackPosition': playbackPosition}
+        with self.dbPool.connection('delete_recording') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute('DELETE FROM recording WHERE recording_id = %s;', (recordingID, ))
 
     def dbSetCategoryCode(self, recordingID, categoryCode):
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute('UPDATE recording SET rerun_code = %s WHERE recording_id = %s;', (categoryCode, recordingID))
-        self.dbConnection.commit()
+        with self.dbPool.connection('set_category_code') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute('UPDATE recording SET rerun_code = %s WHERE recording_id = %s;', (categoryCode, recordingID))
 
     def dbGetCategoryCode(self, recordingID):
         categoryCode = ''
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute('SELECT rerun_code FROM recording WHERE recording_id = %s;', (recordingID, ))
-            row = cursor.fetchone()
-            if row:
-                categoryCode = row[0]
-        self.dbConnection.commit()
+        with self.dbPool.connection('get_category_code') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute('SELECT rerun_code FROM recording WHERE recording_id = %s;', (recordingID, ))
+                row = cursor.fetchone()
+                if row:
+                    categoryCode = row[0]
         return categoryCode
 
     def dbRemainingListingTime(self):
-        with self.dbConnection:
-            with self.dbConnection.cursor() as cursor:
+        with self.dbPool.connection('remaining_listing_time') as dbConnection:
+            with dbConnection.cursor() as cursor:
                 cursor.execute('SELECT max(start_time) - now() FROM schedule;')
                 row = cursor.fetchone()
                 return row[0]
@@ -248,60 +386,85 @@ class RestServer:
         springboard['trintv_getposition_url'] = self.makeURL('/recordings/{}/playbackPosition'.format(recordingData['recordingID']))
         springboard['trintv_archive_url'] = self.makeURL('/recordings/{}/archiveState/1'.format(recordingData['recordingID']))
         springboard['trintv_getarchivestate_url'] = self.makeURL('/recordings/{}/archiveState'.format(recordingData['recordingID']))
-        springboard['stream'] = { 'format' : 'mp4',
-                                  'quality' : 'HD',
-                                  'bitrate' : 1000,
-                                  'url' : recordingData['transcodedVideoURL']
-                                }
+        if recordingData.get('hlsURL'):
+            # adaptive; the client picks a rendition from the master playlist, so there's no single bitrate
+            springboard['stream'] = { 'format' : 'hls',
+                                      'quality' : 'HD',
+                                      'bitrate' : 0,
+                                      'url' : recordingData['hlsURL']
+                                    }
+        else:
+            springboard['stream'] = { 'format' : 'mp4',
+                                      'quality' : 'HD',
+                                      'bitrate' : 1000,
+                                      'url' : recordingData['transcodedVideoURL']
+                                    }
         return springboard
 
 
-    def getAllShows(self):
-        showList = self.dbGetShowsWithRecordings(['N', 'R', 'A'])
+    def buildShowListXml(self, categoryCodes):
+        showList = self.dbGetShowsWithRecordings(categoryCodes)
         rokuList = [self.rokufyShowData(show) for show in showList]
         rokuList.sort(key=lambda show: stripLeadingArticles(show['title']))
         return listToRokuXml('shows', 'show', rokuList)
 
+    # a page of episodes; when 'limit' is given, the list tag carries the total number of episodes and, if there are
+    # more, the URL of the next page
+    def buildEpisodeListXml(self, showID, categoryCodes, endpoint, offset, limit):
+        episodeList, totalCount = self.dbGetEpisodeData(showID, categoryCodes, offset, limit)
+        rokuList = [self.rokufyEpisodeData(episode) for episode in episodeList]
+        attributes = None
+        if limit is not None:
+            attributes = {'total': totalCount}
+            if offset + len(episodeList) < totalCount:
+                attributes['next_page_url'] = self.makeURL('/shows/{}/episodes/{}?offset={}&limit={}'.format(showID, endpoint, offset + limit, limit))
+        return listToRokuXml('shows', 'show', rokuList, attributes)
+
+    # the show and episode lists return a feed (xml and etag) from the feed cache
+    def getAllShows(self):
+        return self.feedCache.get(('shows', 'NRA'), lambda: self.buildShowListXml(['N', 'R', 'A']))
+
     def getShowsWithNewEpisodes(self):
-        showList = self.dbGetShowsWithRecordings(['N'])
-        rokuList = [self.rokufyShowData(show) for show in showList]
-        rokuList.sort(key=lambda show: stripLeadingArticles(show['title']))
-        return listToRokuXml('shows', 'show', rokuList)
+        return self.feedCache.get(('shows', 'N'), lambda: self.buildShowListXml(['N']))
 
-    def getShowEpisodesNew(self, showID):
-        episodeList = self.dbGetEpisodeData(showID, ['N'])
-        rokuList = [self.rokufyEpisodeData(episode) for episode in episodeList]
-        return listToRokuXml('shows', 'show', rokuList)
+    def getShowEpisodesNew(self, showID, offset=0, limit=None):
+        return self.feedCache.get(('episodes', 'N', showID, offset, limit), lambda: self.buildEpisodeListXml(showID, ['N'], 'new', offset, limit))
 
-    def getShowEpisodesRerun(self, showID):
-        episodeList = self.dbGetEpisodeData(showID, ['R'])
-        rokuList = [self.rokufyEpisodeData(episode) for episode in episodeList]
-        return listToRokuXml('shows', 'show', rokuList)
+    def getShowEpisodesRerun(self, showID, offset=0, limit=None):
+        return self.feedCache.get(('episodes', 'R', showID, offset, limit), lambda: self.buildEpisodeListXml(showID, ['R'], 'rerun', offset, limit))
 
-    def getShowEpisodesArchive(self, showID):
-        episodeList = self.dbGetEpisodeData(showID, ['A'])
-        rokuList = [self.rokufyEpisodeData(episode) for episode in episodeList]
-        xml = listToRokuXml('shows', 'show', rokuList)
-        return xml
+    def getShowEpisodesArchive(self, showID, offset=0, limit=None):
+        return self.feedCache.get(('episodes', 'A', showID, offset, limit), lambda: self.buildEpisodeListXml(showID, ['A'], 'archive', offset, limit))
 
+    # returns the springboard, with a Server-Timing header that splits the time between the database and building the XML
     def getRecording(self, recordingID):
-        recordingData = self.dbGetRecordingData(recordingID)
-        transcodedVideoLocationID = self.dbGetTranscodedVideoLocationID(recordingID)
-        recordingData['transcodedVideoURL'] = self.fileLocations.getTranscodedVideoURL(locationID = transcodedVideoLocationID, recordingID = recordingID)
-        bifLocationID = self.dbGetBifLocationID(recordingID)
-        recordingData['bifURL'] = self.fileLocations.getBifURL(locationID = bifLocationID, recordingID = recordingID)
+        startTime = time.perf_counter()
+        recordingData = self.dbGetSpringboardData(recordingID)
+        dbTime = time.perf_counter()
+        if recordingData is None:
+            return str(), 404
+        recordingData['transcodedVideoURL'] = self.fileLocations.getTranscodedVideoURL(locationID = recordingData['transcodedVideoLocationID'], recordingID = recordingID)
+        recordingData['bifURL'] = self.fileLocations.getBifURL(locationID = recordingData['bifLocationID'], recordingID = recordingID)
+        if recordingData['hlsLocationID'] is not None:
+            recordingData['hlsURL'] = self.fileLocations.getHlsURL(locationID = recordingData['hlsLocationID'], recordingID = recordingID)
         rokuData = self.rokufyRecordingData(recordingData)
-        return listToRokuXml('springboard', 'show', [rokuData])
+        xml = listToRokuXml('springboard', 'show', [rokuData])
+        xmlTime = time.perf_counter()
+        serverTiming = 'db;dur={:.2f}, xml;dur={:.2f}'.format((dbTime - startTime) * 1000, (xmlTime - dbTime) * 1000)
+        return xml, 200, {'Server-Timing': serverTiming}
 
     def deleteRecording(self, recordingID):
         self.dbDeleteRecording(recordingID)
+        self.recordingCache.invalidate(int(recordingID))
+        self.feedCache.invalidate()
+        self.recordingDeletedCallback(recordingID)
         return str(), 200
 
     def getPlaybackPosition(self, recordingID):
-        return str(self.dbGetPlaybackPosition(recordingID)['playbackPosition'])
+        return str(self.playbackPositions.get(recordingID))
 
     def setPlaybackPosition(self, recordingID, playbackPosition):
-        self.dbSetPlaybackPosition(recordingID, playbackPosition)
+        self.playbackPositions.set(recordingID, playbackPosition)
         return str(), 200
 
     def getArchiveState(self, recordingID):
@@ -313,8 +476,14 @@ class RestServer:
 
     def archiveRecording(self, recordingID):
         self.dbSetCategoryCode(recordingID, 'A')
+        self.recordingCache.invalidate(int(recordingID))
+        self.feedCache.invalidate()
         return str(), 200
 
+    def getCacheStats(self):
+        return {'Feeds': self.feedCache.getStats(), 'Recordings': self.recordingCache.getStats(), 'Shows': self.showCache.getStats(),
+                'Episode counts': self.episodeCountCache.getStats()}
+
     def getAlarms(self):
         alarmList = []
         remainingListingTime = self.dbRemainingListingTime()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3.4
+
+import collections
+import json
+import threading
+
+
+#
+# Notes on the status feed
+#
+# The recorder, transcoder and BIF generator report what they're doing (recordingStarted, recordingFinished,
+# scheduleChanged, transcodeStarted, transcodeProgress, transcodeFinished, bifFinished) through a 'statusCallback'.
+# In the web server, these are published to the status feed, which the admin pages follow as Server-Sent Events
+# (/statusEvents), updating themselves as things happen, rather than being reloaded (and re-running their queries).
+# Following the feed doesn't touch the database.  When the recorder is in another process, the events arrive as
+# STATUS_CHANGED notifications.
+#
+# Each event is numbered.  The most recent 'historySize' events are kept, so that a browser which reconnects (sending
+# the number of the last event it saw in Last-Event-ID) gets the ones it missed.  A browser that's new, or that has
+# missed more than that, gets a 'snapshot' event instead: the recordings and transcodes that are in progress.  reset()
+# drops everything, e.g. when notifications may have been missed, and sends everyone a (new) snapshot.
+#
+# Each page that's following the feed holds one of the web server's threads, which are a fixed number (with waitress,
+# CARBONDVR_WEBSERVER_THREADS), and are also needed by the Roku client.  So at most 'maxStreams' pages can follow the
+# feed at once; stream() returns None for any more (the web server answers 503, and the page tries again later).  A
+# comment is sent every 'keepaliveInterval' seconds, so that a closed page is noticed, and its thread (and stream)
+# freed, even when nothing's happening.
+#
+
+# an open stream of the feed; the web server closes it when the client goes away (or the response is finished with)
+class StatusStream:
+    def __init__(self, statusFeed, messages):
+        self.statusFeed = statusFeed
+        self.messages = messages
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.messages)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.messages.close()
+            self.statusFeed.releaseStream()
+
+
+class StatusFeed:
+    def __init__(self, historySize=100, maxStreams=4):
+        self.condition = threading.Condition()
+        self.maxStreams = maxStreams
+        self.openStreams = 0
+        self.lastEventID = 0
+        self.history = collections.deque(maxlen=historySize)   # (eventID, event)
+        self.recordings = {}     # recordingID -> the recording's recordingStarted event
+        self.transcodes = {}     # recordingID -> the recording's latest transcodeStarted/transcodeProgress event
+
+    def publish(self, eventType, **fields):
+        event = dict(fields, type=eventType)
+        with self.condition:
+            self.updateState(event)
+            self.lastEventID += 1
+            self.history.append((self.lastEventID, event))
+            self.condition.notify_all()
+
+    def updateState(self, event):
+        recordingID = event.get('recordingID')
+        if event['type'] == 'recordingStarted':
+            self.recordings[recordingID] = event
+        elif event['type'] == 'recordingFinished':
+            self.recordings.pop(recordingID, None)
+        elif event['type'] in ('transcodeStarted', 'transcodeProgress'):
+            self.transcodes[recordingID] = event
+        elif event['type'] == 'transcodeFinished':
+            self.transcodes.pop(recordingID, None)
+
+    def reset(self):
+        with self.condition:
+            self.recordings.clear()
+            self.transcodes.clear()
+            self.history.clear()
+            self.lastEventID += 1
+            self.condition.notify_all()
+
+    def getSnapshot(self):
+        with self.condition:
+            return self.makeSnapshot()
+
+    def makeSnapshot(self):
+        return {'type': 'snapshot', 'recordings': list(self.recordings.values()), 'transcodes': list(self.transcodes.values())}
+
+    # returns a list of (eventID, event): the events after 'afterEventID' (or a snapshot, if they aren't all in the
+    # history), waiting up to 'timeout' seconds for there to be any
+    def getEvents(self, afterEventID, timeout):
+        with self.condition:
+            self.condition.wait_for(lambda: afterEventID != self.lastEventID, timeout)
+            if afterEventID == self.lastEventID:
+                return []
+            if (afterEventID is None or afterEventID > self.lastEventID or not self.history
+                    or self.history[0][0] > afterEventID + 1):
+                return [(self.lastEventID, self.makeSnapshot())]
+            return [(eventID, event) for eventID, event in self.history if eventID > afterEventID]
+
+    # returns a StatusStream of the feed, formatted as Server-Sent Events, or None if 'maxStreams' are already open
+    def stream(self, lastEventID=None, keepaliveInterval=15):
+        with self.condition:
+            if self.openStreams >= self.maxStreams:
+                return None
+            self.openStreams += 1
+        return StatusStream(self, self.generateMessages(lastEventID, keepaliveInterval))
+
+    def releaseStream(self):
+        with self.condition:
+            self.openStreams -= 1
+
+    def generateMessages(self, lastEventID, keepaliveInterval):
+        eventID = lastEventID
+        yield 'retry: 5000\n\n'
+        while True:
+            events = self.getEvents(eventID, keepaliveInterval)
+            if not events:
+                yield ': keepalive\n\n'
+            for eventID, event in events:
+                yield 'id: {}\nevent: {}\ndata: {}\n\n'.format(eventID, event['type'], json.dumps(event))
@@ -0,0 +1,67 @@
+import unittest
+from webServer import webServerApp, FeedCache
+from unittest.mock import Mock
+
+
+class TestFeedCache(unittest.TestCase):
+
+    def test_feedCache_get(self):
+        feedCache = FeedCache()
+        buildXml = Mock(return_value='<shows>\n</shows>\n')
+        feed = feedCache.get(('shows', 'N'), buildXml)
+        self.assertEqual('<shows>\n</shows>\n', feed.xml)
+        self.assertIs(feed, feedCache.get(('shows', 'N'), buildXml))
+        self.assertEqual(1, buildXml.call_count)
+        feedCache.get(('shows', 'NRA'), buildXml)
+        self.assertEqual(2, buildXml.call_count)
+        self.assertEqual(1, feedCache.hits)
+        self.assertEqual(2, feedCache.misses)
+
+    def test_feedCache_maxSize(self):
+        feedCache = FeedCache(maxSize=2)
+        for offset in range(0, 100, 10):
+            feedCache.get(('episodes', 'N', 'SH1', offset, 10), lambda: '<episodes/>')
+        self.assertEqual(2, feedCache.getStats().size)
+
+    def test_feedCache_invalidate(self):
+        feedCache = FeedCache()
+        etag = feedCache.get('key', lambda: '<a>').etag
+        feedCache.invalidate()
+        feed = feedCache.get('key', lambda: '<a>')
+        self.assertEqual(etag, feed.etag)          # same content, same etag
+        feedCache.invalidate()
+        self.assertNotEqual(etag, feedCache.get('key', lambda: '<b>').etag)
+
+    def test_feedCache_invalidateHandlers(self):
+        feedCache = FeedCache()
+        handler = Mock()
+        feedCache.addInvalidateHandler(handler)
+        feedCache.invalidate()
+        handler.assert_called_once_with()
+
+    def test_feedCache_invalidatedWhileBuilding(self):
+        feedCache = FeedCache()
+        def buildXml():
+            feedCache.invalidate()
+            return '<stale>'
+        self.assertEqual('<stale>', feedCache.get('key', buildXml).xml)
+        self.assertEqual('<fresh>', feedCache.get('key', lambda: '<fresh>').xml)
+
+    def test_feedCache_conditionalResponse(self):
+        feedCache = FeedCache()
+        webServerApp.restServer = Mock()
+        webServerApp.restServer.getAllShows.side_effect = lambda: feedCache.get(('shows', 'NRA'), lambda: '<shows>\n</shows>\n')
+        client = webServerApp.test_client()
+        response = client.get('/shows')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(b'<shows>\n</shows>\n', response.data)
+        etag = response.headers['ETag']
+        response = client.get('/shows', headers={'If-None-Match': etag})
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(b'', response.data)
+        response = client.get('/shows', headers={'If-None-Match': '"something-else"'})
+        self.assertEqual(200, response.status_code)
+
+
+if __name__ == '__main__':
+    unittest.main()
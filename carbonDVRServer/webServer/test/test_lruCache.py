@@ -0,0 +1,63 @@
+import unittest
+from webServer import LRUCache
+from unittest.mock import Mock
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_lruCache_get(self):
+        cache = LRUCache(10)
+        load = Mock(side_effect=lambda key: key * 2)
+        self.assertEqual(4, cache.get(2, load))
+        self.assertEqual(4, cache.get(2, load))
+        load.assert_called_once_with(2)
+        stats = cache.getStats()
+        self.assertEqual((1, 1, 1), (stats.size, stats.hits, stats.misses))
+
+    def test_lruCache_missingKeysAreNotCached(self):
+        cache = LRUCache(10)
+        load = Mock(return_value=None)
+        self.assertIsNone(cache.get(1, load))
+        self.assertIsNone(cache.get(1, load))
+        self.assertEqual(2, load.call_count)
+
+    def test_lruCache_evictsLeastRecentlyUsed(self):
+        cache = LRUCache(2)
+        cache.put(1, 'a')
+        cache.put(2, 'b')
+        cache.lookup(1)
+        cache.put(3, 'c')
+        self.assertEqual('a', cache.lookup(1))
+        self.assertIsNone(cache.lookup(2))
+        self.assertEqual('c', cache.lookup(3))
+
+    def test_lruCache_getMany(self):
+        cache = LRUCache(10)
+        cache.put(1, 'a')
+        loadMany = Mock(return_value={2: 'b'})
+        self.assertEqual({1: 'a', 2: 'b'}, cache.getMany([1, 2, 3], loadMany))
+        loadMany.assert_called_once_with([2, 3])
+        self.assertEqual({2: 'b'}, cache.getMany([2], loadMany))
+        self.assertEqual(1, loadMany.call_count)
+
+    def test_lruCache_invalidate(self):
+        cache = LRUCache(10)
+        cache.put(1, 'a')
+        cache.put(2, 'b')
+        cache.invalidate(1)
+        self.assertIsNone(cache.lookup(1))
+        self.assertEqual('b', cache.lookup(2))
+        cache.clear()
+        self.assertIsNone(cache.lookup(2))
+
+    def test_lruCache_clearedWhileLoading(self):
+        cache = LRUCache(10)
+        def load(key):
+            cache.clear()
+            return 'stale'
+        self.assertEqual('stale', cache.get(1, load))
+        self.assertIsNone(cache.lookup(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
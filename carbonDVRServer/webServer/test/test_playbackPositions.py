@@ -0,0 +1,71 @@
+import psycopg2
+import unittest
+from webServer import PlaybackPositions
+from unittest.mock import Mock
+
+
+class TestPlaybackPositions(unittest.TestCase):
+
+    def setUp(self):
+        self.playbackPositions = PlaybackPositions(Mock())
+        self.playbackPositions.dbGetPlaybackPosition = Mock(return_value=120)
+        self.playbackPositions.dbSetPlaybackPositions = Mock()
+
+    def test_playbackPositions_get(self):
+        self.assertEqual(120, self.playbackPositions.get('5'))
+        self.assertEqual(120, self.playbackPositions.get(5))
+        self.playbackPositions.dbGetPlaybackPosition.assert_called_once_with(5)
+
+    def test_playbackPositions_getAfterSet(self):
+        self.playbackPositions.set('5', '300')
+        self.assertEqual(300, self.playbackPositions.get(5))
+        self.assertFalse(self.playbackPositions.dbGetPlaybackPosition.called)
+
+    def test_playbackPositions_flushCoalesces(self):
+        for position in range(10, 60, 10):
+            self.playbackPositions.set(5, position)
+        self.playbackPositions.set(7, 90)
+        self.playbackPositions.flush()
+        self.assertEqual(1, self.playbackPositions.dbSetPlaybackPositions.call_count)
+        positions = self.playbackPositions.dbSetPlaybackPositions.call_args[0][0]
+        self.assertEqual([(5, 50), (7, 90)], sorted(positions))
+        self.playbackPositions.flush()
+        self.assertEqual(1, self.playbackPositions.dbSetPlaybackPositions.call_count)      # nothing new to write
+
+    def test_playbackPositions_flushFailure(self):
+        self.playbackPositions.dbSetPlaybackPositions.side_effect = psycopg2.OperationalError('connection lost')
+        self.playbackPositions.set(5, 50)
+        self.playbackPositions.flush()
+        self.playbackPositions.dbSetPlaybackPositions.side_effect = None
+        self.playbackPositions.flush()
+        self.playbackPositions.dbSetPlaybackPositions.assert_called_with([(5, 50)])
+
+    def test_playbackPositions_flushRejected(self):
+        def setPositions(positions):
+            if (2 ** 40, 60) in positions:
+                raise psycopg2.DataError('integer out of range')
+        self.playbackPositions.dbSetPlaybackPositions.side_effect = setPositions
+        for recordingID, playbackPosition in ((5, 50), (2 ** 40, 60), (7, 70)):
+            self.playbackPositions.set(recordingID, playbackPosition)
+        self.playbackPositions.flush()
+        self.assertEqual(4, self.playbackPositions.dbSetPlaybackPositions.call_count)     # the batch, then each row
+        self.assertEqual(set(), self.playbackPositions.dirty)
+        self.playbackPositions.flush()
+        self.assertEqual(4, self.playbackPositions.dbSetPlaybackPositions.call_count)     # the rejected row was dropped
+
+    def test_playbackPositions_clamp(self):
+        self.playbackPositions.set(5, 10 ** 12)
+        self.playbackPositions.set(7, -5)
+        self.assertEqual(2 ** 31 - 1, self.playbackPositions.get(5))
+        self.assertEqual(0, self.playbackPositions.get(7))
+
+    def test_playbackPositions_stop(self):
+        self.playbackPositions.flushInterval = 3600
+        self.playbackPositions.start()
+        self.playbackPositions.set(5, 50)
+        self.playbackPositions.stop()
+        self.playbackPositions.dbSetPlaybackPositions.assert_called_once_with([(5, 50)])
+
+
+if __name__ == '__main__':
+    unittest.main()
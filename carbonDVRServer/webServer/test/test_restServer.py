@@ -0,0 +1,138 @@
+import datetime
+import pytz
+import re
+import unittest
+from webServer.restServer import RestServer, dictionaryToRokuXml, listToRokuXml, iterListToRokuXml
+from unittest.mock import ANY, MagicMock, Mock
+
+
+class TestRokuXml(unittest.TestCase):
+
+    def test_rokuXml_dictionary(self):
+        springboard = {'title': 'Tom & Jerry', 'length': 1800.0, 'stream': {'format': 'mp4', 'url': 'http://dvr/video/5.mp4'}}
+        self.assertEqual('<show title="Tom &amp; Jerry" length="1800.0" ><stream format="mp4" url="http://dvr/video/5.mp4" ></stream></show>',
+                         dictionaryToRokuXml('show', springboard))
+
+    def test_rokuXml_list(self):
+        episodes = [{'short_description_1': '1: "Pilot"'}, 'not a dict', {'short_description_1': "2: It's <new>"}]
+        expected = str('<shows>\n'
+                       '<show short_description_1=\'1: "Pilot"\' ></show>'
+                       '<show short_description_1="2: It\'s &lt;new&gt;" ></show>'
+                       '</shows>\n')
+        self.assertEqual(expected, listToRokuXml('shows', 'show', episodes))
+        self.assertEqual(expected, ''.join(iterListToRokuXml('shows', 'show', episodes)))
+        self.assertEqual('<shows>\n</shows>\n', listToRokuXml('shows', 'show', []))
+
+
+
+class TestRestServer(unittest.TestCase):
+
+    def setUp(self):
+        self.fileLocations = Mock()
+        self.fileLocations.getTranscodedVideoURL.side_effect = lambda locationID, recordingID: 'http://dvr/{}/video/{}.mp4'.format(locationID, recordingID)
+        self.fileLocations.getBifURL.side_effect = lambda locationID, recordingID: 'http://dvr/{}/bif/{}.bif'.format(locationID, recordingID)
+        self.fileLocations.getHlsURL.side_effect = lambda locationID, recordingID: 'http://dvr/hls/{}/{}/master.m3u8'.format(locationID, recordingID)
+        self.dbPool = Mock()
+        self.restServer = RestServer(self.dbPool, self.fileLocations, 'http://dvr', Mock(), Mock(), Mock())
+
+    def test_restServer_springboardQueriesArePrepared(self):
+        self.dbPool.prepare.assert_any_call('get_springboard', ANY, 1)
+        self.dbPool.prepare.assert_any_call('get_recording_locations', ANY, 1)
+
+    def makeSpringboardData(self, hlsLocationID=None):
+        return {'recordingID': 5, 'showName': 'Nova', 'imageURL': None, 'episodeTitle': 'Pilot',
+            'episodeDescription': 'The first one', 'dateRecorded': datetime.datetime(2016, 3, 4, 20, 0, tzinfo=pytz.utc),
+            'duration': datetime.timedelta(minutes=30), 'episodeNumber': '1', 'transcodedVideoLocationID': 2, 'bifLocationID': 1,
+            'hlsLocationID': hlsLocationID}
+
+    def test_restServer_getRecording(self):
+        self.restServer.dbGetSpringboardData = Mock(return_value=self.makeSpringboardData())
+        xml, status, headers = self.restServer.getRecording(5)
+        self.assertEqual(200, status)
+        self.assertIn('format="mp4"', xml)
+        self.assertIn('url="http://dvr/2/video/5.mp4"', xml)
+        self.assertIn('hd_bif_url="http://dvr/1/bif/5.bif"', xml)
+        self.assertIsNotNone(re.match(r'^db;dur=[0-9.]+, xml;dur=[0-9.]+$', headers['Server-Timing']))
+
+    def test_restServer_getRecording_hls(self):
+        self.restServer.dbGetSpringboardData = Mock(return_value=self.makeSpringboardData(hlsLocationID=1))
+        xml, status, headers = self.restServer.getRecording(5)
+        self.assertIn('format="hls"', xml)
+        self.assertIn('bitrate="0"', xml)
+        self.assertIn('url="http://dvr/hls/1/5/master.m3u8"', xml)
+
+    def test_restServer_getRecording_notFound(self):
+        self.restServer.dbGetSpringboardData = Mock(return_value=None)
+        self.assertEqual(404, self.restServer.getRecording(5)[1])
+
+    def test_restServer_episodePages(self):
+        episode = {'recordingID': 5, 'showID': 'SH1', 'episodeID': '1', 'episodeTitle': 'Pilot', 'episodeDescription': 'The first one',
+                   'imageURL': None, 'showImageURL': None, 'episodeNumber': '1'}
+        self.restServer.dbGetEpisodeData = Mock(return_value=([episode, episode], 5))
+        xml = self.restServer.buildEpisodeListXml('SH1', ['A'], 'archive', 2, 2)
+        self.restServer.dbGetEpisodeData.assert_called_once_with('SH1', ['A'], 2, 2)
+        self.assertIn('total="5"', xml.split('\n')[0])
+        self.assertIn('next_page_url="http://dvr/shows/SH1/episodes/archive?offset=4&amp;limit=2"', xml.split('\n')[0])
+        # the last page has no next page
+        self.restServer.dbGetEpisodeData = Mock(return_value=([episode], 5))
+        xml = self.restServer.buildEpisodeListXml('SH1', ['A'], 'archive', 4, 2)
+        self.assertEqual('<shows total="5" >', xml.split('\n')[0])
+        # without a limit, the list is returned as before
+        self.restServer.dbGetEpisodeData = Mock(return_value=([episode], 1))
+        xml = self.restServer.buildEpisodeListXml('SH1', ['A'], 'archive', 0, None)
+        self.assertEqual('<shows>', xml.split('\n')[0])
+
+    def test_restServer_episodeDataIsCached(self):
+        recording = {'recordingID': 5, 'showID': 'SH1', 'episodeNumber': '1', 'episodeTitle': 'Pilot', 'episodeDescription': 'The first one',
+                     'episodeImageURL': None, 'dateRecorded': None, 'duration': None}
+        self.restServer.dbGetEpisodePage = Mock(return_value=[5, 6])
+        self.restServer.dbGetRecordingMetadata = Mock(return_value={5: recording})      # 6 was deleted in the meantime
+        self.restServer.dbGetShowMetadata = Mock(return_value={'showID': 'SH1', 'showName': 'Nova', 'showImageURL': 'http://img/nova.jpg'})
+        for i in range(2):
+            episodes, totalCount = self.restServer.dbGetEpisodeData('SH1', ['N'])
+            self.assertEqual(1, len(episodes))
+            self.assertEqual('http://img/nova.jpg', episodes[0]['showImageURL'])
+        self.assertEqual(1, self.restServer.dbGetShowMetadata.call_count)
+        self.restServer.dbGetRecordingMetadata.assert_called_with([6])
+        self.assertEqual(1, self.restServer.recordingCache.hits)
+
+    def test_restServer_episodeCount(self):
+        self.restServer.dbGetEpisodeCount = Mock(return_value=25)
+        # a page that isn't full is the last one, so the count isn't needed
+        self.assertEqual(23, self.restServer.getEpisodeCount('SH1', ['N'], 20, 10, [1, 2, 3]))
+        self.assertEqual(3, self.restServer.getEpisodeCount('SH1', ['N'], 0, None, [1, 2, 3]))
+        self.assertEqual(0, self.restServer.getEpisodeCount('SH1', ['N'], 0, 10, []))
+        self.assertFalse(self.restServer.dbGetEpisodeCount.called)
+        # otherwise, it's counted once, until the caches are cleared (when the feeds are invalidated)
+        self.assertEqual(25, self.restServer.getEpisodeCount('SH1', ['N'], 0, 10, list(range(10))))
+        self.assertEqual(25, self.restServer.getEpisodeCount('SH1', ['N'], 10, 10, list(range(10))))
+        self.assertEqual(25, self.restServer.getEpisodeCount('SH1', ['N'], 40, 10, []))
+        self.restServer.dbGetEpisodeCount.assert_called_once_with(('SH1', ('N', )))
+        self.restServer.feedCache.addInvalidateHandler.assert_any_call(self.restServer.episodeCountCache.clear)
+        self.restServer.episodeCountCache.clear()
+        self.restServer.getEpisodeCount('SH1', ['N'], 0, 10, list(range(10)))
+        self.assertEqual(2, self.restServer.dbGetEpisodeCount.call_count)
+
+    def test_restServer_springboardUsesCachedMetadata(self):
+        self.dbPool.connection.return_value = MagicMock()
+        cursor = self.dbPool.connection.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        dateRecorded = datetime.datetime(2016, 3, 4, 20, 0, tzinfo=pytz.utc)
+        cursor.fetchone.return_value = (5, 'SH1', '1', 'Pilot', 'Caf\xe9', None, dateRecorded, datetime.timedelta(minutes=30),
+                                        'SH1', 'Nova', None, 2, 1, None)
+        springboard = self.restServer.dbGetSpringboardData('5')
+        self.assertEqual('Caf&#233;', springboard['episodeDescription'])
+        self.assertEqual((2, 1), (springboard['transcodedVideoLocationID'], springboard['bifLocationID']))
+        self.dbPool.executePrepared.assert_called_with(ANY, ANY, 'get_springboard', (5, ))
+        # the second time, only the locations are looked up
+        cursor.fetchone.return_value = (5, 3, 1, None)
+        springboard = self.restServer.dbGetSpringboardData('5')
+        self.dbPool.executePrepared.assert_called_with(ANY, ANY, 'get_recording_locations', (5, ))
+        self.assertEqual(('Nova', 'Caf&#233;', 3), (springboard['showName'], springboard['episodeDescription'], springboard['transcodedVideoLocationID']))
+        # until the recording is archived
+        self.restServer.dbSetCategoryCode = Mock()
+        self.restServer.archiveRecording('5')
+        self.assertIsNone(self.restServer.recordingCache.lookup(5))
+
+
+if __name__ == '__main__':
+    unittest.main()
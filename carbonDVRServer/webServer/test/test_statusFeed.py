@@ -0,0 +1,81 @@
+import json
+import threading
+import unittest
+from webServer import StatusFeed
+
+
+class TestStatusFeed(unittest.TestCase):
+
+    def test_statusFeed_snapshot(self):
+        statusFeed = StatusFeed()
+        statusFeed.publish('recordingStarted', recordingID=1, showID='SH1', episodeID='EP1')
+        statusFeed.publish('recordingStarted', recordingID=2, showID='SH2', episodeID='EP2')
+        statusFeed.publish('recordingFinished', recordingID=1, success=True)
+        statusFeed.publish('transcodeStarted', recordingID=1, stage='mp4', percent=0)
+        statusFeed.publish('transcodeProgress', recordingID=1, stage='mp4', percent=42)
+        # a new client gets the current state, as of the latest event
+        events = statusFeed.getEvents(None, 0)
+        self.assertEqual(1, len(events))
+        eventID, snapshot = events[0]
+        self.assertEqual(5, eventID)
+        self.assertEqual('snapshot', snapshot['type'])
+        self.assertEqual([2], [recording['recordingID'] for recording in snapshot['recordings']])
+        self.assertEqual([42], [transcode['percent'] for transcode in snapshot['transcodes']])
+        statusFeed.publish('transcodeFinished', recordingID=1, success=True)
+        self.assertEqual([], statusFeed.getSnapshot()['transcodes'])
+
+    def test_statusFeed_missedEvents(self):
+        statusFeed = StatusFeed(historySize=3)
+        for recordingID in range(1, 6):
+            statusFeed.publish('bifFinished', recordingID=recordingID)
+        # a client that's caught up waits, and gets nothing
+        self.assertEqual([], statusFeed.getEvents(5, 0))
+        # a reconnecting client gets the events it missed
+        events = statusFeed.getEvents(3, 0)
+        self.assertEqual([4, 5], [eventID for eventID, event in events])
+        self.assertEqual([4, 5], [event['recordingID'] for eventID, event in events])
+        # unless they're no longer in the history, or are from before a restart
+        self.assertEqual('snapshot', statusFeed.getEvents(1, 0)[0][1]['type'])
+        self.assertEqual('snapshot', statusFeed.getEvents(9, 0)[0][1]['type'])
+
+    def test_statusFeed_reset(self):
+        statusFeed = StatusFeed()
+        statusFeed.publish('recordingStarted', recordingID=1)
+        statusFeed.reset()
+        events = statusFeed.getEvents(1, 0)
+        self.assertEqual([(2, {'type': 'snapshot', 'recordings': [], 'transcodes': []})], events)
+
+    def test_statusFeed_wait(self):
+        statusFeed = StatusFeed()
+        statusFeed.publish('recordingStarted', recordingID=1)
+        timer = threading.Timer(0.1, lambda: statusFeed.publish('recordingFinished', recordingID=1, success=False))
+        timer.start()
+        events = statusFeed.getEvents(1, 5)
+        timer.join()
+        self.assertEqual([(2, {'type': 'recordingFinished', 'recordingID': 1, 'success': False})], events)
+
+    def test_statusFeed_stream(self):
+        statusFeed = StatusFeed()
+        statusFeed.publish('bifFinished', recordingID=7)
+        stream = statusFeed.stream(0, keepaliveInterval=0)
+        self.assertEqual('retry: 5000\n\n', next(stream))
+        message = next(stream)
+        self.assertTrue(message.startswith('id: 1\nevent: bifFinished\ndata: '))
+        self.assertEqual({'type': 'bifFinished', 'recordingID': 7}, json.loads(message.splitlines()[2][len('data: '):]))
+        self.assertEqual(': keepalive\n\n', next(stream))
+
+    def test_statusFeed_maxStreams(self):
+        statusFeed = StatusFeed(maxStreams=2)
+        first = statusFeed.stream()
+        second = statusFeed.stream()
+        self.assertIsNone(statusFeed.stream())
+        next(first)
+        first.close()
+        first.close()
+        second.close()          # never started
+        self.assertEqual(0, statusFeed.openStreams)
+        self.assertIsNotNone(statusFeed.stream())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import datetime
+import pytz
+import unittest
+from webServer import webServerApp, StatusFeed, UIServer
+from webServer.uiServer import Bunch, makePageKey, parsePageKey, estimateTranscodeBacklog
+from dbPool import QueryLog
+from unittest.mock import Mock
+
+
+class TestUIServer(unittest.TestCase):
+
+    def setUp(self):
+        self.uiServer = UIServer(Mock(), 'http://dvr', Mock())
+        webServerApp.uiServer = self.uiServer
+        webServerApp.restServer = Mock()
+        self.client = webServerApp.test_client()
+
+    def test_uiServer_subscribe(self):
+        self.uiServer.dbSubscribe = Mock()
+        self.uiServer.dbUnsubscribe = Mock()
+        response = self.client.get('/subscribe/SH1')
+        self.assertEqual(302, response.status_code)
+        self.uiServer.dbSubscribe.assert_called_once_with('SH1')
+        self.uiServer.scheduleRecordingsCallback.assert_called_once_with('SH1')
+        self.client.get('/unsubscribe/SH2')
+        self.uiServer.dbUnsubscribe.assert_called_once_with('SH2')
+        self.uiServer.scheduleRecordingsCallback.assert_called_with('SH2')
+
+    def test_uiServer_setKeepCount(self):
+        self.uiServer.dbSetKeepCount = Mock()
+        response = self.client.get('/setKeepCount/SH1?keep=5')
+        self.assertEqual(302, response.status_code)
+        self.uiServer.dbSetKeepCount.assert_called_once_with('SH1', 5)
+        self.client.get('/setKeepCount/SH1?keep=')
+        self.uiServer.dbSetKeepCount.assert_called_with('SH1', None)
+        self.client.get('/setKeepCount/SH1?keep=-2')
+        self.uiServer.dbSetKeepCount.assert_called_with('SH1', 0)
+
+    def test_uiServer_statusEvents(self):
+        response = self.client.get('/statusEvents')
+        self.assertEqual(404, response.status_code)         # no status feed
+        self.uiServer.statusFeed = Mock()
+        self.uiServer.statusFeed.stream.return_value = iter(['retry: 5000\n\n', 'id: 3\nevent: snapshot\ndata: {}\n\n'])
+        response = self.client.get('/statusEvents', headers={'Last-Event-ID': '2'})
+        self.assertEqual('text/event-stream', response.mimetype)
+        self.assertIn(b'event: snapshot', response.data)
+        self.uiServer.statusFeed.stream.assert_called_once_with(2)
+        # a page is turned away when too many are following the feed
+        self.uiServer.statusFeed = StatusFeed(maxStreams=1)
+        response = self.client.get('/statusEvents', buffered=False)
+        self.assertEqual(200, response.status_code)
+        busyResponse = self.client.get('/statusEvents')
+        self.assertEqual(503, busyResponse.status_code)
+        self.assertEqual('30', busyResponse.headers['Retry-After'])
+        self.assertIn(b'retry: 30000', busyResponse.data)
+        response.close()
+        self.assertEqual(0, self.uiServer.statusFeed.openStreams)
+
+    def test_uiServer_queryStats(self):
+        queryLog = QueryLog(slowQueryThreshold=1.0)
+        queryLog.record('upcoming_recordings', 'SELECT * FROM upcoming_recording WHERE start_time > 5', 0.25)
+        queryLog.record('upcoming_recordings', 'SELECT * FROM upcoming_recording WHERE start_time > 6', 2.0, lambda: 'Seq Scan on upcoming_recording')
+        self.uiServer.dbPool.queryLog = queryLog
+        response = self.client.get('/queryStats')
+        self.assertIn(b'SELECT * FROM upcoming_recording WHERE start_time &gt; ?', response.data)
+        self.assertIn(b'1125.0ms', response.data)        # average
+        self.assertIn(b'<PRE>Seq Scan on upcoming_recording</PRE>', response.data)
+        response = self.client.get('/resetQueryStats')
+        self.assertEqual(302, response.status_code)
+        self.assertEqual([], queryLog.getStats())
+
+    def test_uiServer_metrics(self):
+        self.client.get('/statusEvents')
+        response = self.client.get('/metrics')
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        self.assertIn(b'carbondvr_http_request_seconds_count{endpoint="getStatusEvents",method="GET"}', response.data)
+        self.assertIn(b'carbondvr_http_responses_total{endpoint="getStatusEvents",status="404"}', response.data)
+
+    def test_uiServer_estimateTranscodeBacklog(self):
+        recordings = [Bunch(recordingID=1, duration=datetime.timedelta(hours=1)), Bunch(recordingID=2, duration=datetime.timedelta(minutes=30))]
+        self.assertIsNone(estimateTranscodeBacklog(recordings, {}, {}))
+        # MP4 profiles are averaged, weighted by their number of jobs: (4 * 1 + 1 * 3) / 4 = 1.75x
+        speeds = {'low': Bunch(jobs=1, speed=4.0), 'medium': Bunch(jobs=3, speed=1.0)}
+        self.assertEqual(datetime.timedelta(seconds=int(5400 / 1.75)), estimateTranscodeBacklog(recordings, speeds, {}))
+        # the running job has a quarter left, at its own speed
+        runningJobs = {1: Bunch(profile='medium', percent=75, speed=0.5)}
+        self.assertEqual(datetime.timedelta(seconds=int(900 / 0.5 + 1800 / 1.75)), estimateTranscodeBacklog(recordings, speeds, runningJobs))
+        # and, with an HLS history, each recording is also transcoded to HLS
+        speeds['hls'] = Bunch(jobs=2, speed=0.5)
+        self.assertEqual(datetime.timedelta(seconds=int(900 / 0.5 + 1800 / 1.75 + 5400 / 0.5)), estimateTranscodeBacklog(recordings, speeds, runningJobs))
+
+    def test_uiServer_pendingTranscodingJobs(self):
+        recording = Bunch(recordingID=7, show='Nova', episode='Pilot', episodeNumber='1',
+                          dateRecorded=datetime.datetime(2016, 3, 4, 20, 0, tzinfo=pytz.utc), duration=datetime.timedelta(minutes=30))
+        self.uiServer.dbGetPendingTranscodingJobs = Mock(return_value=[recording])
+        self.uiServer.dbGetRunningTranscodeJobs = Mock(return_value={7: Bunch(profile='high', percent=40, fps=58.2, speed=1.94)})
+        self.uiServer.dbGetTranscodeSpeeds = Mock(return_value={'high': Bunch(profile='high', jobs=12, speed=2.0, fps=60.0)})
+        response = self.client.get('/pendingTranscodingJobs')
+        self.assertEqual(200, response.status_code)
+        self.assertIn(b'Transcoding 40% (1.94x, 58 fps)', response.data)
+        self.assertIn(b'should take about 0:09:16', response.data)      # 60% of 30 minutes, at 1.94x
+        self.assertIn(b'<TD>2.00x</TD>', response.data)
+
+    def test_uiServer_recordingsByShow(self):
+        shows = [Bunch(showID='SH{}'.format(i), name='Show {}'.format(i), numRecordings=i) for i in range(2, 4)]
+        self.uiServer.dbGetShowsWithRecordings = Mock(return_value=(shows, 5))
+        self.uiServer.dbGetRecordingsForShow = Mock()
+        response = self.client.get('/recordingsByShow?offset=2&limit=2')
+        self.assertEqual(200, response.status_code)
+        self.uiServer.dbGetShowsWithRecordings.assert_called_once_with(2, 2)
+        self.assertFalse(self.uiServer.dbGetRecordingsForShow.called)    # no show is expanded
+        self.assertIn(b'Shows 3 to 4 of 5', response.data)
+        self.assertIn(b'offset=0', response.data)          # previous page
+        self.assertIn(b'offset=4', response.data)          # next page
+
+    def test_uiServer_recordingsByShow_expanded(self):
+        shows = [Bunch(showID='SH1', name='Nova', numRecordings=1), Bunch(showID='SH2', name='Frontline', numRecordings=3)]
+        self.uiServer.dbGetShowsWithRecordings = Mock(return_value=(shows, 2))
+        recording = Bunch(recordingID=7, show='Nova', episode='Pilot', episodeNumber='1',
+                          dateRecorded=datetime.datetime(2016, 3, 4, 20, 0, tzinfo=pytz.utc), duration=datetime.timedelta(minutes=30))
+        self.uiServer.dbGetRecordingsForShow = Mock(return_value=[recording])
+        response = self.client.get('/recordingsByShow?show=SH1')
+        self.uiServer.dbGetShowsWithRecordings.assert_called_once_with(0, 50)
+        self.uiServer.dbGetRecordingsForShow.assert_called_once_with('SH1')
+        self.assertIn(b'/deleteRecordingFromRecordingsByShow/7?', response.data)
+        self.assertNotIn(b'Next', response.data)
+        # deleting returns to the same page, with the same show expanded
+        response = self.client.get('/deleteRecordingFromRecordingsByShow/7?show=SH1&offset=0&limit=50')
+        webServerApp.restServer.deleteRecording.assert_called_once_with('7')
+        self.assertIn('show=SH1', response.headers['Location'])
+
+    def makeRecordings(self, recordingIDs):
+        return [Bunch(recordingID=recordingID, show='Nova', episode='Pilot', episodeNumber='1',
+                      dateRecorded=datetime.datetime(2016, 3, 4, 20, 0, recordingID, tzinfo=pytz.utc), duration=datetime.timedelta(minutes=30))
+                for recordingID in recordingIDs]
+
+    def test_uiServer_pageKey(self):
+        recording = self.makeRecordings([7])[0]
+        self.assertEqual('20160304200007000000-7', makePageKey(recording))
+        self.assertEqual((recording.dateRecorded, 7), parsePageKey(makePageKey(recording)))
+        self.assertIsNone(parsePageKey('yesterday'))
+
+    def test_uiServer_recordingsByDate(self):
+        self.uiServer.dbGetRecordingsByDate = Mock(return_value=self.makeRecordings([9, 8, 7]))
+        response = self.client.get('/recordingsByDate?limit=2')
+        self.uiServer.dbGetRecordingsByDate.assert_called_once_with(None, 3)       # one extra, to see if there's another page
+        self.assertNotIn(b'<TD>7</TD>', response.data)
+        self.assertIn(b'before=20160304200008000000-8', response.data)
+        # the next page's rows
+        self.uiServer.dbGetRecordingsByDate = Mock(return_value=self.makeRecordings([7]))
+        response = self.client.get('/recordingsByDate/rows?before=20160304200008000000-8&limit=2')
+        self.uiServer.dbGetRecordingsByDate.assert_called_once_with((datetime.datetime(2016, 3, 4, 20, 0, 8, tzinfo=pytz.utc), 8), 3)
+        self.assertTrue(response.data.strip().startswith(b'<TR>'))
+        self.assertIn(b'<TD>7</TD>', response.data)
+        self.assertNotIn(b'More', response.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3.4
 
 from flask import render_template
+import datetime
 import logging
 import os
 import psycopg2
@@ -15,32 +16,131 @@ class Bunch():
         self.__dict__.update(kwds)
 
 
+#
+# Notes on paging recordingsByDate
+#
+# Recordings by date is paged with a key (the date recorded and recording ID of the last recording on the previous
+# page), rather than an offset, so that each page is a short scan of the recording_date_order index, however far back
+# it is; with an offset, the database would have to read and discard every recording before the page.  The recording
+# ID breaks ties between recordings made at the same time.
+#
+# The key goes in the URL as <UTC date as YYYYmmddHHMMSSffffff>-<recordingID>.
+#
+
+def makePageKey(recording):
+    return '{}-{}'.format(recording.dateRecorded.astimezone(datetime.timezone.utc).strftime('%Y%m%d%H%M%S%f'), recording.recordingID)
+
+
+# returns (dateRecorded, recordingID), or None if 'pageKey' isn't valid
+def parsePageKey(pageKey):
+    try:
+        dateRecorded, recordingID = pageKey.split('-')
+        return datetime.datetime.strptime(dateRecorded, '%Y%m%d%H%M%S%f').replace(tzinfo=datetime.timezone.utc), int(recordingID)
+    except ValueError:
+        return None
+
+
+# returns the estimated time (a timedelta) to transcode the pending 'recordings', or None if there's no history to
+# estimate from; 'speeds' is a dictionary (profile -> Bunch(jobs, speed, fps)), from the transcode_speed view, and
+# 'runningJobs' is a dictionary (recordingID -> Bunch(profile, percent, speed, ...)) of the transcodes in progress
+def estimateTranscodeBacklog(recordings, speeds, runningJobs):
+    # which MP4 profile a recording will get depends on its bitrate, which isn't known here; so use the average speed
+    # over all of them, weighted by the number of jobs
+    mp4Speeds = [speeds[profile] for profile in ('low', 'medium', 'high') if profile in speeds]
+    if not mp4Speeds:
+        return None
+    mp4Speed = sum(speed.speed * speed.jobs for speed in mp4Speeds) / sum(speed.jobs for speed in mp4Speeds)
+    hlsSpeed = speeds['hls'].speed if 'hls' in speeds else None        # if there's no HLS history, HLS isn't configured
+    seconds = 0.0
+    for recording in recordings:
+        videoSeconds = recording.duration.total_seconds()
+        job = runningJobs.get(recording.recordingID)
+        if job is not None and job.profile != 'hls':
+            seconds += videoSeconds * (100 - job.percent) / 100 / (job.speed or mp4Speed)
+        else:
+            seconds += videoSeconds / mp4Speed
+        if hlsSpeed:
+            seconds += videoSeconds / hlsSpeed
+    return datetime.timedelta(seconds=int(seconds))
+
+
 class UIServer:
-    def __init__(self, dbConnection, uiServerURL, scheduleRecordingsCallback):
-        self.dbConnection = dbConnection
+    def __init__(self, dbPool, uiServerURL, scheduleRecordingsCallback, statusFeed=None):
+        self.dbPool = dbPool
         self.uiServerURL = uiServerURL
         self.scheduleRecordingsCallback = scheduleRecordingsCallback
+        self.statusFeed = statusFeed
 
     def makeURL(self, endpoint):
         return self.uiServerURL + endpoint
 
-    def dbGetAllRecordings(self):
+    # recordings, newest first, starting after the recording identified by 'before' (a (dateRecorded, recordingID) key),
+    # or from the newest if 'before' is None
+    def dbGetRecordingsByDate(self, before, limit):
         recordings = []
+        localTimezone = tzlocal.get_localzone()
+        beforeDate, beforeID = before if before is not None else (None, None)
         query = str("SELECT recording.recording_id, show.name, episode.episode_id, episode.title, recording.date_recorded, recording.duration "
                     "FROM recording "
                     "INNER JOIN show ON (recording.show_id = show.show_id) "
                     "INNER JOIN episode ON (recording.show_id = episode.show_id AND recording.episode_id = episode.episode_id) "
+                    "WHERE (EXISTS (SELECT 1 FROM file_raw_video WHERE file_raw_video.recording_id = recording.recording_id) "
+                    "  OR EXISTS (SELECT 1 FROM file_transcoded_video WHERE file_transcoded_video.recording_id = recording.recording_id)) "
+                    "AND (%(beforeDate)s::timestamptz IS NULL OR (recording.date_recorded, recording.recording_id) < (%(beforeDate)s, %(beforeID)s)) "
+                    "ORDER BY recording.date_recorded DESC, recording.recording_id DESC "
+                    "LIMIT %(limit)s;")
+        with self.dbPool.connection('recordings_by_date') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query, {'beforeDate': beforeDate, 'beforeID': beforeID, 'limit': limit})
+                for row in cursor:
+                    show = row[1].encode('ascii', 'xmlcharrefreplace').decode('ascii')           # compensate for Python's inability to cope with unicode
+                    episodeNumber = row[2].encode('ascii', 'xmlcharrefreplace').decode('ascii')  # compensate for Python's inability to cope with unicode
+                    episode = row[3].encode('ascii', 'xmlcharrefreplace').decode('ascii')        # compensate for Python's inability to cope with unicode
+                    dateRecorded = row[4].astimezone(localTimezone)
+                    recordings.append(Bunch(recordingID=row[0], show=show, episode=episode, episodeNumber=episodeNumber, dateRecorded=dateRecorded, duration=row[5]))
+        return recordings
+
+
+    # one page of the shows that have recordings, with the number of recordings for each, and the total number of shows
+    def dbGetShowsWithRecordings(self, offset, limit):
+        shows = []
+        totalCount = 0
+        query = str("SELECT show.show_id, show.name, count(*), count(*) OVER () "
+                    "FROM recording "
+                    "INNER JOIN show ON (recording.show_id = show.show_id) "
                     "WHERE recording.recording_id IN (SELECT recording_id FROM file_raw_video UNION SELECT recording_id FROM file_transcoded_video) "
+                    "GROUP BY show.show_id, show.name "
+                    "ORDER BY show.name, show.show_id "
+                    "LIMIT %s OFFSET %s;")
+        with self.dbPool.connection('recordings_by_show_page') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query, (limit, offset))
+                for row in cursor:
+                    name = row[1].encode('ascii', 'xmlcharrefreplace').decode('ascii')           # compensate for Python's inability to cope with unicode
+                    shows.append(Bunch(showID=row[0], name=name, numRecordings=row[2]))
+                    totalCount = row[3]
+        return shows, totalCount
+
+
+    def dbGetRecordingsForShow(self, showID):
+        recordings = []
+        localTimezone = tzlocal.get_localzone()
+        query = str("SELECT recording.recording_id, show.name, episode.episode_id, episode.title, recording.date_recorded, recording.duration "
+                    "FROM recording "
+                    "INNER JOIN show ON (recording.show_id = show.show_id) "
+                    "INNER JOIN episode ON (recording.show_id = episode.show_id AND recording.episode_id = episode.episode_id) "
+                    "WHERE recording.show_id = %s "
+                    "AND recording.recording_id IN (SELECT recording_id FROM file_raw_video UNION SELECT recording_id FROM file_transcoded_video) "
                     "ORDER BY date_recorded DESC;")
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute(query)
-            for row in cursor:
-                show = row[1].encode('ascii', 'xmlcharrefreplace').decode('ascii')           # compensate for Python's inability to cope with unicode
-                episodeNumber = row[2].encode('ascii', 'xmlcharrefreplace').decode('ascii')  # compensate for Python's inability to cope with unicode
-                episode = row[3].encode('ascii', 'xmlcharrefreplace').decode('ascii')        # compensate for Python's inability to cope with unicode
-                dateRecorded = row[4].astimezone(tzlocal.get_localzone())
-                recordings.append(Bunch(recordingID=row[0], show=show, episode=episode, episodeNumber=episodeNumber, dateRecorded=dateRecorded, duration=row[5]))
-        self.dbConnection.commit()
+        with self.dbPool.connection('recordings_for_show') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query, (showID, ))
+                for row in cursor:
+                    show = row[1].encode('ascii', 'xmlcharrefreplace').decode('ascii')           # compensate for Python's inability to cope with unicode
+                    episodeNumber = row[2].encode('ascii', 'xmlcharrefreplace').decode('ascii')  # compensate for Python's inability to cope with unicode
+                    episode = row[3].encode('ascii', 'xmlcharrefreplace').decode('ascii')        # compensate for Python's inability to cope with unicode
+                    dateRecorded = row[4].astimezone(localTimezone)
+                    recordings.append(Bunch(recordingID=row[0], show=show, episode=episode, episodeNumber=episodeNumber, dateRecorded=dateRecorded, duration=row[5]))
         return recordings
 
 
@@ -53,41 +153,39 @@ class UIServer:
                     "INNER JOIN episode ON (recording.show_id = episode.show_id AND recording.episode_id = episode.episode_id) "
                     "WHERE date_recorded > now() - interval '2 days' "
                     "ORDER BY date_recorded DESC;")
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute(query)
-            for row in cursor:
-                show = row[1].encode('ascii', 'xmlcharrefreplace').decode('ascii')           # compensate for Python's inability to cope with unicode
-                episodeNumber = row[2].encode('ascii', 'xmlcharrefreplace').decode('ascii')  # compensate for Python's inability to cope with unicode
-                episode = row[3].encode('ascii', 'xmlcharrefreplace').decode('ascii')        # compensate for Python's inability to cope with unicode
-                dateRecorded = row[4].astimezone(tzlocal.get_localzone())
-                recordings.append(Bunch(recordingID=row[0], show=show, episodeNumber=episodeNumber, episode=episode, dateRecorded=dateRecorded, duration=row[5]))
-        self.dbConnection.commit()
+        with self.dbPool.connection('recent_recordings') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query)
+                for row in cursor:
+                    show = row[1].encode('ascii', 'xmlcharrefreplace').decode('ascii')           # compensate for Python's inability to cope with unicode
+                    episodeNumber = row[2].encode('ascii', 'xmlcharrefreplace').decode('ascii')  # compensate for Python's inability to cope with unicode
+                    episode = row[3].encode('ascii', 'xmlcharrefreplace').decode('ascii')        # compensate for Python's inability to cope with unicode
+                    dateRecorded = row[4].astimezone(tzlocal.get_localzone())
+                    recordings.append(Bunch(recordingID=row[0], show=show, episodeNumber=episodeNumber, episode=episode, dateRecorded=dateRecorded, duration=row[5]))
         return recordings
 
 
     def dbGetUpcomingRecordings(self):
         schedules = []
-        query = str("SELECT DISTINCT ON (schedule.show_id, schedule.episode_id) "
-                    "schedule.schedule_id, schedule.start_time, schedule.channel_major, schedule.channel_minor,"
-                    "show.name, episode.episode_id, episode.title "
-                    "FROM schedule "
-                    "INNER JOIN subscription ON (schedule.show_id = subscription.show_id) "
-                    "INNER JOIN show ON (schedule.show_id = show.show_id) "
-                    "INNER JOIN episode ON (schedule.show_id = episode.show_id AND schedule.episode_id = episode.episode_id) "
-                    "WHERE schedule.start_time > now() "
-                    "AND (schedule.show_id, schedule.episode_id) NOT IN "
-                        "(SELECT recorded_episodes_by_id.show_id, recorded_episodes_by_id.episode_id FROM recorded_episodes_by_id) "
-                    "ORDER BY schedule.show_id, schedule.episode_id ")
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute(query)
-            for row in cursor:
-                startTime = row[1].astimezone(tzlocal.get_localzone())
-                channel = '{}.{}'.format(row[2], row[3])
-                show = row[4].encode('ascii', 'xmlcharrefreplace').decode('ascii')           # compensate for Python's inability to cope with unicode
-                episodeNumber = row[5].encode('ascii', 'xmlcharrefreplace').decode('ascii')  # compensate for Python's inability to cope with unicode
-                episode = row[6].encode('ascii', 'xmlcharrefreplace').decode('ascii')        # compensate for Python's inability to cope with unicode
-                schedules.append(Bunch(scheduleID=row[0], startTime=startTime, channel=channel, show=show, episodeNumber=episodeNumber, episode=episode))
-        self.dbConnection.commit()
+        query = str("SELECT DISTINCT ON (upcoming_recording.show_id, upcoming_recording.episode_id) "
+                    "upcoming_recording.schedule_id, upcoming_recording.start_time, upcoming_recording.channel_major, "
+                    "upcoming_recording.channel_minor, show.name, episode.episode_id, episode.title, upcoming_recording.show_id "
+                    "FROM upcoming_recording "
+                    "INNER JOIN show ON (upcoming_recording.show_id = show.show_id) "
+                    "INNER JOIN episode ON (upcoming_recording.show_id = episode.show_id AND upcoming_recording.episode_id = episode.episode_id) "
+                    "WHERE upcoming_recording.start_time > now() "
+                    "ORDER BY upcoming_recording.show_id, upcoming_recording.episode_id, upcoming_recording.start_time ")
+        with self.dbPool.connection('upcoming_recordings') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query)
+                for row in cursor:
+                    startTime = row[1].astimezone(tzlocal.get_localzone())
+                    channel = '{}.{}'.format(row[2], row[3])
+                    show = row[4].encode('ascii', 'xmlcharrefreplace').decode('ascii')           # compensate for Python's inability to cope with unicode
+                    episodeNumber = row[5].encode('ascii', 'xmlcharrefreplace').decode('ascii')  # compensate for Python's inability to cope with unicode
+                    episode = row[6].encode('ascii', 'xmlcharrefreplace').decode('ascii')        # compensate for Python's inability to cope with unicode
+                    schedules.append(Bunch(scheduleID=row[0], startTime=startTime, channel=channel, show=show, episodeNumber=episodeNumber, episode=episode,
+                                           showID=row[7]))
         schedules.sort(key=lambda schedule: schedule.startTime)
         return schedules
 
@@ -95,37 +193,51 @@ class UIServer:
     def dbGetShowList(self):
         subscribedShows = []
         unsubscribedShows = []
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute('SELECT show.show_id, show.name FROM show, subscription WHERE show.show_id = subscription.show_id order by show.name;')
-            for row in cursor:
-                showID = row[0]
-                showName = row[1].encode('ascii', 'xmlcharrefreplace').decode('ascii')  # compensate for Python's inability to cope with unicode
-                subscribedShows.append(Bunch(showID=showID, name=showName))
-            cursor.execute('SELECT show_id, name FROM show WHERE show_id NOT IN (SELECT show_id FROM subscription) order by name;')
-            for row in cursor:
-                showID = row[0]
-                showName = row[1].encode('ascii', 'xmlcharrefreplace').decode('ascii')  # compensate for Python's inability to cope with unicode
-                unsubscribedShows.append(Bunch(showID=showID, name=showName))
-        self.dbConnection.commit()
+        with self.dbPool.connection('show_list') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute('SELECT show.show_id, show.name, retention_rule.keep_count FROM show JOIN subscription USING (show_id) '
+                               'LEFT JOIN retention_rule USING (show_id) order by show.name;')
+                for row in cursor:
+                    showID = row[0]
+                    showName = row[1].encode('ascii', 'xmlcharrefreplace').decode('ascii')  # compensate for Python's inability to cope with unicode
+                    subscribedShows.append(Bunch(showID=showID, name=showName, keepCount=row[2]))
+                cursor.execute('SELECT show_id, name FROM show WHERE show_id NOT IN (SELECT show_id FROM subscription) order by name;')
+                for row in cursor:
+                    showID = row[0]
+                    showName = row[1].encode('ascii', 'xmlcharrefreplace').decode('ascii')  # compensate for Python's inability to cope with unicode
+                    unsubscribedShows.append(Bunch(showID=showID, name=showName))
         return Bunch(subscribed=subscribedShows, unsubscribed=unsubscribedShows)
 
 
     def dbSubscribe(self, showID):
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute('INSERT INTO subscription (show_id, priority) VALUES (%s, %s);', (showID, 0 ))
-        self.dbConnection.commit()
+        with self.dbPool.connection('subscribe') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute('INSERT INTO subscription (show_id, priority) VALUES (%s, %s);', (showID, 0 ))
 
 
     def dbUnsubscribe(self, showID):
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute('DELETE FROM subscription WHERE show_id = %s;', (showID, ))
-        self.dbConnection.commit()
+        with self.dbPool.connection('unsubscribe') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute('DELETE FROM subscription WHERE show_id = %s;', (showID, ))
+
+
+    # a 'keepCount' of None removes the show's retention rule
+    def dbSetKeepCount(self, showID, keepCount):
+        with self.dbPool.connection('set_keep_count') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                if keepCount is None:
+                    cursor.execute('DELETE FROM retention_rule WHERE show_id = %s;', (showID, ))
+                else:
+                    cursor.execute('INSERT INTO retention_rule (show_id, keep_count) VALUES (%s, %s) '
+                                   'ON CONFLICT (show_id) DO UPDATE SET keep_count = EXCLUDED.keep_count;', (showID, keepCount))
 
 
     def dbGetInconsistencies(self):
         recordingsWithoutFileRecords = []
         fileRecordsWithoutRecordings = []
         rawVideoFilesThatCanBeDeleted= []
+        filesWithoutFileRecords = []
+        fileRecordsWithoutFiles = []
         query = str('SELECT recording.recording_id, show.name, episode.title, date_recorded '
                     'FROM recording '
                     'JOIN show USING (show_id) '
@@ -134,33 +246,46 @@ class UIServer:
                     'LEFT JOIN file_transcoded_video ON (recording.recording_id = file_transcoded_video.recording_id) '
                     'WHERE file_raw_video.filename IS NULL '
                     'AND file_transcoded_video.filename IS NULL;')
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute(query)
-            for row in cursor:
-                showName = row[1].encode('ascii', 'xmlcharrefreplace').decode('ascii')     # compensate for Python's inability to cope with unicode
-                episodeName = row[2].encode('ascii', 'xmlcharrefreplace').decode('ascii')  # compensate for Python's inability to cope with unicode
-                dateRecorded = row[3].astimezone(tzlocal.get_localzone())
-                recordingsWithoutFileRecords.append(Bunch(recordingID=row[0], show=showName, episode=episodeName, dateRecorded=dateRecorded))
-        query = str('SELECT recording_id, file_raw_video.filename, file_transcoded_video.filename, file_bif.filename '
-                    'FROM file_raw_video '
-                    'FULL JOIN file_transcoded_video USING (recording_id) '
-                    'FULL JOIN file_bif USING (recording_id) '
-                    'WHERE recording_id NOT IN (SELECT recording_id FROM recording);')
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute(query)
-            for row in cursor:
-                fileRecordsWithoutRecordings.append(Bunch(recordingID=row[0], rawVideo=row[1], transcodedVideo=row[2], bif=row[3]))
-        query = str('SELECT recording_id, file_raw_video.filename, file_transcoded_video.filename '
+        with self.dbPool.connection('inconsistencies') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query)
+                for row in cursor:
+                    showName = row[1].encode('ascii', 'xmlcharrefreplace').decode('ascii')     # compensate for Python's inability to cope with unicode
+                    episodeName = row[2].encode('ascii', 'xmlcharrefreplace').decode('ascii')  # compensate for Python's inability to cope with unicode
+                    dateRecorded = row[3].astimezone(tzlocal.get_localzone())
+                    recordingsWithoutFileRecords.append(Bunch(recordingID=row[0], show=showName, episode=episodeName, dateRecorded=dateRecorded))
+            query = str('SELECT recording_id, file_raw_video.filename, file_transcoded_video.filename, file_bif.filename '
                         'FROM file_raw_video '
-                        'INNER JOIN file_transcoded_video USING (recording_id) '
-                        'WHERE file_transcoded_video.state = 0 '
-                        'ORDER BY file_raw_video.recording_id;')
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute(query)
-            for row in cursor:
-                rawVideoFilesThatCanBeDeleted.append(Bunch(recordingID=row[0], rawVideo=row[1], transcodedVideo=row[2]))
-        self.dbConnection.commit()
-        return Bunch(recordingsWithoutFileRecords=recordingsWithoutFileRecords, fileRecordsWithoutRecordings=fileRecordsWithoutRecordings, rawVideoFilesThatCanBeDeleted=rawVideoFilesThatCanBeDeleted)
+                        'FULL JOIN file_transcoded_video USING (recording_id) '
+                        'FULL JOIN file_bif USING (recording_id) '
+                        'WHERE recording_id NOT IN (SELECT recording_id FROM recording);')
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query)
+                for row in cursor:
+                    fileRecordsWithoutRecordings.append(Bunch(recordingID=row[0], rawVideo=row[1], transcodedVideo=row[2], bif=row[3]))
+            query = str('SELECT recording_id, file_raw_video.filename, file_transcoded_video.filename '
+                            'FROM file_raw_video '
+                            'INNER JOIN file_transcoded_video USING (recording_id) '
+                            'WHERE file_transcoded_video.state = 0 '
+                            'ORDER BY file_raw_video.recording_id;')
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query)
+                for row in cursor:
+                    rawVideoFilesThatCanBeDeleted.append(Bunch(recordingID=row[0], rawVideo=row[1], transcodedVideo=row[2]))
+        query = str("SELECT issue, filename, recording_id, size, detected "
+                        "FROM reconciliation_issue "
+                        "ORDER BY filename;")
+        with self.dbPool.connection('inconsistencies') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query)
+                for row in cursor:
+                    detected = row[4].astimezone(tzlocal.get_localzone())
+                    if row[0] == 'U':
+                        filesWithoutFileRecords.append(Bunch(filename=row[1], size=row[3], detected=detected))
+                    else:
+                        fileRecordsWithoutFiles.append(Bunch(filename=row[1], recordingID=row[2], detected=detected))
+        return Bunch(recordingsWithoutFileRecords=recordingsWithoutFileRecords, fileRecordsWithoutRecordings=fileRecordsWithoutRecordings, rawVideoFilesThatCanBeDeleted=rawVideoFilesThatCanBeDeleted,
+            filesWithoutFileRecords=filesWithoutFileRecords, fileRecordsWithoutFiles=fileRecordsWithoutFiles)
 
 
     def dbGetTranscodingFailures(self):
@@ -171,15 +296,15 @@ class UIServer:
                     'JOIN episode USING (show_id, episode_id) '
                     "WHERE recording.recording_id IN (SELECT recording_id FROM file_transcoded_video WHERE state = 1) "
                     "ORDER BY date_recorded DESC;")
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute(query)
-            for row in cursor:
-                show = row[1].encode('ascii', 'xmlcharrefreplace').decode('ascii')           # compensate for Python's inability to cope with unicode
-                episodeNumber = row[2].encode('ascii', 'xmlcharrefreplace').decode('ascii')  # compensate for Python's inability to cope with unicode
-                episode = row[3].encode('ascii', 'xmlcharrefreplace').decode('ascii')        # compensate for Python's inability to cope with unicode
-                dateRecorded = row[4].astimezone(tzlocal.get_localzone())
-                recordings.append(Bunch(recordingID=row[0], show=show, episode=episode, episodeNumber=episodeNumber, dateRecorded=dateRecorded))
-        self.dbConnection.commit()
+        with self.dbPool.connection('transcoding_failures') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query)
+                for row in cursor:
+                    show = row[1].encode('ascii', 'xmlcharrefreplace').decode('ascii')           # compensate for Python's inability to cope with unicode
+                    episodeNumber = row[2].encode('ascii', 'xmlcharrefreplace').decode('ascii')  # compensate for Python's inability to cope with unicode
+                    episode = row[3].encode('ascii', 'xmlcharrefreplace').decode('ascii')        # compensate for Python's inability to cope with unicode
+                    dateRecorded = row[4].astimezone(tzlocal.get_localzone())
+                    recordings.append(Bunch(recordingID=row[0], show=show, episode=episode, episodeNumber=episodeNumber, dateRecorded=dateRecorded))
         return recordings
 
 
@@ -192,66 +317,93 @@ class UIServer:
                     "WHERE recording.recording_id NOT IN (SELECT recording_id FROM file_transcoded_video) "
                     "AND recording.recording_id IN (SELECT recording_id FROM file_raw_video) "
                     "ORDER BY date_recorded DESC;")
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute(query)
-            for row in cursor:
-                show = row[1].encode('ascii', 'xmlcharrefreplace').decode('ascii')           # compensate for Python's inability to cope with unicode
-                episodeNumber = row[2].encode('ascii', 'xmlcharrefreplace').decode('ascii')  # compensate for Python's inability to cope with unicode
-                episode = row[3].encode('ascii', 'xmlcharrefreplace').decode('ascii')        # compensate for Python's inability to cope with unicode
-                dateRecorded = row[4].astimezone(tzlocal.get_localzone())
-                recordings.append(Bunch(recordingID=row[0], show=show, episode=episode, episodeNumber=episodeNumber, dateRecorded=dateRecorded, duration=row[5]))
-        self.dbConnection.commit()
+        with self.dbPool.connection('pending_transcoding_jobs') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query)
+                for row in cursor:
+                    show = row[1].encode('ascii', 'xmlcharrefreplace').decode('ascii')           # compensate for Python's inability to cope with unicode
+                    episodeNumber = row[2].encode('ascii', 'xmlcharrefreplace').decode('ascii')  # compensate for Python's inability to cope with unicode
+                    episode = row[3].encode('ascii', 'xmlcharrefreplace').decode('ascii')        # compensate for Python's inability to cope with unicode
+                    dateRecorded = row[4].astimezone(tzlocal.get_localzone())
+                    recordings.append(Bunch(recordingID=row[0], show=show, episode=episode, episodeNumber=episodeNumber, dateRecorded=dateRecorded, duration=row[5]))
         return recordings
 
 
+    def dbGetRunningTranscodeJobs(self):
+        jobs = {}
+        query = str("SELECT recording_id, profile, percent, fps, speed, start_time FROM transcode_job WHERE finish_time IS NULL;")
+        with self.dbPool.connection('running_transcode_jobs') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute(query)
+                for row in cursor:
+                    jobs[row[0]] = Bunch(recordingID=row[0], profile=row[1], percent=row[2], fps=row[3], speed=row[4], startTime=row[5])
+        return jobs
+
+
+    def dbGetTranscodeSpeeds(self):
+        speeds = {}
+        with self.dbPool.connection('transcode_speeds') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute("SELECT profile, jobs, speed, fps FROM transcode_speed;")
+                for row in cursor:
+                    speeds[row[0]] = Bunch(profile=row[0], jobs=row[1], speed=row[2], fps=row[3])
+        return speeds
+
+
     def dbGetNextScheduleID(self):
         scheduleID = None
-        with self.dbConnection.cursor() as cursor:
-            cursor.execute("SELECT nextval('schedule_schedule_id_seq');", ())
-            row = cursor.fetchone()
-            if row:
-                scheduleID = row[0]
-        self.dbConnection.commit()
+        with self.dbPool.connection('next_schedule_id') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                cursor.execute("SELECT nextval('schedule_schedule_id_seq');", ())
+                row = cursor.fetchone()
+                if row:
+                    scheduleID = row[0]
         return scheduleID
 
 
     def dbInsertTestShow(self):
-        with self.dbConnection.cursor() as cursor:
-            # is the 'test' show already present?
-            cursor.execute("SELECT show_id FROM show WHERE show_id = 'test';")
-            if cursor.fetchone() is not None:
-                return
-            # insert the 'test' show
-            cursor.execute("INSERT INTO show (show_id, show_type, name, imageurl) VALUES ('test','EP','Test Show',NULL);")
+        with self.dbPool.connection('insert_test_show') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                # is the 'test' show already present?
+                cursor.execute("SELECT show_id FROM show WHERE show_id = 'test';")
+                if cursor.fetchone() is not None:
+                    return
+                # insert the 'test' show
+                cursor.execute("INSERT INTO show (show_id, show_type, name, imageurl) VALUES ('test','EP','Test Show',NULL);")
 
 
     def dbScheduleTestRecording(self):
         self.dbInsertTestShow()
         uniqueID = self.dbGetNextScheduleID()
-        with self.dbConnection.cursor() as cursor:
-            query = str("INSERT INTO episode (show_id, episode_id, title, description, imageurl) "
-                        "VALUES ('test', %s, 'TrinTV Test Episode', 'This is a test episode for TrinTV', NULL);")
-            cursor.execute(query, (uniqueID, ))
-            query = str("INSERT INTO schedule (schedule_id, channel_major, channel_minor, start_time, duration, show_id, episode_id, rerun_code) "
-                        "VALUES (%s, '41', '1', now() + '30 seconds', '2 minutes', 'test', %s, 'R');")
-            cursor.execute(query, (uniqueID, uniqueID))
-        self.dbConnection.commit()
+        with self.dbPool.connection('schedule_test_recording') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                query = str("INSERT INTO episode (show_id, episode_id, title, description, imageurl) "
+                            "VALUES ('test', %s, 'TrinTV Test Episode', 'This is a test episode for TrinTV', NULL);")
+                cursor.execute(query, (uniqueID, ))
+                query = str("INSERT INTO schedule (schedule_id, channel_major, channel_minor, start_time, duration, show_id, episode_id, rerun_code) "
+                            "VALUES (%s, '41', '1', now() + '30 seconds', '2 minutes', 'test', %s, 'R');")
+                cursor.execute(query, (uniqueID, uniqueID))
 
 
     def dbDeleteFailedTranscode(self, recordingID):
-        with self.dbConnection.cursor() as cursor:
-            query = str("DELETE FROM file_transcoded_video WHERE recording_id = %s AND state = 1;")
-            cursor.execute(query, (recordingID, ))
-        self.dbConnection.commit()
+        with self.dbPool.connection('delete_failed_transcode') as dbConnection:
+            with dbConnection.cursor() as cursor:
+                query = str("DELETE FROM file_transcoded_video WHERE recording_id = %s AND state = 1;")
+                cursor.execute(query, (recordingID, ))
 
 
     def getIndex(self):
         return render_template('index.html')
 
 
-    def getRecordingsByDate(self):
-        recordings = self.dbGetAllRecordings()
-        return render_template('recordingsByDate.html', recordings=recordings)
+    # a page of recordings, after the one identified by 'pageKey' (or from the newest, if it's None); with 'rowsOnly',
+    # just the table rows, which the page appends to itself when "More" is clicked
+    def getRecordingsByDate(self, pageKey, limit, rowsOnly=False):
+        before = parsePageKey(pageKey) if pageKey else None
+        recordings = self.dbGetRecordingsByDate(before, limit + 1)
+        nextPageKey = makePageKey(recordings[limit - 1]) if len(recordings) > limit else None
+        template = 'recordingsByDateRows.html' if rowsOnly else 'recordingsByDate.html'
+        return render_template(template, recordings=recordings[:limit], nextPageKey=nextPageKey, limit=limit)
 
 
     def getRecentRecordings(self):
@@ -269,36 +421,47 @@ class UIServer:
         return render_template('showList.html', subscribedShows=shows.subscribed, unsubscribedShows=shows.unsubscribed)
 
 
+    # the recorder reschedules the show in the background, so these return without waiting for it
     def subscribe(self, showID):
         self.dbSubscribe(showID)
+        self.scheduleRecordingsCallback(showID)
 
 
     def unsubscribe(self, showID):
         self.dbUnsubscribe(showID)
+        self.scheduleRecordingsCallback(showID)
+
+
+    # the number of a show's most recent recordings to keep when space runs short (see retention.py); None for the default
+    def setKeepCount(self, showID, keepCount):
+        if keepCount is not None and keepCount < 0:
+            keepCount = 0
+        self.dbSetKeepCount(showID, keepCount)
 
 
     def getDatabaseInconsistencies(self):
         inconsistencies = self.dbGetInconsistencies()
         return render_template('databaseInconsistencies.html', recordingsWithoutFileRecords=inconsistencies.recordingsWithoutFileRecords,
-            fileRecordsWithoutRecordings=inconsistencies.fileRecordsWithoutRecordings, rawVideoFilesThatCanBeDeleted=inconsistencies.rawVideoFilesThatCanBeDeleted)
+            fileRecordsWithoutRecordings=inconsistencies.fileRecordsWithoutRecordings, rawVideoFilesThatCanBeDeleted=inconsistencies.rawVideoFilesThatCanBeDeleted,
+            filesWithoutFileRecords=inconsistencies.filesWithoutFileRecords, fileRecordsWithoutFiles=inconsistencies.fileRecordsWithoutFiles)
 
 
     def scheduleTestRecording(self):
         self.dbScheduleTestRecording()
-        self.scheduleRecordingsCallback()
+        self.scheduleRecordingsCallback('test')
 
 
-    def getRecordingsByShow(self):
-        allRecordings = self.dbGetAllRecordings()
-        showList = []
-        recordingsByShow = {}
-        for showName in set([x.show for x in allRecordings]):
-          recordings = [x for x in allRecordings if x.show == showName]
-          showData = Bunch(name=showName, numRecordings=len(recordings))
-          showList.append(showData)
-          recordingsByShow[showData] = recordings
-        showList = sorted(showList, key=lambda x: x.name)
-        return render_template('recordingsByShow.html', showList=showList, recordingsByShow=recordingsByShow)
+    # the grouping and counting are done by the database, a page of shows at a time; only the expanded show's
+    # recordings (if any) are fetched
+    def getRecordingsByShow(self, offset, limit, expandedShowID=None):
+        showList, totalShows = self.dbGetShowsWithRecordings(offset, limit)
+        expandedRecordings = []
+        if expandedShowID is not None:
+            expandedRecordings = self.dbGetRecordingsForShow(expandedShowID)
+        page = Bunch(offset=offset, limit=limit, total=totalShows,
+                     previousOffset=max(0, offset - limit) if offset > 0 else None,
+                     nextOffset=offset + limit if offset + limit < totalShows else None)
+        return render_template('recordingsByShow.html', showList=showList, expandedShowID=expandedShowID, expandedRecordings=expandedRecordings, page=page)
 
     def getTranscodingFailures(self):
         transcodingFailures = self.dbGetTranscodingFailures()
@@ -306,7 +469,31 @@ class UIServer:
 
     def getPendingTranscodingJobs(self):
         pendingTranscodingJobs = self.dbGetPendingTranscodingJobs()
-        return render_template('pendingTranscodingJobs.html', recordings=pendingTranscodingJobs)
+        runningJobs = self.dbGetRunningTranscodeJobs()
+        speeds = self.dbGetTranscodeSpeeds()
+        backlog = estimateTranscodeBacklog(pendingTranscodingJobs, speeds, runningJobs)
+        finishTime = None
+        if backlog is not None:
+            finishTime = datetime.datetime.now(tzlocal.get_localzone()) + backlog
+        return render_template('pendingTranscodingJobs.html', recordings=pendingTranscodingJobs, runningJobs=runningJobs,
+                               speeds=sorted(speeds.values(), key=lambda speed: speed.profile), backlog=backlog, finishTime=finishTime)
+
+    # returns a stream of Server-Sent Events (see statusFeed.py), or None if too many pages are following the feed
+    def getStatusEvents(self, lastEventID):
+        return self.statusFeed.stream(lastEventID)
+
+    # 'cacheStats' is a dictionary (cache name -> stats)
+    def getServerStatus(self, cacheStats):
+        poolStats = self.dbPool.getStats()
+        return render_template('serverStatus.html', poolStats=poolStats, cacheStats=sorted(cacheStats.items()))
+
+    def getQueryStats(self):
+        queryLog = self.dbPool.queryLog
+        return render_template('queryStats.html', queries=queryLog.getStats(), slowQueries=queryLog.getSlowQueries(),
+                               slowQueryThreshold=queryLog.slowQueryThreshold)
+
+    def resetQueryStats(self):
+        self.dbPool.queryLog.reset()
 
     def retryTranscode(self, recordingID):
         self.dbDeleteFailedTranscode(recordingID)
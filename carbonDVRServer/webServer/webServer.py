@@ -5,9 +5,52 @@ import logging
 import os
 import psycopg2
 import sys
+import time
+
+import metrics
 
 webServerApp = flask.Flask(__name__)
 
+MAX_PAGE_SIZE = 500
+SHOWS_PER_PAGE = 50
+RECORDINGS_PER_PAGE = 100
+STATUS_RETRY_SECONDS = 30
+
+
+REQUEST_SECONDS = metrics.Histogram('carbondvr_http_request_seconds', 'Time to handle web server requests, by route', ['endpoint', 'method'])
+RESPONSES = metrics.Counter('carbondvr_http_responses_total', 'Web server responses, by route and status', ['endpoint', 'status'])
+
+
+# every request is timed, by route (the name of its view function), for /metrics; for a streamed response (e.g.
+# /statusEvents), that's the time to start the response
+@webServerApp.before_request
+def startRequestTimer():
+    flask.g.requestStartTime = time.monotonic()
+
+@webServerApp.after_request
+def recordRequestTime(response):
+    endpoint = flask.request.endpoint or 'none'
+    REQUEST_SECONDS.labels(endpoint=endpoint, method=flask.request.method).observe(time.monotonic() - flask.g.requestStartTime)
+    RESPONSES.labels(endpoint=endpoint, status=response.status_code).inc()
+    return response
+
+
+# Roku feeds carry an ETag, so that the client can revalidate them with If-None-Match and get a 304
+def makeFeedResponse(feed):
+    response = flask.make_response(feed.xml)
+    response.set_etag(feed.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(flask.request)
+
+
+# episode lists can be fetched a page at a time, with ?offset=<n>&limit=<n>; without a limit, all episodes are returned
+def getPageArguments():
+    offset = max(0, flask.request.args.get('offset', 0, type=int))
+    limit = flask.request.args.get('limit', None, type=int)
+    if limit is not None:
+        limit = min(max(1, limit), MAX_PAGE_SIZE)
+    return offset, limit
+
 
 #
 # UI Server Endpoints
@@ -19,7 +62,13 @@ def getIndex():
 
 @webServerApp.route('/recordingsByDate')
 def getRecordingsByDate():
-    return flask.current_app.uiServer.getRecordingsByDate()
+    limit = getPageArguments()[1]
+    return flask.current_app.uiServer.getRecordingsByDate(flask.request.args.get('before'), limit or RECORDINGS_PER_PAGE)
+
+@webServerApp.route('/recordingsByDate/rows')
+def getRecordingsByDateRows():
+    limit = getPageArguments()[1]
+    return flask.current_app.uiServer.getRecordingsByDate(flask.request.args.get('before'), limit or RECORDINGS_PER_PAGE, rowsOnly=True)
 
 @webServerApp.route('/recentRecordings')
 def getRecentRecordings():
@@ -43,6 +92,12 @@ def unsubscribe(showID):
     flask.current_app.uiServer.unsubscribe(showID)
     return flask.redirect(flask.url_for('getShowList'))
 
+# ?keep=<n>; without it (or with an empty value), the show's keep count is removed, and the default applies
+@webServerApp.route('/setKeepCount/<showID>')
+def setKeepCount(showID):
+    flask.current_app.uiServer.setKeepCount(showID, flask.request.args.get('keep', None, type=int))
+    return flask.redirect(flask.url_for('getShowList'))
+
 @webServerApp.route('/databaseInconsistencies')
 def getDatabaseInconsistencies():
     return flask.current_app.uiServer.getDatabaseInconsistencies()
@@ -54,7 +109,8 @@ def scheduleTestRecording():
 
 @webServerApp.route('/recordingsByShow')
 def getRecordingsByShow():
-    return flask.current_app.uiServer.getRecordingsByShow()
+    offset, limit = getPageArguments()
+    return flask.current_app.uiServer.getRecordingsByShow(offset, limit or SHOWS_PER_PAGE, flask.request.args.get('show'))
 
 @webServerApp.route('/transcodingFailures')
 def getTranscodingFailures():
@@ -64,6 +120,40 @@ def getTranscodingFailures():
 def getPendingTranscodingJobs():
     return flask.current_app.uiServer.getPendingTranscodingJobs()
 
+@webServerApp.route('/serverStatus')
+def getServerStatus():
+    return flask.current_app.uiServer.getServerStatus(flask.current_app.restServer.getCacheStats())
+
+@webServerApp.route('/queryStats')
+def getQueryStats():
+    return flask.current_app.uiServer.getQueryStats()
+
+@webServerApp.route('/resetQueryStats')
+def resetQueryStats():
+    flask.current_app.uiServer.resetQueryStats()
+    return flask.redirect(flask.url_for('getQueryStats'))
+
+@webServerApp.route('/metrics')
+def getMetrics():
+    return flask.Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+# the admin pages follow this, to update themselves as recordings and transcodes progress; see statusFeed.py
+@webServerApp.route('/statusEvents')
+def getStatusEvents():
+    if flask.current_app.uiServer.statusFeed is None:
+        flask.abort(404)
+    lastEventID = flask.request.headers.get('Last-Event-ID', '')
+    events = flask.current_app.uiServer.getStatusEvents(int(lastEventID) if lastEventID.isdigit() else None)
+    if events is None:
+        # too many pages are following the feed, and holding the web server's threads
+        response = flask.Response('retry: {}\n\n'.format(STATUS_RETRY_SECONDS * 1000), status=503, mimetype='text/event-stream')
+        response.headers['Retry-After'] = str(STATUS_RETRY_SECONDS)
+        return response
+    response = flask.Response(events, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'       # tell a proxy (e.g. nginx) not to buffer the stream
+    return response
+
 @webServerApp.route('/retryTranscode/<recordingID>')
 def retryTranscode(recordingID):
     flask.current_app.uiServer.retryTranscode(recordingID)
@@ -72,7 +162,7 @@ def retryTranscode(recordingID):
 @webServerApp.route('/deleteRecordingFromRecordingsByShow/<recordingID>')
 def deleteRecordingFromRecordingsByShow(recordingID):
     flask.current_app.restServer.deleteRecording(recordingID)
-    return flask.redirect(flask.url_for('getRecordingsByShow'))
+    return flask.redirect(flask.url_for('getRecordingsByShow', **flask.request.args.to_dict()))     # back to the same page and show
 
 
 #
@@ -81,23 +171,26 @@ def deleteRecordingFromRecordingsByShow(recordingID):
 
 @webServerApp.route('/shows')
 def getAllShows():
-    return flask.current_app.restServer.getAllShows()
+    return makeFeedResponse(flask.current_app.restServer.getAllShows())
 
 @webServerApp.route('/shows/new')
 def getShowsWithNewEpisodes():
-    return flask.current_app.restServer.getShowsWithNewEpisodes()
+    return makeFeedResponse(flask.current_app.restServer.getShowsWithNewEpisodes())
 
 @webServerApp.route('/shows/<showID>/episodes/new')
 def getShowEpisodesNew(showID):
-    return flask.current_app.restServer.getShowEpisodesNew(showID)
+    offset, limit = getPageArguments()
+    return makeFeedResponse(flask.current_app.restServer.getShowEpisodesNew(showID, offset, limit))
 
 @webServerApp.route('/shows/<showID>/episodes/rerun')
 def getShowEpisodesRerun(showID):
-    return flask.current_app.restServer.getShowEpisodesRerun(showID)
+    offset, limit = getPageArguments()
+    return makeFeedResponse(flask.current_app.restServer.getShowEpisodesRerun(showID, offset, limit))
 
 @webServerApp.route('/shows/<showID>/episodes/archive')
 def getShowEpisodesArchive(showID):
-    return flask.current_app.restServer.getShowEpisodesArchive(showID)
+    offset, limit = getPageArguments()
+    return makeFeedResponse(flask.current_app.restServer.getShowEpisodesArchive(showID, offset, limit))
 
 @webServerApp.route('/recordings/<recordingID>')
 def getRecording(recordingID):